@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+from candle_store import CandleStore
+from ohlcv_fetcher import PAGE_LIMIT, TokenBucket, async_fetch_ohlcv_range, create_async_exchange, timeframe_ms
+
+# Candles per chunk (a few exchange pages) and chunks downloaded at the same time
+CHUNK_CANDLES = 5 * PAGE_LIMIT
+MAX_WORKERS = 4
+# Completed chunks are buffered and written to the store together
+FLUSH_CANDLES = 100_000
+PROGRESS_INTERVAL = 5.0
+
+def parse_time(value):
+    """Epoch ms from an ISO date/time (UTC) or a number of ms"""
+    if value is None:
+        return None
+    if str(value).isdigit():
+        return int(value)
+    return int(pd.Timestamp(value, tz='UTC').value // 1_000_000)
+
+def plan_chunks(since, until, timeframe, chunk_candles=CHUNK_CANDLES):
+    """Split [since, until) into bar-aligned (start, end) chunks of at most `chunk_candles` candles"""
+    step = timeframe_ms(timeframe)
+    start = -(-int(since) // step) * step
+    chunks = []
+    while start < until:
+        end = min(start + chunk_candles * step, int(until))
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+def checkpoint_path(store, exchange_id, symbol, timeframe):
+    """Checkpoint next to the candles it describes"""
+    return store.path(exchange_id, symbol, timeframe) + '.backfill.json'
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        print(f"Ignoring unreadable checkpoint {path}: {str(e)}")
+        return None
+
+def save_checkpoint(path, checkpoint):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def resume_from(checkpoint, since):
+    """Where a run over [since, ...) continues; chunks are written in order, so one timestamp suffices"""
+    if checkpoint is None or checkpoint.get('since') != since:
+        return since
+    return max(since, int(checkpoint['written_until']))
+
+class Progress:
+    """Chunk counter that prints chunks/sec and the estimated time remaining"""
+
+    def __init__(self, total, interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.done = 0
+        self.interval = interval
+        self.started = time.monotonic()
+        self.reported = self.started
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        rate = self.rate()
+        return (self.total - self.done) / rate if rate > 0 else None
+
+    def advance(self, chunks=1):
+        self.done += chunks
+        now = time.monotonic()
+        if now - self.reported >= self.interval or self.done == self.total:
+            self.reported = now
+            self.report()
+
+    def report(self):
+        eta = self.eta()
+        remaining = f"{eta:.0f}s" if eta is not None else 'unknown'
+        print(f"{self.done}/{self.total} chunks, {self.rate():.2f} chunks/s, ETA {remaining}")
+
+    def summary(self):
+        return {
+            'chunks': self.done,
+            'seconds': time.monotonic() - self.started,
+            'chunks_per_sec': self.rate()
+        }
+
+def pending_chunks(store, exchange_id, symbol, timeframe, since, until, chunk_candles=CHUNK_CANDLES):
+    """Chunks of [since, until) not yet written according to the market's checkpoint"""
+    checkpoint = load_checkpoint(checkpoint_path(store, exchange_id, symbol, timeframe))
+    return plan_chunks(resume_from(checkpoint, since), until, timeframe, chunk_candles)
+
+async def backfill_market(client, symbol, timeframe, since, until, chunks, store, limiter, workers, progress,
+                          flush_candles=FLUSH_CANDLES, window=MAX_WORKERS):
+    """Download `chunks` of one market, at most `window` at a time, and write them to the store in order"""
+    path = checkpoint_path(store, client.id, symbol, timeframe)
+
+    async def download(start, end):
+        async with workers:
+            # Closed history never changes, so it bypasses the response cache
+            rows = await async_fetch_ohlcv_range(client, symbol, timeframe, start, end, limiter=limiter, cache=False)
+        progress.advance()
+        return rows
+
+    # Chunks are started as earlier ones are written, so finished chunks waiting behind a slow one
+    # never exceed the window
+    queued = iter(chunks)
+    tasks = deque()
+
+    def refill():
+        while len(tasks) < window:
+            chunk = next(queued, None)
+            if chunk is None:
+                return
+            tasks.append((chunk[1], asyncio.ensure_future(download(*chunk))))
+
+    buffered, buffered_rows, written = [], 0, 0
+
+    def flush(written_until):
+        nonlocal buffered, buffered_rows, written
+        if buffered:
+            written += store.write(client.id, symbol, timeframe, np.concatenate(buffered))
+        # Only chunks that reached the store count as done
+        save_checkpoint(path, {
+            'exchange': client.id, 'symbol': symbol, 'timeframe': timeframe,
+            'since': since, 'until': until, 'written_until': written_until
+        })
+        buffered, buffered_rows = [], 0
+
+    try:
+        # Awaited in order while later chunks keep downloading, so the store grows front to back
+        refill()
+        while tasks:
+            end, task = tasks.popleft()
+            rows = await task
+            refill()
+            if len(rows):
+                buffered.append(rows)
+                buffered_rows += len(rows)
+            if buffered_rows >= flush_candles:
+                flush(end)
+        if chunks:
+            flush(chunks[-1][1])
+    finally:
+        for _, task in tasks:
+            task.cancel()
+    return written
+
+async def backfill(client, markets, since, until=None, store=None, workers=MAX_WORKERS,
+                   chunk_candles=CHUNK_CANDLES, flush_candles=FLUSH_CANDLES):
+    """Backfill (symbol, timeframe) markets of one exchange; returns candles written and throughput"""
+    store = store or CandleStore()
+    now = client.milliseconds()
+    until = min(until or now, now)
+    # One rate limiter for the exchange and one worker pool for all of its markets
+    limiter = TokenBucket.for_exchange(client)
+    semaphore = asyncio.Semaphore(workers)
+
+    await client.load_markets()
+    pending = []
+    for symbol, timeframe in markets:
+        # Closed candles only; the open one is left to the regular sync
+        market_until = min(until, now // timeframe_ms(timeframe) * timeframe_ms(timeframe))
+        pending.append((symbol, timeframe, market_until, pending_chunks(
+            store, client.id, symbol, timeframe, since, market_until, chunk_candles
+        )))
+    total = sum(len(chunks) for _, _, _, chunks in pending)
+    skipped = sum(
+        len(plan_chunks(since, market_until, timeframe, chunk_candles)) for _, timeframe, market_until, _ in pending
+    ) - total
+    if skipped:
+        print(f"Resuming: {skipped} chunks already in the store")
+    progress = Progress(total)
+
+    written = await asyncio.gather(*(
+        backfill_market(
+            client, symbol, timeframe, since, market_until, chunks, store, limiter, semaphore, progress,
+            flush_candles, workers
+        )
+        for symbol, timeframe, market_until, chunks in pending
+    ))
+    return dict(progress.summary(), candles=int(sum(written)), skipped_chunks=skipped)
+
+def create_client(exchange_id, latency=0.0):
+    """ccxt async client, or the offline fake exchange for `fake`"""
+    if exchange_id == 'fake':
+        from fake_exchange import AsyncFakeExchange
+        return AsyncFakeExchange(now=int(time.time() * 1000), latency=latency)
+    return create_async_exchange(exchange_id)
+
+async def run(args):
+    client = create_client(args.exchange, args.fake_latency)
+    try:
+        markets = [(symbol, timeframe) for symbol in args.symbol for timeframe in args.timeframe]
+        return await backfill(
+            client, markets, parse_time(args.start), parse_time(args.end), CandleStore(args.store_dir),
+            args.workers, args.chunk_candles, args.flush_candles
+        )
+    finally:
+        await client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Download historical candles into the local candle store; rerun to resume')
+    parser.add_argument('--exchange', default='kraken', help='ccxt exchange id, or "fake" for the offline test exchange')
+    parser.add_argument('--symbol', nargs='+', default=['BTC/USD'])
+    parser.add_argument('--timeframe', nargs='+', default=['1h'])
+    parser.add_argument('--start', required=True, help='First candle, ISO date (UTC) or epoch ms')
+    parser.add_argument('--end', help='End of the range (exclusive), default now')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Chunks downloaded at the same time')
+    parser.add_argument('--chunk-candles', type=int, default=CHUNK_CANDLES)
+    parser.add_argument('--flush-candles', type=int, default=FLUSH_CANDLES, help='Candles buffered before a store write')
+    parser.add_argument('--store-dir', help='Candle store directory (default: CANDLE_STORE_DIR)')
+    parser.add_argument('--fake-latency', type=float, default=0.0, help='Seconds per request of the fake exchange')
+
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args))))
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import synthetic_ohlcv
+
+def measure(label, unit, count, func, repeat=1, memory=True):
+    """Best wall time over `repeat` runs plus the traced allocation peak of one more run"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    elapsed = min(timings)
+    result = {
+        'case': label,
+        unit: count,
+        'seconds': elapsed,
+        f'{unit}_per_sec': count / elapsed if elapsed else None
+    }
+    if memory:
+        # Traced separately; tracemalloc slows the run it observes
+        tracemalloc.start()
+        func()
+        result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def strategy_cases(bars, timeframe, short_window, long_window, engine, repeat, memory):
+    from strategy import MovingAverageCrossover
+    from utils import calculate_metrics
+
+    data = synthetic_ohlcv(bars, timeframe)
+    strategy = MovingAverageCrossover(short_window, long_window, 10000, engine=engine)
+    signals, portfolio, trades = strategy.backtest(data)
+    results = [
+        measure('generate_signals', 'bars', bars, lambda: strategy.generate_signals(data), repeat, memory),
+        measure(f'backtest {engine}', 'bars', bars, lambda: strategy.backtest(data), repeat, memory),
+        measure('calculate_metrics', 'bars', bars, lambda: calculate_metrics(portfolio, trades, timeframe), repeat, memory)
+    ]
+    for result in results:
+        result['timeframe'] = timeframe
+    return results, trades, calculate_metrics(portfolio, trades, timeframe) | {
+        'portfolio_value': portfolio['portfolio_value'].iloc[-1]
+    }
+
+def save_performance_rows(db, metrics, dates, strategy):
+    from database import save_performance
+    for date in dates:
+        save_performance(db, metrics, date, strategy=strategy)
+
+def persistence_cases(trades, metrics, rows, memory):
+    # Imported here so DATABASE_URL can point at the benchmark database first
+    from database import save_trade, save_trades, session_scope
+
+    per_row = trades.iloc[:rows]
+    dates = pd.date_range('2020-01-01', periods=rows, freq='h')
+    with session_scope() as db:
+        # Each case writes under its own run key so repeated runs insert fresh rows
+        runs = iter(range(1000))
+        return [
+            measure('save_trade per row', 'rows', len(per_row), lambda: [
+                save_trade(db, trade.to_dict() | {'timestamp': timestamp})
+                for timestamp, trade in per_row.iterrows()
+            ], memory=memory),
+            measure('save_trades bulk', 'rows', len(trades), lambda: save_trades(
+                db, trades, f'bench-{next(runs)}'
+            ), memory=memory),
+            measure('save_performance per row', 'rows', rows, lambda: save_performance_rows(
+                db, metrics, dates, f'bench-{next(runs)}'
+            ), memory=memory)
+        ]
+
+def run(bar_counts, timeframe='1h', short_window=20, long_window=50, engine='vectorized',
+        persistence_rows=1000, repeat=3, memory=True):
+    results = []
+    trades, metrics = None, None
+    for bars in bar_counts:
+        cases, trades, metrics = strategy_cases(bars, timeframe, short_window, long_window, engine, repeat, memory)
+        results.extend(cases)
+    if persistence_rows and trades is not None:
+        # Trades of the largest backtest, so bulk writes see realistic volumes
+        results.extend(persistence_cases(trades, metrics, persistence_rows, memory))
+
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'parameters': {
+            'timeframe': timeframe,
+            'short_window': short_window,
+            'long_window': long_window,
+            'engine': engine,
+            'repeat': repeat
+        },
+        'results': results,
+        # ru_maxrss is reported in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark signals, backtest, metrics and persistence on synthetic candles')
+    parser.add_argument('--bars', type=int, nargs='+', default=[1000, 100000, 1000000], help='Candle counts to benchmark (up to 10M)')
+    parser.add_argument('--timeframe', default='1h', help='Timeframe of the synthetic candles')
+    parser.add_argument('--short-window', type=int, default=20)
+    parser.add_argument('--long-window', type=int, default=50)
+    parser.add_argument('--engine', default='vectorized', help='Backtest engine: vectorized or loop')
+    parser.add_argument('--persistence-rows', type=int, default=1000, help='Rows written one by one with save_trade and save_performance (0 to skip)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case, the fastest is reported')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced run that measures peak allocations')
+    parser.add_argument('--database-url', help='Database to use (default: fresh SQLite file)')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    args = parser.parse_args()
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    report = run(
+        args.bars, args.timeframe, args.short_window, args.long_window, args.engine,
+        args.persistence_rows, args.repeat, not args.no_memory
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import synthetic_ohlcv
+
+MODES = ('frames', 'compact', 'compact32')
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load_candles(path):
+    """Memory-mapped candles shaped like CandleStore.window(), so loading costs no copy"""
+    rows = np.load(path, mmap_mode='r')
+    index = pd.DatetimeIndex(rows[:, 0].astype(np.int64).astype('datetime64[ms]'), name='timestamp')
+    return rows, pd.DataFrame(rows[:, 1:], index=index, columns=['open', 'high', 'low', 'close', 'volume'], copy=False)
+
+def run_mode(path, mode, timeframe):
+    """Backtest plus metrics in this process; returns its peak RSS growth"""
+    from strategy import CompactCandles, MovingAverageCrossover
+    from utils import calculate_metrics, equity_metrics, periods_per_year
+
+    rows, data = load_candles(path)
+    strategy = MovingAverageCrossover(20, 50, 10000)
+    baseline = peak_rss_mb()
+    if mode == 'frames':
+        signals, portfolio, trades = strategy.backtest(data)
+        metrics = calculate_metrics(portfolio, trades, timeframe)
+    else:
+        dtype = np.float32 if mode == 'compact32' else np.float64
+        result = strategy.run(CompactCandles.from_rows(rows, dtype))
+        metrics = equity_metrics(result.portfolio_value, periods_per_year(timeframe), result.holdings > 0)
+        trades = result.trades_frame()
+    return {
+        'mode': mode,
+        'bars': len(rows),
+        'candles_mb': rows.nbytes / 2 ** 20,
+        'baseline_rss_mb': baseline,
+        'peak_rss_mb': peak_rss_mb(),
+        'pipeline_rss_mb': peak_rss_mb() - baseline,
+        'total_return': metrics['total_return'],
+        'trades': len(trades)
+    }
+
+def run(bars, timeframe='1h'):
+    """Each mode runs in a fresh interpreter so its peak RSS is not shared with the others"""
+    with tempfile.TemporaryDirectory() as directory:
+        data = synthetic_ohlcv(bars, timeframe)
+        rows = np.column_stack([data.index.as_unit('ms').asi8, data.to_numpy()])
+        path = os.path.join(directory, 'candles.npy')
+        np.save(path, rows)
+        del data, rows
+
+        results = []
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.memory', '--child', path, '--mode', mode, '--timeframe', timeframe],
+                stdout=subprocess.PIPE, text=True, check=True,
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            ).stdout
+            results.append(json.loads(output))
+
+    frames = results[0]['pipeline_rss_mb']
+    for result in results:
+        result['reduction'] = 1 - result['pipeline_rss_mb'] / frames if frames else None
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Peak RSS of the DataFrame and compact array backtest pipelines')
+    parser.add_argument('--bars', type=int, default=5000000, help='Synthetic candles to backtest')
+    parser.add_argument('--timeframe', default='1h')
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.mode, args.timeframe)))
+    else:
+        print(json.dumps(run(args.bars, args.timeframe), indent=2))
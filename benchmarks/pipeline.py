@@ -0,0 +1,79 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from benchmarks.hot_paths import git_commit
+
+PIPELINES = ('sequential', 'async')
+
+def slow_writes(engine, latency):
+    """Delay every statement by `latency` seconds, like a database across the network"""
+    from sqlalchemy import event
+
+    def delay(*args):
+        time.sleep(latency)
+    event.listen(engine, 'before_cursor_execute', delay)
+
+def run(markets=16, fetch_latency=0.05, write_latency=0.02, timeframe='1h', lookback_days=100, repeat=3):
+    """Wall time of lambda_handler per pipeline, against the fake exchange and a slowed-down SQLite database"""
+    # Imported here so the environment points at the benchmark directories first
+    import ohlcv_fetcher
+    from database import get_engine
+    from fake_exchange import AsyncFakeExchange
+    import lambda_handler
+
+    slow_writes(get_engine(), write_latency)
+    event = {'jobs': [{'exchange': 'fake', 'symbol': f"COIN{i}/USD"} for i in range(markets)]}
+    now = int(time.time() * 1000)
+
+    results = []
+    for pipeline in PIPELINES:
+        os.environ['HANDLER_PIPELINE'] = pipeline
+        timings = []
+        for _ in range(repeat):
+            # A fresh candle store and client every run, so each one fetches everything again
+            os.environ['CANDLE_STORE_DIR'] = tempfile.mkdtemp()
+            ohlcv_fetcher.main_loop()
+            ohlcv_fetcher._clients['fake'] = AsyncFakeExchange(now=now, latency=fetch_latency)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                response = lambda_handler.lambda_handler(event, None)
+                timings.append(time.perf_counter() - start)
+            if response['statusCode'] != 200:
+                raise RuntimeError(response['body'])
+        results.append({'pipeline': pipeline, 'markets': markets, 'seconds': min(timings)})
+
+    sequential = results[0]['seconds']
+    for result in results:
+        result['speedup'] = sequential / result['seconds']
+    return {
+        'commit': git_commit(),
+        'fetch_latency': fetch_latency,
+        'write_latency': write_latency,
+        'timeframe': timeframe,
+        'lookback_days': lookback_days,
+        'results': results
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Sequential vs async lambda_handler pipeline under simulated I/O latency')
+    parser.add_argument('--markets', type=int, default=16, help='Markets per invocation')
+    parser.add_argument('--fetch-latency', type=float, default=0.05, help='Seconds per exchange request')
+    parser.add_argument('--write-latency', type=float, default=0.02, help='Seconds per database statement')
+    parser.add_argument('--timeframe', default='1h')
+    parser.add_argument('--lookback-days', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{directory}/bench.db"
+    os.environ['RESPONSE_CACHE'] = 'off'
+    os.environ['STRATEGY_STATE_DIR'] = os.path.join(directory, 'state')
+    os.environ['TRADING_TIMEFRAME'] = args.timeframe
+    os.environ['LOOKBACK_PERIOD'] = str(args.lookback_days)
+    print(json.dumps(run(
+        args.markets, args.fetch_latency, args.write_latency, args.timeframe, args.lookback_days, args.repeat
+    ), indent=2))
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from ohlcv_fetcher import timeframe_ms
+from utils import SECONDS_PER_YEAR
+
+def synthetic_ohlcv(bars, timeframe='1h', seed=0, start='2020-01-01', price=30000.0, drift=0.05, volatility=0.6):
+    """Deterministic OHLCV candles following a geometric Brownian motion
+
+    `drift` and `volatility` are annualized; the same seed always yields the same candles.
+    """
+    rng = np.random.default_rng(seed)
+    step = timeframe_ms(timeframe)
+    dt = step / 1000 / SECONDS_PER_YEAR
+
+    # Log returns of the close; the open is the previous close
+    log_returns = rng.standard_normal(bars)
+    log_returns *= volatility * np.sqrt(dt)
+    log_returns += (drift - volatility ** 2 / 2) * dt
+    close = price * np.exp(np.cumsum(log_returns))
+    open_ = np.empty(bars)
+    open_[0] = price
+    open_[1:] = close[:-1]
+
+    # Wicks extend beyond the body by a half-normal fraction of the bar volatility
+    wick = volatility * np.sqrt(dt)
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.standard_normal(bars)) * wick / 2)
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.standard_normal(bars)) * wick / 2)
+    volume = rng.lognormal(mean=3.0, sigma=0.5, size=bars)
+
+    start_ms = pd.Timestamp(start).value // 1_000_000
+    # Millisecond resolution keeps 10M coarse bars inside the representable range
+    timestamps = (start_ms + np.arange(bars, dtype=np.int64) * step).astype('datetime64[ms]')
+    index = pd.DatetimeIndex(timestamps, name='timestamp')
+    return pd.DataFrame(
+        {'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume},
+        index=index
+    )
+
+def synthetic_ticks(ticks, seed=0, start='2020-01-01', price=30000.0, volatility=0.6, rate=20.0, chunk=1_000_000):
+    """Yield (timestamps, prices, sizes) chunks of trade prints with Poisson arrivals, `rate` per second"""
+    rng = np.random.default_rng(seed)
+    timestamp = float(pd.Timestamp(start).value // 1_000_000)
+    log_price = np.log(price)
+    for offset in range(0, ticks, chunk):
+        count = min(chunk, ticks - offset)
+        gaps = rng.exponential(1000.0 / rate, count)
+        times = timestamp + np.cumsum(gaps)
+        # Random walk whose variance grows with the elapsed time, as for the candles
+        steps = rng.standard_normal(count) * volatility * np.sqrt(gaps / 1000 / SECONDS_PER_YEAR)
+        log_prices = log_price + np.cumsum(steps)
+        timestamp, log_price = times[-1], log_prices[-1]
+        yield times.astype(np.int64), np.exp(log_prices), rng.lognormal(mean=-3.0, sigma=1.0, size=count)
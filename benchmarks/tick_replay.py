@@ -0,0 +1,46 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from benchmarks.hot_paths import git_commit
+from benchmarks.synthetic import synthetic_ticks
+from tick_replay import CHUNK_TICKS, read_ticks, replay, write_ticks
+
+# Bar settings per bar type; 20 synthetic prints per second of about 0.08 BTC each
+BARS = {'time': '5m', 'volume': 500.0, 'dollar': 15_000_000.0}
+
+def run(sizes, suffix='.ticks.gz', chunk_ticks=CHUNK_TICKS, short_window=20, long_window=50):
+    """Ticks/sec and peak RSS per bar type for growing recordings; a flat peak means bounded memory"""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for ticks in sorted(sizes):
+            path = os.path.join(directory, f"{ticks}{suffix}")
+            start = time.perf_counter()
+            write_ticks(path, synthetic_ticks(ticks, chunk=chunk_ticks))
+            recorded = time.perf_counter() - start
+            for bar_type, size in BARS.items():
+                result = replay(read_ticks(path, chunk_ticks), bar_type, size, short_window, long_window, 10000)
+                results.append({
+                    'ticks': result['ticks'],
+                    'recording_mb': os.path.getsize(path) / 2 ** 20,
+                    'record_seconds': recorded,
+                    'bar_type': bar_type,
+                    'bar_size': size,
+                    'bars': result['bars'],
+                    'trades': len(result['trades']),
+                    'seconds': result['seconds'],
+                    'ticks_per_sec': result['ticks_per_sec'],
+                    'peak_rss_mb': result['peak_rss_mb']
+                })
+            os.remove(path)
+    return {'commit': git_commit(), 'format': suffix, 'chunk_ticks': chunk_ticks, 'results': results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tick replay throughput and memory on synthetic trade prints')
+    parser.add_argument('--ticks', type=int, nargs='+', default=[1000000, 10000000], help='Recording sizes, replayed in increasing order')
+    parser.add_argument('--format', default='.ticks.gz', help='Recording suffix, e.g. .ticks, .ticks.gz, .ticks.xz')
+    parser.add_argument('--chunk-ticks', type=int, default=CHUNK_TICKS)
+
+    args = parser.parse_args()
+    print(json.dumps(run(args.ticks, args.format, args.chunk_ticks), indent=2))
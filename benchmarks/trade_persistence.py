@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+def synthetic_trades(count, seed=0):
+    """Alternating BUY/SELL trades on hourly timestamps, shaped like backtest output"""
+    rng = np.random.default_rng(seed)
+    price = 30000 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    amount = 10000 / price
+    trades = pd.DataFrame({
+        'timestamp': pd.date_range('2020-01-01', periods=count, freq='h'),
+        'type': np.where(np.arange(count) % 2 == 0, 'BUY', 'SELL'),
+        'price': price,
+        'amount': amount,
+        'value': price * amount
+    })
+    return trades.set_index('timestamp')
+
+def timed(label, rows, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    return {'case': label, 'rows': rows, 'seconds': elapsed, 'rows_per_sec': rows / elapsed if elapsed else None}
+
+def run(rows, per_row_rows):
+    # Imported here so DATABASE_URL can point at the stand-in database first
+    from database import Trade, save_trade, save_trades, session_scope
+
+    trades = synthetic_trades(rows)
+    with session_scope() as db:
+        results = []
+        per_row = trades.iloc[:per_row_rows]
+        cases = [
+            ('save_trade per row', len(per_row), lambda: [
+                save_trade(db, trade.to_dict() | {'timestamp': timestamp})
+                for timestamp, trade in per_row.iterrows()
+            ]),
+            ('save_trades first run', rows, lambda: save_trades(db, trades, 'bench')),
+            # Replaying the same backtest must not add rows
+            ('save_trades re-run', rows, lambda: save_trades(db, trades, 'bench'))
+        ]
+        for label, count, func in cases:
+            result = timed(label, count, func)
+            result['table_rows'] = db.query(Trade).count()
+            results.append(result)
+        return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark per-row vs bulk trade persistence')
+    parser.add_argument('--rows', type=int, default=20000, help='Trades written by save_trades')
+    parser.add_argument('--per-row-rows', type=int, default=2000, help='Trades written one by one with save_trade')
+    parser.add_argument('--database-url', help='Database to use (default: fresh SQLite file)')
+
+    args = parser.parse_args()
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    print(json.dumps(run(args.rows, args.per_row_rows), indent=2))
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from ohlcv_fetcher import async_fetch_ohlcv_range, fetch_ohlcv_range, timeframe_ms
+
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+# Each candle is stored as six little-endian float64 values (timestamp in ms first)
+ROW_DTYPE = np.dtype('<f8')
+ROW_WIDTH = len(OHLCV_COLUMNS)
+ROW_BYTES = ROW_WIDTH * ROW_DTYPE.itemsize
+
+def default_store_dir():
+    """Store location; /tmp survives between warm Lambda invocations"""
+    return os.getenv('CANDLE_STORE_DIR', os.path.join(tempfile.gettempdir(), 'candles'))
+
+def to_rows(ohlcv):
+    """Convert a fetch_ohlcv result into a sorted, de-duplicated (n, 6) array"""
+    rows = np.asarray(ohlcv, dtype=float).reshape(-1, ROW_WIDTH)
+    if len(rows) == 0:
+        return rows
+    # Keep the last copy of every timestamp so later (fresher) bars win
+    reversed_ts = rows[::-1, 0]
+    _, first_in_reversed = np.unique(reversed_ts, return_index=True)
+    return rows[len(rows) - 1 - first_in_reversed]
+
+class CandleStore:
+    """Append-only OHLCV files per (exchange, symbol, timeframe), read through memory maps"""
+
+    def __init__(self, root=None):
+        self.root = root or default_store_dir()
+
+    def path(self, exchange_id, symbol, timeframe):
+        name = f"{symbol.replace('/', '-')}_{timeframe}.f8"
+        return os.path.join(self.root, exchange_id, name)
+
+    def read(self, exchange_id, symbol, timeframe):
+        """Memory-mapped (n, 6) view of every stored candle"""
+        path = self.path(exchange_id, symbol, timeframe)
+        if not os.path.exists(path) or os.path.getsize(path) < ROW_BYTES:
+            return np.empty((0, ROW_WIDTH), dtype=ROW_DTYPE)
+        rows = os.path.getsize(path) // ROW_BYTES
+        return np.memmap(path, dtype=ROW_DTYPE, mode='r', shape=(rows, ROW_WIDTH))
+
+    def timeframes(self, exchange_id, symbol):
+        """Timeframes stored for a market"""
+        prefix = f"{symbol.replace('/', '-')}_"
+        try:
+            names = os.listdir(os.path.join(self.root, exchange_id))
+        except FileNotFoundError:
+            return []
+        return [
+            name[len(prefix):-len('.f8')] for name in names
+            if name.startswith(prefix) and name.endswith('.f8') and '_' not in name[len(prefix):]
+        ]
+
+    def last_timestamp(self, exchange_id, symbol, timeframe):
+        stored = self.read(exchange_id, symbol, timeframe)
+        return int(stored[-1, 0]) if len(stored) else None
+
+    def write(self, exchange_id, symbol, timeframe, ohlcv):
+        """Merge candles into the store; bars with an existing timestamp are overwritten"""
+        rows = to_rows(ohlcv)
+        if len(rows) == 0:
+            return 0
+
+        path = self.path(exchange_id, symbol, timeframe)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stored = self.read(exchange_id, symbol, timeframe)
+        cut = int(np.searchsorted(stored[:, 0], rows[0, 0])) if len(stored) else 0
+
+        if len(stored) and cut > 0 and cut + len(rows) >= len(stored) and rows[-1, 0] >= stored[-1, 0]:
+            # Common case: overwrite the still-open tail bar in place and append the rest.
+            # The file only grows, so existing memory maps stay valid.
+            with open(path, 'r+b') as f:
+                f.seek(cut * ROW_BYTES)
+                f.write(rows.astype(ROW_DTYPE).tobytes())
+        else:
+            # New data starts before the stored range, ends before its tail or would shrink it: rewrite atomically
+            tail = stored[stored[:, 0] > rows[-1, 0]] if len(stored) else stored
+            merged = np.concatenate((stored[:cut], rows, tail)).astype(ROW_DTYPE)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            merged.tofile(tmp_path)
+            os.replace(tmp_path, path)
+        return len(rows)
+
+    def window(self, exchange_id, symbol, timeframe, since, until=None):
+        """DataFrame over the stored candles in [since, until) without copying the prices"""
+        stored = self.read(exchange_id, symbol, timeframe)
+        timestamps = stored[:, 0]
+        start = int(np.searchsorted(timestamps, since)) if since is not None else 0
+        end = int(np.searchsorted(timestamps, until)) if until is not None else len(stored)
+        view = stored[start:end]
+
+        index = pd.DatetimeIndex(
+            pd.to_datetime(view[:, 0].astype(np.int64), unit='ms'),
+            name='timestamp'
+        )
+        return pd.DataFrame(view[:, 1:], index=index, columns=OHLCV_COLUMNS[1:], copy=False)
+
+    def sync_cursor(self, exchange_id, symbol, timeframe, since):
+        """Timestamp the next fetch has to start from for the store to cover [since, now]"""
+        stored = self.read(exchange_id, symbol, timeframe)
+        if len(stored) and stored[0, 0] < since + timeframe_ms(timeframe):
+            # Start at the last stored bar: it may still have been open when it was saved
+            return int(stored[-1, 0])
+        return int(since)
+
+    def sync(self, exchange, symbol, timeframe, since):
+        """Fetch only candles newer than the stored ones and return how many were written"""
+        exchange_id = exchange if isinstance(exchange, str) else exchange.id
+        cursor = self.sync_cursor(exchange_id, symbol, timeframe, since)
+        rows = fetch_ohlcv_range(exchange, symbol, timeframe, cursor)
+        return self.write(exchange_id, symbol, timeframe, rows)
+
+    async def async_sync(self, exchange, symbol, timeframe, since, **options):
+        """sync() for an async client, e.g. when several markets are fetched concurrently"""
+        cursor = self.sync_cursor(exchange.id, symbol, timeframe, since)
+        rows = await async_fetch_ohlcv_range(exchange, symbol, timeframe, cursor, **options)
+        return self.write(exchange.id, symbol, timeframe, rows)
+
+def load_ohlcv(exchange, symbol, timeframe, since, store=None):
+    """Bring the local store up to date and return candles from `since` onwards"""
+    store = store or CandleStore()
+    store.sync(exchange, symbol, timeframe, since)
+    exchange_id = exchange if isinstance(exchange, str) else exchange.id
+    return store.window(exchange_id, symbol, timeframe, since)
+
+async def async_load_ohlcv(exchange, symbol, timeframe, since, store=None, **options):
+    """load_ohlcv() for an async client"""
+    store = store or CandleStore()
+    await store.async_sync(exchange, symbol, timeframe, since, **options)
+    return store.window(exchange.id, symbol, timeframe, since)
@@ -1,19 +1,39 @@
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, MetaData, Table
+from sqlalchemy import create_engine, inspect, text, Column, Integer, Float, String, Text, DateTime, LargeBinary, Index, MetaData, Table
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import asyncio
+import contextvars
+import functools
 import os
+import json
+import zlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
 
 # Get database URL from environment variable
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Bound to the engine on first use, see get_engine()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+_engine = None
+_async_engine = None
+
+# Async drivers per dialect; both are optional, see get_async_engine()
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'postgres': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
 class Trade(Base):
     __tablename__ = "trades"
+    __table_args__ = (
+        # Natural key used by save_trades to make replayed backtests idempotent
+        Index('uq_trades_natural_key', 'timestamp', 'type', 'strategy', unique=True),
+        # Time-range reads of one run; plain timestamp ranges use the natural key
+        Index('ix_trades_strategy_timestamp', 'strategy', 'timestamp'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
@@ -21,17 +41,49 @@ class Trade(Base):
     price = Column(Float)
     amount = Column(Float)
     value = Column(Float)
+    strategy = Column(String)  # Run identity, see strategy.run_key
 
 class Performance(Base):
     __tablename__ = "performance"
+    __table_args__ = (
+        # Several markets can report at the same time, so dates are unique per run
+        Index('uq_performance_run', 'date', 'strategy', unique=True),
+        Index('ix_performance_strategy_date', 'strategy', 'date'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    date = Column(DateTime, unique=True, index=True)
+    date = Column(DateTime, index=True)
     portfolio_value = Column(Float)
     daily_return = Column(Float)
     total_return = Column(Float)
     sharpe_ratio = Column(Float)
     max_drawdown = Column(Float)
+    strategy = Column(String)  # Run identity, see strategy.run_key
+
+class PerformanceState(Base):
+    __tablename__ = "performance_state"
+
+    id = Column(Integer, primary_key=True, index=True)
+    strategy = Column(String, unique=True, index=True)  # Run identity, see strategy.run_key
+    points = Column(Integer)
+    state = Column(Text)  # JSON snapshot of utils.MetricsAccumulator
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class EquityCurve(Base):
+    __tablename__ = "equity_curves"
+    __table_args__ = (
+        # Curves of one run overlapping a time range
+        Index('ix_equity_curves_strategy_end', 'strategy', 'end'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    performance_id = Column(Integer, index=True)  # Performance row of the run
+    strategy = Column(String)
+    start = Column(DateTime)
+    end = Column(DateTime)
+    points = Column(Integer)
+    encoding = Column(String)  # See encode_curve
+    data = Column(LargeBinary)
 
 class Settings(Base):
     __tablename__ = "settings"
@@ -43,17 +95,138 @@ class Settings(Base):
     timeframe = Column(String)
     lookback_period = Column(Integer)
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
+class StrategyState(Base):
+    __tablename__ = "strategy_state"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True, index=True)  # exchange:symbol:timeframe:parameters
+    state = Column(Text)  # JSON snapshot of incremental.CrossoverState
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+def upgrade_schema(bind):
+    """Add columns and adjust indexes introduced after the tables were first created"""
+    inspector = inspect(bind)
+    for table in (Trade.__table__, Performance.__table__):
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=bind.dialect)
+                with bind.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+        existing_indexes = {index['name']: index for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            current = existing_indexes.get(index.name)
+            if current is not None and bool(current['unique']) != bool(index.unique):
+                # e.g. performance.date used to be unique on its own
+                index.drop(bind=bind)
+                current = None
+            if current is None:
+                index.create(bind=bind)
+
+def init_db(bind=None):
+    """Create all tables and apply schema upgrades"""
+    bind = bind or get_engine()
+    Base.metadata.create_all(bind=bind)
+    upgrade_schema(bind)
+
+def engine_options():
+    """Pool settings; a Lambda container serves one invocation at a time"""
+    if os.getenv('AWS_LAMBDA_FUNCTION_NAME'):
+        # One pooled connection reused by warm invocations; recycled before
+        # idle timeouts and checked after the container was frozen
+        return {'pool_size': 1, 'max_overflow': 0, 'pool_recycle': 300, 'pool_pre_ping': True}
+    return {}
+
+def get_engine():
+    """Create the SQLAlchemy engine on first use and reuse it for the life of the process"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DATABASE_URL, **engine_options())
+        SessionLocal.configure(bind=_engine)
+        # Set SCHEMA_INIT=skip once the schema exists (e.g. after `python database.py`)
+        if os.getenv('SCHEMA_INIT', 'auto') != 'skip':
+            init_db(_engine)
+    return _engine
+
+def async_database_url(url):
+    """DATABASE_URL with its driver swapped for the dialect's async driver"""
+    scheme, rest = url.split('://', 1)
+    return f"{ASYNC_DRIVERS[scheme.split('+')[0]]}://{rest}"
+
+def get_async_engine():
+    """Async engine for DATABASE_URL, or None when no async driver is installed for it"""
+    global _async_engine
+    if _async_engine is None:
+        # The schema is created and upgraded through the synchronous engine
+        get_engine()
+        try:
+            from sqlalchemy.ext.asyncio import create_async_engine
+            _async_engine = create_async_engine(async_database_url(DATABASE_URL), **engine_options())
+        except (ImportError, KeyError) as e:
+            print(f"No async database driver ({str(e)}), writing from a worker thread")
+            _async_engine = False
+    return _async_engine or None
+
+class ThreadedSession:
+    """AsyncSession stand-in that runs a synchronous session on one dedicated thread"""
+
+    def __init__(self):
+        get_engine()
+        # One thread, because a Session must not be used by two threads at once
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self.session = SessionLocal()
+
+    async def run_sync(self, fn, *args, **kwargs):
+        call = functools.partial(contextvars.copy_context().run, fn, self.session, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def rollback(self):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.session.rollback)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.session.close)
+        self.executor.shutdown(wait=False)
+
+@asynccontextmanager
+async def async_session_scope():
+    """Async session on the async driver, or a ThreadedSession; use run_sync() with the save_* helpers"""
+    engine = get_async_engine()
+    if engine is not None:
+        from sqlalchemy.ext.asyncio import AsyncSession
+        db = AsyncSession(engine, autoflush=False, expire_on_commit=False)
+    else:
+        db = ThreadedSession()
+    try:
+        yield db
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        await db.close()
 
 def get_db():
     """Get database session"""
+    get_engine()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+@contextmanager
+def session_scope():
+    """Session for one unit of work, rolled back on error and always closed"""
+    get_engine()
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 def save_trade(db, trade_data):
     """Save trade to database"""
     # Convert pandas Timestamp to datetime if necessary
@@ -72,8 +245,98 @@ def save_trade(db, trade_data):
     db.commit()
     return trade
 
-def save_performance(db, metrics, date):
-    """Save daily performance metrics"""
+def _trade_rows(trades, strategy):
+    """Normalize a trades DataFrame (indexed by timestamp) or list of dicts into insert rows"""
+    records = trades.reset_index().to_dict('records') if hasattr(trades, 'reset_index') else trades
+    rows = {}
+    for trade in records:
+        timestamp = trade.get('timestamp', datetime.utcnow())
+        if hasattr(timestamp, 'to_pydatetime'):
+            timestamp = timestamp.to_pydatetime()
+        # A repeated natural key within one batch keeps its last occurrence
+        rows[(timestamp, trade['type'])] = {
+            'timestamp': timestamp,
+            'type': trade['type'],
+            'price': float(trade['price']),
+            'amount': float(trade['amount']),
+            'value': float(trade['value']),
+            'strategy': strategy
+        }
+    return list(rows.values())
+
+def save_trades(db, trades, strategy, commit=True):
+    """Upsert a batch of trades, keyed on (timestamp, type, strategy); commit=False leaves the commit to the caller"""
+    rows = _trade_rows(trades, strategy)
+    if not rows:
+        return 0
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(Trade.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['timestamp', 'type', 'strategy'],
+            set_={
+                'price': stmt.excluded.price,
+                'amount': stmt.excluded.amount,
+                'value': stmt.excluded.value
+            }
+        )
+        # Executed as batched multi-row INSERT statements
+        db.execute(stmt, rows)
+    else:
+        # Portable fallback: update the keys already stored, bulk insert the rest
+        existing = {
+            (trade.timestamp, trade.type): trade
+            for trade in db.query(Trade).filter(
+                Trade.strategy == strategy,
+                Trade.timestamp >= min(row['timestamp'] for row in rows),
+                Trade.timestamp <= max(row['timestamp'] for row in rows)
+            )
+        }
+        new_rows = []
+        for row in rows:
+            trade = existing.get((row['timestamp'], row['type']))
+            if trade is None:
+                new_rows.append(row)
+            else:
+                trade.price, trade.amount, trade.value = row['price'], row['amount'], row['value']
+        if new_rows:
+            db.execute(Trade.__table__.insert(), new_rows)
+
+    if commit:
+        db.commit()
+    return len(rows)
+
+def delete_trades(db, strategy, since=None):
+    """Delete a run's stored trades, from `since` on if given; committed by the caller"""
+    query = db.query(Trade).filter(Trade.strategy == strategy)
+    if since is not None:
+        query = query.filter(Trade.timestamp >= since)
+    return query.delete(synchronize_session=False)
+
+CURVE_ENCODING = 'delta-shuffle-zlib-1'
+
+def encode_curve(timestamps, values):
+    """Pack int64 ms timestamps and float64 values into one compressed blob"""
+    timestamps = np.asarray(timestamps, dtype='<i8')
+    values = np.asarray(values, dtype='<f8')
+    # A constant candle step delta-encodes to a run of equal values
+    deltas = np.diff(timestamps, prepend=np.int64(0))
+    # Byte-shuffled floats put sign/exponent bytes next to each other for zlib
+    shuffled = values.view(np.uint8).reshape(-1, 8).T
+    return zlib.compress(deltas.tobytes() + shuffled.tobytes(), 6)
+
+def decode_curve(data, points):
+    """Inverse of encode_curve; returns (timestamps in ms, values)"""
+    raw = zlib.decompress(data)
+    timestamps = np.cumsum(np.frombuffer(raw, dtype='<i8', count=points))
+    shuffled = np.frombuffer(raw, dtype=np.uint8, offset=points * 8).reshape(8, points)
+    values = np.ascontiguousarray(shuffled.T).view('<f8').ravel()
+    return timestamps, values
+
+def save_performance(db, metrics, date, strategy=None, equity=None, commit=True):
+    """Save daily performance metrics, plus the run's equity curve if given as a Series"""
     # Convert pandas Timestamp to datetime if necessary
     if hasattr(date, 'to_pydatetime'):
         date = date.to_pydatetime()
@@ -84,14 +347,39 @@ def save_performance(db, metrics, date):
         daily_return=float(metrics.get('daily_return', 0)),
         total_return=float(metrics['total_return']),
         sharpe_ratio=float(metrics['sharpe_ratio']),
-        max_drawdown=float(metrics['max_drawdown'])
+        max_drawdown=float(metrics['max_drawdown']),
+        strategy=strategy
     )
     db.add(performance)
-    db.commit()
+    if equity is not None and len(equity):
+        # The curve references the run record, so its id is needed first
+        db.flush()
+        timestamps = equity.index.as_unit('ms').asi8
+        db.add(EquityCurve(
+            performance_id=performance.id,
+            strategy=strategy,
+            start=equity.index[0].to_pydatetime(),
+            end=equity.index[-1].to_pydatetime(),
+            points=len(equity),
+            encoding=CURVE_ENCODING,
+            data=encode_curve(timestamps, equity.to_numpy(dtype=float))
+        ))
+    if commit:
+        db.commit()
     return performance
 
 def save_settings(db, settings):
-    """Save trading settings"""
+    """Save trading settings unless they equal the most recently saved ones"""
+    latest = db.query(Settings).order_by(Settings.id.desc()).first()
+    if latest is not None and (
+        latest.short_window == settings['short_window']
+        and latest.long_window == settings['long_window']
+        and latest.initial_balance == float(settings['initial_balance'])
+        and latest.timeframe == settings['timeframe']
+        and latest.lookback_period == settings['lookback_period']
+    ):
+        return latest
+
     setting = Settings(
         short_window=settings['short_window'],
         long_window=settings['long_window'],
@@ -101,4 +389,43 @@ def save_settings(db, settings):
     )
     db.add(setting)
     db.commit()
-    return setting
\ No newline at end of file
+    return setting
+
+def load_strategy_state(db, key):
+    """Load an incremental strategy snapshot as a dict"""
+    row = db.query(StrategyState).filter(StrategyState.key == key).first()
+    return json.loads(row.state) if row else None
+
+def save_strategy_state(db, key, state, commit=True):
+    """Insert or replace an incremental strategy snapshot"""
+    row = db.query(StrategyState).filter(StrategyState.key == key).first()
+    if row is None:
+        row = StrategyState(key=key)
+        db.add(row)
+    row.state = json.dumps(state)
+    row.updated_at = datetime.utcnow()
+    if commit:
+        db.commit()
+    return row
+
+def load_performance_state(db, strategy):
+    """Load a run's metrics accumulator snapshot as a dict"""
+    row = db.query(PerformanceState).filter(PerformanceState.strategy == strategy).first()
+    return json.loads(row.state) if row else None
+
+def save_performance_state(db, strategy, state, commit=True):
+    """Insert or replace a run's metrics accumulator snapshot"""
+    row = db.query(PerformanceState).filter(PerformanceState.strategy == strategy).first()
+    if row is None:
+        row = PerformanceState(strategy=strategy)
+        db.add(row)
+    row.points = state['points']
+    row.state = json.dumps(state)
+    row.updated_at = datetime.utcnow()
+    if commit:
+        db.commit()
+    return row
+
+if __name__ == "__main__":
+    init_db()
+    print("Database schema is up to date")
@@ -1,103 +1,483 @@
 import boto3
 import argparse
+import ast
+import base64
+import hashlib
+import json
 import os
-import zipfile
+import re
+import shutil
+import subprocess
+import sys
 import tempfile
+import zipfile
 from pathlib import Path
 
+ROOT = Path(__file__).parent
+# Must match Runtime in cloudformation/lambda-template.yaml and requires-python of uv.lock
+RUNTIME = 'python3.11'
+PLATFORM = 'manylinux2014_x86_64'
+ENTRY_MODULE = 'lambda_handler'
+# Third-party packages the handler imports; boto3 ships with the Lambda runtime
+LAYER_PACKAGES = ('ccxt', 'numpy', 'pandas', 'psycopg2-binary', 'sqlalchemy')
+# Locked as dependencies but never imported at runtime
+LAYER_EXCLUDE = ('setuptools',)
+# ccxt bundles ~100 exchanges in three flavours; only these (and their base classes) are shipped
+EXCHANGES = ('kraken',)
+STRIP_DIRS = {'__pycache__', 'tests', 'test', 'docs', 'doc', 'examples', 'benchmarks'}
+STRIP_SUFFIXES = ('.pyi', '.pyx', '.pxd', '.pxi', '.c', '.cpp', '.h', '.md', '.rst')
+STRIP_FILES = {'RECORD', 'INSTALLER', 'REQUESTED', 'direct_url.json'}
+# Bump whenever the build steps change, so cached layers are rebuilt
+BUILD_VERSION = 1
+BUILD_DIR = ROOT / 'build' / 'lambda'
+# Fixed timestamp so identical files give identical zips
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+# Larger zips have to go through S3
+DIRECT_UPLOAD_LIMIT = 50 * 2 ** 20
+UNZIPPED_LIMIT = 250 * 2 ** 20
+EXCHANGE_IMPORT = re.compile(r'^from ccxt(?:\.async_support)?\.(\w+) import \w+')
+EXCHANGE_ENTRY = re.compile(r"^    '(\w+)',$")
+
+def runtime_version(runtime=RUNTIME):
+    """'python3.11' -> '3.11'"""
+    return runtime.replace('python', '')
+
+def function_modules(entry=ENTRY_MODULE, root=ROOT):
+    """Repository modules imported by the handler, directly or indirectly (including imports inside functions)"""
+    modules, pending = set(), [entry]
+    while pending:
+        module = pending.pop()
+        if module in modules:
+            continue
+        modules.add(module)
+        tree = ast.parse((root / f"{module}.py").read_text())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            pending.extend(name.split('.')[0] for name in names if (root / f"{name.split('.')[0]}.py").exists())
+    return sorted(modules)
+
+def locked_requirements(lock_path=ROOT / 'uv.lock', packages=LAYER_PACKAGES, exclude=LAYER_EXCLUDE, runtime=RUNTIME):
+    """Pinned `name==version` lines for `packages` and their dependencies, resolved from uv.lock for the Lambda platform"""
+    import tomllib
+    # Only needed for building, pip and setuptools bring it along
+    from packaging.markers import Marker
+
+    with open(lock_path, 'rb') as f:
+        locked = {package['name']: package for package in tomllib.load(f)['package']}
+    version = runtime_version(runtime)
+    environment = {
+        'python_version': version, 'python_full_version': f"{version}.0", 'sys_platform': 'linux',
+        'platform_system': 'Linux', 'platform_machine': 'x86_64', 'os_name': 'posix',
+        'implementation_name': 'cpython', 'platform_python_implementation': 'CPython'
+    }
+
+    resolved, pending = {}, list(packages)
+    while pending:
+        name = pending.pop()
+        if name in resolved or name in exclude:
+            continue
+        if name not in locked:
+            raise ValueError(f"{name} is not in {lock_path}")
+        package = locked[name]
+        resolved[name] = package['version']
+        for dependency in package.get('dependencies', []):
+            if 'marker' not in dependency or Marker(dependency['marker']).evaluate(environment):
+                pending.append(dependency['name'])
+    return [f"{name}=={version}" for name, version in sorted(resolved.items())]
+
+def install_requirements(requirements, target, runtime=RUNTIME, platform=PLATFORM):
+    """pip install the pinned wheels for the Lambda platform into `target`"""
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        f.write('\n'.join(requirements) + '\n')
+    try:
+        subprocess.run([
+            sys.executable, '-m', 'pip', 'install', '--quiet', '--target', str(target), '--no-deps', '--no-compile',
+            '--only-binary=:all:', '--implementation', 'cp', '--platform', platform,
+            '--python-version', runtime_version(runtime), '-r', f.name
+        ], check=True)
+    finally:
+        os.remove(f.name)
+
+def strip_ccxt(site_dir, exchanges=EXCHANGES):
+    """Remove the exchange modules not in `exchanges` (or their base classes) and their imports; returns the count"""
+    package = Path(site_dir) / 'ccxt'
+    if not package.is_dir():
+        return 0
+    available = {path.stem for path in (package / 'abstract').glob('*.py') if path.stem != '__init__'}
+    unknown = set(exchanges) - available
+    if unknown:
+        raise ValueError(f"Unknown ccxt exchanges: {', '.join(sorted(unknown))}")
+
+    # Exchanges such as binanceus subclass another exchange
+    keep, pending = set(), list(exchanges)
+    while pending:
+        exchange = pending.pop()
+        if exchange in keep:
+            continue
+        keep.add(exchange)
+        for source in (package / f"{exchange}.py", package / 'async_support' / f"{exchange}.py"):
+            for line in source.read_text().splitlines():
+                match = EXCHANGE_IMPORT.match(line)
+                if match and match.group(1) in available:
+                    pending.append(match.group(1))
+
+    removed = available - keep
+    # ccxt.pro is the websocket flavour, never imported by the REST clients
+    shutil.rmtree(package / 'pro', ignore_errors=True)
+    for directory in (package, package / 'async_support', package / 'abstract'):
+        for exchange in removed:
+            path = directory / f"{exchange}.py"
+            if path.exists():
+                path.unlink()
+
+    # Both package __init__ modules import every exchange and list it in `exchanges`/`__all__`
+    for init in (package / '__init__.py', package / 'async_support' / '__init__.py'):
+        lines = []
+        for line in init.read_text().splitlines(keepends=True):
+            match = EXCHANGE_IMPORT.match(line) or EXCHANGE_ENTRY.match(line.rstrip('\n'))
+            if match and match.group(1) in removed:
+                continue
+            lines.append(line)
+        init.write_text(''.join(lines))
+    return len(removed)
+
+def strip_tree(site_dir):
+    """Delete tests, docs, sources, type stubs and install metadata; returns the bytes removed"""
+    removed = 0
+    for directory, subdirectories, files in os.walk(site_dir, topdown=True):
+        in_metadata = directory.endswith('.dist-info')
+        for name in list(subdirectories):
+            # Vendored licences live in dist-info and are kept
+            if name in STRIP_DIRS and not in_metadata:
+                path = os.path.join(directory, name)
+                removed += tree_size(path)
+                shutil.rmtree(path)
+                subdirectories.remove(name)
+        for name in files:
+            if name.endswith(STRIP_SUFFIXES) or (in_metadata and name in STRIP_FILES):
+                path = os.path.join(directory, name)
+                removed += os.path.getsize(path)
+                os.remove(path)
+    return removed
+
+def tree_size(path):
+    return sum(
+        os.path.getsize(os.path.join(directory, name)) for directory, _, files in os.walk(path) for name in files
+    )
+
+def target_python(runtime=RUNTIME):
+    """Interpreter with the runtime's version, needed to write matching .pyc files and to time imports"""
+    if '%d.%d' % sys.version_info[:2] == runtime_version(runtime):
+        return sys.executable
+    return shutil.which(runtime)
+
+def compile_tree(directory, install_dir, runtime=RUNTIME):
+    """Precompile .py files into __pycache__ for the runtime; returns whether it was possible"""
+    python = target_python(runtime)
+    if python is None:
+        print(f"No {runtime} interpreter found, skipping .pyc precompilation")
+        return False
+    # Hash-based pycs don't depend on file mtimes (fixed in the zip) and the build
+    # directory is replaced by the install path, so the bytes are reproducible
+    subprocess.run([
+        python, '-m', 'compileall', '-q', '-j', '0', '--invalidation-mode', 'unchecked-hash',
+        '-s', str(directory), '-p', install_dir, str(directory)
+    ], check=True)
+    return True
+
+def write_zip(directory, path):
+    """Deterministic zip of `directory`: sorted entries, fixed timestamps and permissions"""
+    directory = Path(directory)
+    files = sorted(
+        file.relative_to(directory).as_posix() for file in directory.rglob('*') if file.is_file()
+    )
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name in files:
+            source = directory / name
+            info = zipfile.ZipInfo(name, ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            mode = 0o755 if os.access(source, os.X_OK) else 0o644
+            info.external_attr = (0o100000 | mode) << 16
+            zf.writestr(info, source.read_bytes(), compresslevel=9)
+    return artifact(path, directory)
+
+def artifact(path, directory=None):
+    """Size and content hash of a built zip; Lambda reports CodeSha256 as base64 of the same digest"""
+    digest = hashlib.sha256(Path(path).read_bytes()).digest()
+    with zipfile.ZipFile(path) as zf:
+        unzipped = sum(info.file_size for info in zf.infolist())
+        files = len(zf.infolist())
+    return {
+        'path': str(path),
+        'sha256': digest.hex(),
+        'code_sha256': base64.b64encode(digest).decode(),
+        'zip_bytes': os.path.getsize(path),
+        'unzipped_bytes': unzipped,
+        'files': files
+    }
+
+def build_function(build_dir=BUILD_DIR, runtime=RUNTIME):
+    """Zip of the handler's modules with precompiled bytecode"""
+    with tempfile.TemporaryDirectory() as staging:
+        for module in function_modules():
+            shutil.copy2(ROOT / f"{module}.py", Path(staging) / f"{module}.py")
+        compile_tree(staging, '/var/task', runtime)
+        os.makedirs(build_dir, exist_ok=True)
+        path = Path(build_dir) / 'function.zip'
+        result = write_zip(staging, path)
+    named = Path(build_dir) / f"function-{result['sha256'][:12]}.zip"
+    os.replace(path, named)
+    result['path'] = str(named)
+    return result
+
+def layer_key(requirements, runtime=RUNTIME, platform=PLATFORM, exchanges=EXCHANGES):
+    """Everything that determines the layer contents; an unchanged key reuses the last build"""
+    spec = json.dumps({
+        'requirements': requirements, 'runtime': runtime, 'platform': platform,
+        'exchanges': sorted(exchanges), 'build': BUILD_VERSION
+    }, sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+def build_layer(build_dir=BUILD_DIR, runtime=RUNTIME, exchanges=EXCHANGES, requirements=None):
+    """Dependency layer from uv.lock: pinned wheels for Lambda, stripped and precompiled, under python/"""
+    requirements = requirements or locked_requirements(runtime=runtime)
+    path = Path(build_dir) / f"layer-{layer_key(requirements, runtime, PLATFORM, exchanges)}.zip"
+    if path.exists():
+        print(f"Dependency layer unchanged, reusing {path}")
+        return dict(artifact(path), requirements=requirements, cached=True)
+
+    print(f"Building dependency layer ({len(requirements)} packages)...")
+    with tempfile.TemporaryDirectory() as staging:
+        site_dir = Path(staging) / 'python'
+        install_requirements(requirements, site_dir, runtime)
+        installed = tree_size(site_dir)
+        exchanges_removed = strip_ccxt(site_dir, exchanges)
+        strip_tree(site_dir)
+        stripped = installed - tree_size(site_dir)
+        compile_tree(site_dir, '/opt/python', runtime)
+        os.makedirs(build_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        result = write_zip(staging, tmp_path)
+        largest = package_sizes(site_dir)[:10]
+    os.replace(tmp_path, path)
+    result.update(
+        path=str(path), requirements=requirements, cached=False, installed_bytes=installed,
+        stripped_bytes=stripped, ccxt_exchanges_removed=exchanges_removed, largest_packages=largest
+    )
+    return result
+
+def package_sizes(site_dir):
+    """(name, bytes) of the top-level entries of a site directory, largest first"""
+    sizes = []
+    for entry in Path(site_dir).iterdir():
+        if entry.name.endswith('.dist-info'):
+            continue
+        sizes.append((entry.name, tree_size(entry) if entry.is_dir() else entry.stat().st_size))
+    return sorted(sizes, key=lambda item: item[1], reverse=True)
+
+def measure_imports(function_zip, layer_zip, modules=(ENTRY_MODULE, 'ccxt.async_support'), repeat=3, runtime=RUNTIME):
+    """Best-of-`repeat` import seconds per module from the unpacked artifacts, each run in a fresh interpreter"""
+    python = target_python(runtime)
+    if python is None:
+        return {'error': f"no {runtime} interpreter"}
+    code = (
+        "import json, sys, time\n"
+        "sys.path[:0] = sys.argv[1:3]\n"
+        "timings = {}\n"
+        f"for module in {list(modules)!r}:\n"
+        "    start = time.perf_counter()\n"
+        "    __import__(module)\n"
+        "    timings[module] = time.perf_counter() - start\n"
+        "print(json.dumps(timings))\n"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        task, opt = Path(directory) / 'task', Path(directory) / 'opt'
+        with zipfile.ZipFile(function_zip) as zf:
+            zf.extractall(task)
+        with zipfile.ZipFile(layer_zip) as zf:
+            zf.extractall(opt)
+        best = {}
+        for _ in range(repeat):
+            # -S keeps the local site-packages out, so only the layer can satisfy imports
+            run = subprocess.run(
+                [python, '-S', '-c', code, str(task), str(opt / 'python')],
+                capture_output=True, text=True, cwd=directory
+            )
+            if run.returncode != 0:
+                return {'error': run.stderr.strip().splitlines()[-1] if run.stderr.strip() else 'import failed'}
+            for module, seconds in json.loads(run.stdout.strip().splitlines()[-1]).items():
+                best[module] = min(seconds, best.get(module, seconds))
+    return best
+
+def build_packages(build_dir=BUILD_DIR, runtime=RUNTIME, exchanges=EXCHANGES):
+    """Build the function zip and dependency layer and report sizes and import times"""
+    function = build_function(build_dir, runtime)
+    layer = build_layer(build_dir, runtime, exchanges)
+    total = function['unzipped_bytes'] + layer['unzipped_bytes']
+    if total > UNZIPPED_LIMIT:
+        print(f"Warning: {total / 2 ** 20:.1f} MB unzipped exceeds the Lambda limit of {UNZIPPED_LIMIT / 2 ** 20:.0f} MB")
+    return {
+        'runtime': runtime,
+        'function': function,
+        'layer': layer,
+        'unzipped_mb': total / 2 ** 20,
+        'import_seconds': measure_imports(function['path'], layer['path'], runtime=runtime)
+    }
+
+def print_report(report):
+    for name in ('function', 'layer'):
+        item = report[name]
+        print(f"{name}: {item['zip_bytes'] / 2 ** 20:.1f} MB zipped, {item['unzipped_bytes'] / 2 ** 20:.1f} MB unzipped, "
+              f"{item['files']} files, sha256 {item['sha256'][:12]}")
+    layer = report['layer']
+    if not layer['cached']:
+        print(f"layer: stripped {layer['stripped_bytes'] / 2 ** 20:.1f} MB of {layer['installed_bytes'] / 2 ** 20:.1f} MB, "
+              f"{layer['ccxt_exchanges_removed']} ccxt exchanges removed")
+        for package, size in layer['largest_packages']:
+            print(f"  {package}: {size / 2 ** 20:.1f} MB")
+    for module, seconds in report['import_seconds'].items():
+        print(f"import {module}: {seconds if isinstance(seconds, str) else f'{seconds * 1000:.0f} ms'}")
+
+def upload_source(package, name, s3_client, bucket):
+    """Code argument for a zip: inline when small enough, else an S3 object named by its content hash"""
+    if package['zip_bytes'] <= DIRECT_UPLOAD_LIMIT:
+        return {'ZipFile': Path(package['path']).read_bytes()}
+    if not bucket:
+        raise ValueError(f"{name} is {package['zip_bytes'] / 2 ** 20:.1f} MB, pass --artifact-bucket to upload it via S3")
+    key = f"lambda/{name}-{package['sha256']}.zip"
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.ClientError:
+        print(f"Uploading {name} to s3://{bucket}/{key}...")
+        s3_client.upload_file(package['path'], bucket, key)
+    return {'S3Bucket': bucket, 'S3Key': key}
+
+def deploy_layer(lambda_client, s3_client, layer_name, layer, bucket=None, runtime=RUNTIME):
+    """ARN of a layer version with the same content, publishing one only if none exists"""
+    description = f"sha256 {layer['sha256']}"
+    for page in lambda_client.get_paginator('list_layer_versions').paginate(LayerName=layer_name):
+        for version in page['LayerVersions']:
+            if version.get('Description') == description:
+                print(f"Dependency layer unchanged ({version['LayerVersionArn']})")
+                return version['LayerVersionArn']
+    print("Publishing dependency layer...")
+    response = lambda_client.publish_layer_version(
+        LayerName=layer_name,
+        Description=description,
+        Content=upload_source(layer, layer_name, s3_client, bucket),
+        CompatibleRuntimes=[runtime]
+    )
+    return response['LayerVersionArn']
+
+def deploy_function(lambda_client, s3_client, function_name, function, layer_arn, bucket=None):
+    """Attach the layer and upload the code, skipping whatever is already deployed"""
+    waiter = lambda_client.get_waiter('function_updated')
+    configuration = lambda_client.get_function_configuration(FunctionName=function_name)
+    if [layer['Arn'] for layer in configuration.get('Layers', [])] != [layer_arn]:
+        print("Attaching dependency layer...")
+        lambda_client.update_function_configuration(FunctionName=function_name, Layers=[layer_arn])
+        # Lambda rejects a code update while the configuration update is in progress
+        waiter.wait(FunctionName=function_name)
+    if configuration['CodeSha256'] == function['code_sha256']:
+        print("Function code unchanged, skipping upload")
+        return False
+    print("Updating Lambda function code...")
+    lambda_client.update_function_code(FunctionName=function_name, **upload_source(function, function_name, s3_client, bucket))
+    waiter.wait(FunctionName=function_name)
+    return True
+
+def stack_outputs(cloudformation, stack_name):
+    """Outputs of an existing stack, or None if it doesn't exist yet"""
+    try:
+        response = cloudformation.describe_stacks(StackName=stack_name)
+    except cloudformation.exceptions.ClientError as e:
+        if 'does not exist' in str(e):
+            return None
+        raise
+    return {output['OutputKey']: output['OutputValue'] for output in response['Stacks'][0].get('Outputs', [])}
+
 def create_deployment_package():
-    """Create a ZIP file containing the Lambda function code"""
-    print("Creating deployment package...")
-    
-    # Create a temporary directory for the package
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # Copy required files
-        files_to_include = [
-            'lambda_handler.py',
-            'strategy.py',
-            'utils.py',
-            'database.py',
-            'requirements.txt'
-        ]
-        
-        # Create the deployment package
-        deployment_package = Path(tmpdir) / 'deployment_package.zip'
-        with zipfile.ZipFile(deployment_package, 'w') as zf:
-            for file in files_to_include:
-                if os.path.exists(file):
-                    zf.write(file)
-        
-        with open(deployment_package, 'rb') as f:
-            return f.read()
-
-def deploy_lambda(stack_name, db_password, environment='Production'):
+    """Build the function zip and return its bytes"""
+    return Path(build_function()['path']).read_bytes()
+
+def deploy_lambda(stack_name, db_password, environment='Production', exchanges=EXCHANGES, bucket=None):
     """Deploy the Lambda function using CloudFormation"""
     cloudformation = boto3.client('cloudformation')
     lambda_client = boto3.client('lambda')
-    
+    s3_client = boto3.client('s3')
+
     # Read template
     template_path = Path(__file__).parent / 'cloudformation' / 'lambda-template.yaml'
     with open(template_path, 'r') as file:
         template_body = file.read()
-    
+
     try:
-        # Create/update stack
-        print(f"Deploying stack {stack_name}...")
-        cloudformation.create_stack(
-            StackName=stack_name,
-            TemplateBody=template_body,
-            Parameters=[
-                {
-                    'ParameterKey': 'DBPassword',
-                    'ParameterValue': db_password
-                },
-                {
-                    'ParameterKey': 'EnvironmentName',
-                    'ParameterValue': environment
-                }
-            ],
-            Capabilities=['CAPABILITY_IAM']
-        )
-        
-        # Wait for stack creation
-        print("Waiting for stack creation to complete...")
-        waiter = cloudformation.get_waiter('stack_create_complete')
-        waiter.wait(
-            StackName=stack_name,
-            WaiterConfig={'Delay': 30, 'MaxAttempts': 60}
-        )
-        
-        # Get function name from stack outputs
-        response = cloudformation.describe_stacks(StackName=stack_name)
-        outputs = {
-            output['OutputKey']: output['OutputValue']
-            for output in response['Stacks'][0]['Outputs']
-        }
-        
+        print("Building deployment packages...")
+        report = build_packages(exchanges=exchanges)
+        print_report(report)
+
+        outputs = stack_outputs(cloudformation, stack_name)
+        if outputs is None:
+            print(f"Deploying stack {stack_name}...")
+            cloudformation.create_stack(
+                StackName=stack_name,
+                TemplateBody=template_body,
+                Parameters=[
+                    {
+                        'ParameterKey': 'DBPassword',
+                        'ParameterValue': db_password
+                    },
+                    {
+                        'ParameterKey': 'EnvironmentName',
+                        'ParameterValue': environment
+                    }
+                ],
+                Capabilities=['CAPABILITY_IAM']
+            )
+
+            # Wait for stack creation
+            print("Waiting for stack creation to complete...")
+            waiter = cloudformation.get_waiter('stack_create_complete')
+            waiter.wait(
+                StackName=stack_name,
+                WaiterConfig={'Delay': 30, 'MaxAttempts': 60}
+            )
+            outputs = stack_outputs(cloudformation, stack_name)
+        else:
+            print(f"Stack {stack_name} exists, updating code only")
+
         function_name = outputs['LambdaFunctionName']
-        
-        # Update Lambda function code
-        print("Updating Lambda function code...")
-        deployment_package = create_deployment_package()
-        lambda_client.update_function_code(
-            FunctionName=function_name,
-            ZipFile=deployment_package
-        )
-        
+        layer_arn = deploy_layer(lambda_client, s3_client, f"{stack_name}-dependencies", report['layer'], bucket)
+        deploy_function(lambda_client, s3_client, function_name, report['function'], layer_arn, bucket)
+
         print("\nDeployment completed successfully!")
         print("\nLambda Function Details:")
         print(f"Function Name: {outputs['LambdaFunctionName']}")
         print(f"Function ARN: {outputs['LambdaFunctionArn']}")
-        
+        print(f"Dependency Layer: {layer_arn}")
+
     except Exception as e:
         print(f"Error deploying Lambda function: {str(e)}")
         raise
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Deploy Bitcoin Trading Bot Lambda Function')
-    parser.add_argument('--stack-name', required=True, help='Name of the CloudFormation stack')
-    parser.add_argument('--db-password', required=True, help='Database password')
+    parser.add_argument('--stack-name', help='Name of the CloudFormation stack')
+    parser.add_argument('--db-password', help='Database password')
     parser.add_argument('--environment', default='Production', help='Environment name')
-    
+    parser.add_argument('--exchanges', nargs='+', default=list(EXCHANGES), help='ccxt exchanges kept in the dependency layer')
+    parser.add_argument('--artifact-bucket', help='S3 bucket for packages above the 50 MB direct upload limit')
+    parser.add_argument('--build-only', action='store_true', help='Build the packages and print the size/import report')
+
     args = parser.parse_args()
-    deploy_lambda(args.stack_name, args.db_password, args.environment)
+    if args.build_only:
+        print(json.dumps(build_packages(exchanges=args.exchanges), indent=2))
+    elif not args.stack_name or not args.db_password:
+        parser.error('--stack-name and --db-password are required to deploy')
+    else:
+        deploy_lambda(args.stack_name, args.db_password, args.environment, args.exchanges, args.artifact_bucket)
@@ -0,0 +1,90 @@
+import asyncio
+import random
+import numpy as np
+from ccxt.base.errors import RateLimitExceeded
+from ohlcv_fetcher import timeframe_ms
+
+class FakeExchange:
+    """Offline stand-in for a ccxt exchange serving deterministic synthetic candles"""
+
+    id = 'fake'
+    rateLimit = 0
+
+    def __init__(self, now=None, max_limit=1000, base_price=30000.0):
+        # Frozen clock so repeated runs see the same "open" bar
+        self.now = now if now is not None else 1700000000000
+        self.max_limit = max_limit
+        self.base_price = base_price
+        self.calls = 0
+
+    def milliseconds(self):
+        return self.now
+
+    @staticmethod
+    def parse_timeframe(timeframe):
+        return timeframe_ms(timeframe) // 1000
+
+    def close_prices(self, bar):
+        """Smooth trend plus hash-like noise, so any page of any range is reproducible"""
+        noise = np.modf(np.sin(bar * 12.9898) * 43758.5453)[0]
+        return self.base_price * np.exp(0.15 * np.sin(bar / 200.0) + 0.02 * noise)
+
+    def candles(self, timeframe, since, limit):
+        """Synthetic candles that depend only on each bar's timestamp"""
+        step = self.parse_timeframe(timeframe) * 1000
+        first = -(-int(since) // step) * step
+        last_open = (self.now // step) * step
+        if first > last_open:
+            return []
+
+        timestamps = np.arange(first, min(first + limit * step, last_open + step), step)
+        # Each bar opens at the previous bar's close, also across page boundaries
+        prices = self.close_prices(np.concatenate(([timestamps[0] - step], timestamps)) // step)
+        open_, close = prices[:-1], prices[1:]
+        if timestamps[-1] == last_open:
+            # The current bar is still open: it only moves part of the way so far
+            elapsed = (self.now - last_open) / step
+            close[-1] = open_[-1] + (close[-1] - open_[-1]) * elapsed
+        high = np.maximum(open_, close) * 1.002
+        low = np.minimum(open_, close) * 0.998
+        volume = 10.0 + 5.0 * np.abs(close / self.base_price - 1) * 100
+        return np.column_stack((timestamps, open_, high, low, close, volume)).tolist()
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        self.calls += 1
+        limit = min(limit or self.max_limit, self.max_limit)
+        if since is None:
+            since = self.now - limit * self.parse_timeframe(timeframe) * 1000
+        return self.candles(timeframe, since, limit)
+
+class AsyncFakeExchange(FakeExchange):
+    """Async variant that simulates network latency and HTTP 429 responses"""
+
+    def __init__(self, latency=0.05, error_rate=0.0, seed=0, rate_limit=0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rateLimit = rate_limit
+        self.random = random.Random(seed)
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.random.random() < self.error_rate:
+                self.errors += 1
+                raise RateLimitExceeded(f"{self.id} 429 Too Many Requests")
+            return super().fetch_ohlcv(symbol, timeframe, since, limit)
+        finally:
+            self.in_flight -= 1
+
+    async def load_markets(self, reload=False):
+        await asyncio.sleep(self.latency)
+        return {}
+
+    async def close(self):
+        pass
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, func, or_
+from database import EquityCurve, Performance, Trade, decode_curve
+
+def performance_history(db, strategy=None, start=None, end=None, limit=100, cursor=None):
+    """Newest-first page of run records; pass the returned cursor to get the next page"""
+    query = db.query(Performance)
+    if strategy is not None:
+        query = query.filter(Performance.strategy == strategy)
+    if start is not None:
+        query = query.filter(Performance.date >= start)
+    if end is not None:
+        query = query.filter(Performance.date <= end)
+
+    # Keyset pagination over (date, id) stays an index range scan on deep pages
+    if cursor is not None:
+        query = query.filter(or_(
+            Performance.date < cursor[0],
+            and_(Performance.date == cursor[0], Performance.id < cursor[1])
+        ))
+    rows = query.order_by(Performance.date.desc(), Performance.id.desc()).limit(limit).all()
+    page = pd.DataFrame([
+        {
+            'id': row.id,
+            'date': row.date,
+            'strategy': row.strategy,
+            'portfolio_value': row.portfolio_value,
+            'total_return': row.total_return,
+            'sharpe_ratio': row.sharpe_ratio,
+            'max_drawdown': row.max_drawdown
+        }
+        for row in rows
+    ])
+    next_cursor = (rows[-1].date, rows[-1].id) if len(rows) == limit else None
+    return page, next_cursor
+
+def trade_history(db, strategy, start=None, end=None, limit=1000, cursor=None):
+    """Oldest-first page of a run's trades in a time range, indexed by timestamp"""
+    query = db.query(Trade).filter(Trade.strategy == strategy)
+    if start is not None:
+        query = query.filter(Trade.timestamp >= start)
+    if end is not None:
+        query = query.filter(Trade.timestamp <= end)
+
+    if cursor is not None:
+        query = query.filter(or_(
+            Trade.timestamp > cursor[0],
+            and_(Trade.timestamp == cursor[0], Trade.id > cursor[1])
+        ))
+    rows = query.order_by(Trade.timestamp, Trade.id).limit(limit).all()
+    page = pd.DataFrame([
+        {'timestamp': row.timestamp, 'type': row.type, 'price': row.price, 'amount': row.amount, 'value': row.value}
+        for row in rows
+    ])
+    if not page.empty:
+        page.set_index('timestamp', inplace=True)
+    next_cursor = (rows[-1].timestamp, rows[-1].id) if len(rows) == limit else None
+    return page, next_cursor
+
+def downsample(timestamps, values, max_points):
+    """Keep the last point of each of `max_points` equal time buckets"""
+    if max_points is None or len(timestamps) <= max_points:
+        return timestamps, values
+    edges = np.linspace(timestamps[0], timestamps[-1], max_points + 1)[1:]
+    last = np.searchsorted(timestamps, edges, side='right') - 1
+    last = np.unique(last)
+    return timestamps[last], values[last]
+
+def latest_curve_id(db, strategy):
+    """Id of a run's newest stored curve, None if it has none; changes whenever a curve is added"""
+    return db.query(func.max(EquityCurve.id)).filter(EquityCurve.strategy == strategy).scalar()
+
+def rebase(timestamps, values, previous):
+    """Scale a curve so it continues the previous one where they meet"""
+    previous_timestamps, previous_values = previous
+    # Every run starts at its initial balance; the curves meet at the later of the
+    # two starts, which is the previous curve's last point if they do not overlap
+    anchor = max(timestamps[0], previous_timestamps[0])
+    base = previous_values[np.searchsorted(previous_timestamps, anchor, side='right') - 1]
+    value = values[np.searchsorted(timestamps, anchor, side='right') - 1]
+    return values * (base / value) if value else values
+
+def equity_history(db, strategy, start=None, end=None, max_points=2000):
+    """Stored equity of a run as a Series, stitched from the curves of all its runs"""
+    query = db.query(EquityCurve).filter(EquityCurve.strategy == strategy)
+    # Only curves overlapping [start, end] are read and decoded
+    if start is not None:
+        query = query.filter(EquityCurve.end >= start)
+    if end is not None:
+        query = query.filter(EquityCurve.start <= end)
+
+    timestamps, values = [], []
+    for curve in query.order_by(EquityCurve.id):
+        if not curve.points:
+            continue
+        curve_timestamps, curve_values = decode_curve(curve.data, curve.points)
+        if timestamps:
+            curve_values = rebase(curve_timestamps, curve_values, (timestamps[-1], values[-1]))
+        timestamps.append(curve_timestamps)
+        values.append(curve_values)
+    if not timestamps:
+        return pd.Series(dtype=float, name='portfolio_value')
+
+    timestamps = np.concatenate(timestamps)
+    values = np.concatenate(values)
+    # Where runs overlap the most recent one wins: a stable sort keeps insertion
+    # order per timestamp and the last occurrence is kept
+    order = np.argsort(timestamps, kind='stable')
+    timestamps, values = timestamps[order], values[order]
+    newest = np.append(timestamps[1:] != timestamps[:-1], True)
+    timestamps, values = timestamps[newest], values[newest]
+
+    mask = np.ones(len(timestamps), dtype=bool)
+    if start is not None:
+        mask &= timestamps >= pd.Timestamp(start).value // 1_000_000
+    if end is not None:
+        mask &= timestamps <= pd.Timestamp(end).value // 1_000_000
+    timestamps, values = downsample(timestamps[mask], values[mask], max_points)
+
+    index = pd.DatetimeIndex(timestamps.astype('datetime64[ms]'), name='timestamp')
+    return pd.Series(values, index=index, name='portfolio_value')
@@ -0,0 +1,185 @@
+import json
+import math
+import os
+import tempfile
+from collections import deque
+import numpy as np
+import pandas as pd
+from strategy import MovingAverageCrossover, run_key
+
+STATE_VERSION = 3
+
+def default_state_dir():
+    """Snapshot location; /tmp survives between warm Lambda invocations"""
+    return os.getenv('STRATEGY_STATE_DIR', os.path.join(tempfile.gettempdir(), 'strategy_state'))
+
+def state_key(exchange_id, symbol, timeframe, short_window, long_window, initial_balance):
+    """Identity of a snapshot; any parameter change starts a fresh state"""
+    return run_key(exchange_id, symbol, timeframe, short_window, long_window, initial_balance)
+
+class RollingMean:
+    """Simple moving average over a ring buffer with a running sum"""
+
+    def __init__(self, window, values=(), total=None, updates=0):
+        self.window = window
+        self.buffer = deque(values, maxlen=window)
+        self.total = math.fsum(self.buffer) if total is None else total
+        self.updates = updates
+
+    def push(self, value):
+        if len(self.buffer) == self.window:
+            self.total -= self.buffer[0]
+        self.buffer.append(value)
+        self.total += value
+        self.updates += 1
+        if self.updates % self.window == 0:
+            # Re-anchor once per wrap so rounding drift cannot accumulate
+            self.total = math.fsum(self.buffer)
+
+    @property
+    def value(self):
+        if len(self.buffer) < self.window:
+            return None
+        return self.total / self.window
+
+    def to_dict(self):
+        return {'window': self.window, 'values': list(self.buffer), 'total': self.total, 'updates': self.updates}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['window'], data['values'], data['total'], data['updates'])
+
+class CrossoverState:
+    """MovingAverageCrossover replayed one closed candle at a time in O(1)"""
+
+    def __init__(self, short_window, long_window, initial_balance):
+        self.short = RollingMean(short_window)
+        self.long = RollingMean(long_window)
+        self.initial_balance = float(initial_balance)
+        self.bars = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.signal = 0
+        self.cash = self.initial_balance
+        self.holdings = 0.0
+        self.entry_price = None
+        # Equity statistics are kept by a utils.MetricsAccumulator fed from process()
+        self.last_value = self.initial_balance
+        self.orders = 0
+
+    def update(self, timestamp, close):
+        """Advance by one closed candle and return the trade it triggers, if any"""
+        self.short.push(close)
+        self.long.push(close)
+        self.bars += 1
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+
+        # Same rule as generate_signals: no signal until the long SMA is available
+        previous = self.signal
+        short_mean, long_mean = self.short.value, self.long.value
+        valid = self.bars >= self.long.window and short_mean is not None
+        self.signal = 1 if valid and short_mean > long_mean else 0
+
+        trade = None
+        if self.bars > 1 and self.signal - previous == 1:
+            btc_amount = self.cash / close
+            self.holdings, self.cash, self.entry_price = btc_amount, 0.0, close
+            trade = {'type': 'BUY', 'price': close, 'amount': btc_amount, 'value': btc_amount * close}
+        elif self.signal - previous == -1 and self.entry_price is not None:
+            btc_amount = self.holdings
+            self.cash, self.holdings = btc_amount * close, 0.0
+            self.entry_price = None
+            trade = {'type': 'SELL', 'price': close, 'amount': btc_amount, 'value': self.cash}
+        if trade is not None:
+            self.orders += 1
+            trade['timestamp'] = pd.Timestamp(timestamp, unit='ms')
+
+        self.last_value = self.cash + self.holdings * close
+        self.last_timestamp = timestamp
+        return trade
+
+    def process(self, data, until=None, accumulator=None):
+        """Feed candles newer than the snapshot (and not after `until`, in ms); returns new trades"""
+        timestamps = data.index.as_unit('ms').asi8
+        mask = np.ones(len(data), dtype=bool)
+        if self.last_timestamp is not None:
+            mask &= timestamps > self.last_timestamp
+        if until is not None:
+            mask &= timestamps <= until
+
+        trades = []
+        closes = data['close'].to_numpy(dtype=float)[mask]
+        for timestamp, close in zip(timestamps[mask].tolist(), closes.tolist()):
+            trade = self.update(timestamp, close)
+            if trade is not None:
+                trades.append(trade)
+            if accumulator is not None:
+                # The equity point of this candle, for a utils.MetricsAccumulator
+                accumulator.update(self.last_value, self.holdings > 0, timestamp)
+
+        trades_df = pd.DataFrame(trades)
+        if not trades_df.empty:
+            trades_df.set_index('timestamp', inplace=True)
+        return trades_df
+
+    def verify(self, data, rtol=1e-9):
+        """Check the snapshot against a full backtest over the same candles"""
+        if self.first_timestamp is None:
+            return True
+        timestamps = data.index.as_unit('ms').asi8
+        history = data[(timestamps >= self.first_timestamp) & (timestamps <= self.last_timestamp)]
+        if len(history) != self.bars:
+            return False
+
+        strategy = MovingAverageCrossover(self.short.window, self.long.window, self.initial_balance)
+        signals, portfolio, trades = strategy.backtest(history)
+        last = portfolio.iloc[-1]
+        return (
+            int(signals['signal'].iloc[-1]) == self.signal
+            and len(trades) == self.orders
+            and math.isclose(last['cash'], self.cash, rel_tol=rtol, abs_tol=1e-9)
+            and math.isclose(last['holdings'], self.holdings, rel_tol=rtol, abs_tol=1e-12)
+            and math.isclose(last['portfolio_value'], self.last_value, rel_tol=rtol)
+        )
+
+    def to_dict(self):
+        data = {key: value for key, value in vars(self).items() if key not in ('short', 'long')}
+        data.update(version=STATE_VERSION, short=self.short.to_dict(), long=self.long.to_dict())
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != STATE_VERSION:
+            raise ValueError(f"Unsupported strategy state version: {data.get('version')}")
+        state = cls(data['short']['window'], data['long']['window'], data['initial_balance'])
+        for key, value in data.items():
+            if key not in ('version', 'short', 'long'):
+                setattr(state, key, value)
+        state.short = RollingMean.from_dict(data['short'])
+        state.long = RollingMean.from_dict(data['long'])
+        return state
+
+def state_path(key, state_dir=None):
+    name = key.replace('/', '-').replace(':', '_')
+    return os.path.join(state_dir or default_state_dir(), f"{name}.json")
+
+def load_state_file(key, state_dir=None):
+    """Snapshot left in /tmp by a previous invocation of this container, if any"""
+    path = state_path(key, state_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return CrossoverState.from_dict(json.load(f))
+    except (ValueError, KeyError) as e:
+        print(f"Ignoring unreadable strategy state {path}: {str(e)}")
+        return None
+
+def save_state_file(key, state, state_dir=None):
+    path = state_path(key, state_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state.to_dict(), f)
+    os.replace(tmp_path, path)
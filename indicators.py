@@ -0,0 +1,139 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from telemetry import memory_budget_mb
+
+# Default budget of the shared cache; one float64 array of 1M bars is 8 MB
+MAX_CACHE_MB = 256
+# In Lambda the cache gets a quarter of the function's memory, 128 MB of 512 MB
+MEMORY_SHARE = 0.25
+
+def series_fingerprint(values):
+    """Content hash of a price array, dtype included"""
+    values = np.ascontiguousarray(values)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(values.dtype.str.encode())
+    digest.update(memoryview(values).cast('B'))
+    return digest.hexdigest()
+
+def sma(close, window):
+    """Simple moving average, NaN until `window` values are available"""
+    return pd.Series(close, copy=False).rolling(window=window).mean().to_numpy()
+
+def rolling_std(close, window):
+    """Sample standard deviation over `window` values"""
+    return pd.Series(close, copy=False).rolling(window=window).std().to_numpy()
+
+def ema(close, span):
+    """Exponential moving average (alpha = 2 / (span + 1)), NaN for the first span - 1 values"""
+    return pd.Series(close, copy=False).ewm(span=span, adjust=False, min_periods=span).mean().to_numpy()
+
+def rsi(close, period):
+    """Wilder's relative strength index (0-100), NaN until `period` changes are available"""
+    delta = pd.Series(close, copy=False).astype(float).diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / period, adjust=False, min_periods=period).mean().to_numpy()
+    loss = (-delta).clip(lower=0).ewm(alpha=1 / period, adjust=False, min_periods=period).mean().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = 100 - 100 / (1 + gain / loss)
+    # Only gains in the window: the RSI is pinned at 100
+    values[(loss == 0) & (gain > 0)] = 100.0
+    return values
+
+INDICATORS = {
+    'sma': sma,
+    'std': rolling_std,
+    'ema': ema,
+    'rsi': rsi
+}
+
+class IndicatorCache:
+    """LRU cache of indicator arrays keyed by (series fingerprint, indicator, params)"""
+
+    def __init__(self, max_bytes=MAX_CACHE_MB * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def stats(self, since=None):
+        """Counters of this cache, or their change since an earlier stats() snapshot"""
+        with self.lock:
+            counters = dict(self.counters, entries=len(self.entries), bytes=self.size)
+        if since is not None:
+            counters = {name: value - since.get(name, 0) for name, value in counters.items()}
+        return counters
+
+    def get(self, key, compute):
+        """Cached array for `key`, computed and stored on a miss"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return self.entries[key]
+            self.counters['misses'] += 1
+
+        values = compute()
+        # Shared by every strategy reading this key, so nobody may modify it
+        values.flags.writeable = False
+        if values.nbytes > self.max_bytes:
+            return values
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = values
+                self.size += values.nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.nbytes
+                self.counters['evictions'] += 1
+        return values
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared_cache():
+    """Process-wide cache sized by INDICATOR_CACHE_MB, else by the Lambda's memory; 0 keeps nothing"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            max_mb = os.getenv('INDICATOR_CACHE_MB') or memory_budget_mb(MEMORY_SHARE, MAX_CACHE_MB)
+            _shared = IndicatorCache(float(max_mb) * 2 ** 20)
+        return _shared
+
+class Indicators:
+    """Indicator arrays of one price series, served from an IndicatorCache"""
+
+    def __init__(self, close, cache=None, fingerprint=None):
+        self.close = close
+        self.cache = cache or shared_cache()
+        self.fingerprint = fingerprint or series_fingerprint(close)
+
+    def get(self, name, *params):
+        return self.cache.get((self.fingerprint, name, params), lambda: INDICATORS[name](self.close, *params))
+
+    def sma(self, window):
+        return self.get('sma', window)
+
+    def std(self, window):
+        return self.get('std', window)
+
+    def ema(self, span):
+        return self.get('ema', span)
+
+    def rsi(self, period):
+        return self.get('rsi', period)
+
+    def bollinger(self, window, width=2.0):
+        """Middle, upper and lower band, built from the cached SMA and standard deviation"""
+        def compute():
+            middle, std = self.sma(window), self.std(window)
+            return np.stack((middle, middle + width * std, middle - width * std))
+        return self.cache.get((self.fingerprint, 'bollinger', (window, float(width))), compute)
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import time
+from candle_store import CandleStore
+from ohlcv_fetcher import TokenBucket, cached_exchange, main_loop
+from timeframes import BASE_TIMEFRAMES, async_load_timeframes
+from warm_state import load_markets
+
+# Markets fetched at the same time within one invocation
+MAX_JOB_CONCURRENCY = 8
+
+def parse_jobs(event, timeframe):
+    """(exchange, symbol, timeframe) jobs from the event, TRADING_JOBS or the default market"""
+    jobs = (event or {}).get('jobs')
+    if jobs is None and os.getenv('TRADING_JOBS'):
+        jobs = json.loads(os.getenv('TRADING_JOBS'))
+    if not jobs:
+        jobs = [{'exchange': 'kraken', 'symbol': 'BTC/USD'}]
+
+    return [
+        {
+            'exchange': job.get('exchange', 'kraken'),
+            'symbol': job['symbol'],
+            'timeframe': job.get('timeframe', timeframe)
+        }
+        for job in jobs
+    ]
+
+def exchange_clients(jobs):
+    """Cached client per exchange of the jobs; an exchange whose client cannot be created maps to the error"""
+    clients = {}
+    for exchange_id in dict.fromkeys(job['exchange'] for job in jobs):
+        try:
+            clients[exchange_id] = cached_exchange(exchange_id)
+        except Exception as e:
+            # E.g. a misspelled exchange id; iter_fetched fails only the jobs on it
+            clients[exchange_id] = e
+    return clients
+
+async def iter_fetched(jobs, lookback_days, clients, store=None, concurrency=MAX_JOB_CONCURRENCY):
+    """Yield (position, data) for every job as soon as its market is fetched; a failed job yields its exception"""
+    store = store or CandleStore()
+    # One rate limiter per exchange, shared by all of its markets
+    limiters = {
+        exchange_id: TokenBucket.for_exchange(client)
+        for exchange_id, client in clients.items() if not isinstance(client, Exception)
+    }
+    semaphore = asyncio.Semaphore(concurrency)
+    since = int(time.time() * 1000) - lookback_days * 24 * 60 * 60 * 1000
+
+    # Jobs on the same market share one base-resolution feed, see timeframes.py
+    groups = {}
+    for position, job in enumerate(jobs):
+        groups.setdefault((job['exchange'], job['symbol']), []).append(position)
+
+    async def fetch(exchange_id, symbol, positions):
+        async with semaphore:
+            client = clients[exchange_id]
+            if isinstance(client, Exception):
+                raise client
+            # Loaded once per client (and day), or restored from a copy spilled by an earlier process
+            await load_markets(client)
+            return await async_load_timeframes(
+                client, symbol, sorted({jobs[position]['timeframe'] for position in positions}), since, store,
+                supported=tuple(getattr(client, 'timeframes', None) or BASE_TIMEFRAMES),
+                limiter=limiters[exchange_id]
+            )
+
+    pending = {
+        asyncio.ensure_future(fetch(exchange_id, symbol, positions)): positions
+        for (exchange_id, symbol), positions in groups.items()
+    }
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                positions = pending.pop(task)
+                error = task.exception()
+                for position in positions:
+                    yield position, error if error is not None else task.result()[jobs[position]['timeframe']]
+    finally:
+        # A consumer that stops early must not leave fetches running
+        for task in pending:
+            task.cancel()
+
+async def fetch_jobs(jobs, lookback_days, clients, store=None, concurrency=MAX_JOB_CONCURRENCY):
+    """Fetch every job concurrently; a failed job yields its exception instead of data"""
+    fetched = [None] * len(jobs)
+    async for position, data in iter_fetched(jobs, lookback_days, clients, store, concurrency):
+        fetched[position] = data
+    return fetched
+
+def fetch_all(jobs, lookback_days, store=None, concurrency=MAX_JOB_CONCURRENCY):
+    """Blocking fan-out over the cached, process-wide exchange clients"""
+    clients = exchange_clients(jobs)
+    return main_loop().run_until_complete(
+        fetch_jobs(jobs, lookback_days, clients, store, concurrency)
+    )
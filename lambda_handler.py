@@ -1,11 +1,28 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
 import json
 import os
-import ccxt
-import pandas as pd
-from datetime import datetime, timedelta
-from strategy import MovingAverageCrossover
-from utils import calculate_metrics
-from database import get_db, save_trade, save_performance
+from datetime import datetime
+from strategy import CompactCandles, MovingAverageCrossover, run_key
+from jobs import exchange_clients, fetch_all, iter_fetched, parse_jobs
+from incremental import STATE_VERSION, CrossoverState, state_key, load_state_file, save_state_file
+from ohlcv_fetcher import main_loop, timeframe_ms
+from response_cache import shared_cache
+from timeframes import stored_window
+from utils import MetricsAccumulator, calculate_metrics, equity_metrics, periods_per_year
+from robustness import monte_carlo
+from telemetry import Telemetry, span, count
+from warm_state import frame_fingerprint, shared_state
+from database import (
+    get_engine, session_scope, async_session_scope, save_trades, delete_trades, save_performance, load_strategy_state,
+    save_strategy_state, load_performance_state, save_performance_state
+)
+
+# Cold-start costs of this container; ccxt is only imported on the first fetch
+INIT_TIMINGS = {'imports': time.perf_counter() - _IMPORT_STARTED}
+_cold_start = True
 
 def get_trading_parameters():
     """Get trading parameters from environment variables"""
@@ -14,86 +31,369 @@ def get_trading_parameters():
         'lookback_period': int(os.getenv('LOOKBACK_PERIOD', '100')),
         'initial_balance': float(os.getenv('INITIAL_BALANCE', '10000')),
         'short_window': int(os.getenv('SHORT_WINDOW', '20')),
-        'long_window': int(os.getenv('LONG_WINDOW', '50'))
+        'long_window': int(os.getenv('LONG_WINDOW', '50')),
+        'backtest_engine': os.getenv('BACKTEST_ENGINE', 'vectorized'),
+        'strategy_mode': os.getenv('STRATEGY_MODE', 'full'),
+        'verify_state': os.getenv('VERIFY_STATE', 'false').lower() == 'true',
+        'robustness_paths': int(os.getenv('ROBUSTNESS_PATHS', '0')),
+        'pipeline': os.getenv('HANDLER_PIPELINE', 'sequential')
     }
 
-def fetch_bitcoin_data(timeframe, lookback_days):
-    """Fetch Bitcoin price data from Kraken"""
+def performance_accumulator(db, key, state, params):
+    """Metrics accumulator in step with `state`, rebuilt from the stored candles if it is missing or behind"""
+    bars_per_year = periods_per_year(params['timeframe'])
+    snapshot = load_performance_state(db, key)
+    if snapshot is not None:
+        accumulator = MetricsAccumulator.from_dict(snapshot)
+        if accumulator.last_timestamp == state.last_timestamp and accumulator.periods_per_year == bars_per_year:
+            return accumulator
+
+    accumulator = MetricsAccumulator(bars_per_year)
+    if state.first_timestamp is None:
+        return accumulator
+    # One O(history) replay, e.g. for states saved before the accumulator existed
+    history = stored_window(
+        params['exchange'], params['symbol'], params['timeframe'], state.first_timestamp, state.last_timestamp + 1
+    )
+    replay = CrossoverState(params['short_window'], params['long_window'], params['initial_balance'])
+    replay.process(history, accumulator=accumulator)
+    if replay.bars != state.bars or replay.last_timestamp != state.last_timestamp:
+        print(f"Candle history of {key} is incomplete, its metrics restart at the current portfolio value")
+        accumulator = MetricsAccumulator(bars_per_year)
+        accumulator.update(state.last_value, state.holdings > 0, state.last_timestamp)
+    return accumulator
+
+def run_incremental(db, data, params):
+    """Advance the persisted strategy snapshot with newly closed candles only; returns (metrics, trades written)"""
+    key = state_key(
+        params['exchange'], params['symbol'], params['timeframe'],
+        params['short_window'], params['long_window'], params['initial_balance']
+    )
+
+    # A warm process still holds the snapshot; a warm container has it in /tmp; otherwise use the database copy
+    warm = shared_state()
+    state = warm.get('strategy_state', key, STATE_VERSION) if warm else None
+    if state is not None:
+        count('states_reused')
+    else:
+        state = load_state_file(key)
+    if state is None:
+        snapshot = load_strategy_state(db, key)
+        if snapshot is not None:
+            try:
+                state = CrossoverState.from_dict(snapshot)
+            except (ValueError, KeyError) as e:
+                # Saved by another STATE_VERSION or damaged; the state restarts from the current candles
+                print(f"Ignoring unreadable strategy state {key} in the database: {str(e)}")
+    if state is None:
+        state = CrossoverState(params['short_window'], params['long_window'], params['initial_balance'])
+
     try:
-        exchange = ccxt.kraken({'enableRateLimit': True})
-        end_time = exchange.milliseconds()
-        start_time = end_time - (lookback_days * 24 * 60 * 60 * 1000)
-        
-        ohlcv = exchange.fetch_ohlcv(
-            symbol='BTC/USD',
-            timeframe=timeframe,
-            since=start_time,
-            limit=1000
-        )
-        
-        df = pd.DataFrame(
-            ohlcv,
-            columns=['timestamp', 'open', 'high', 'low', 'close', 'volume']
+        # Sharpe, Sortino, drawdown and win counters advance with the state instead of a pass over all equity
+        accumulator = performance_accumulator(db, key, state, params)
+        # The newest candle is usually still open; only closed candles are applied
+        closed_until = int(time.time() * 1000) - timeframe_ms(params['timeframe'])
+        with span('incremental'):
+            trades = state.process(data, until=closed_until, accumulator=accumulator)
+
+        if params['verify_state']:
+            history = stored_window(params['exchange'], params['symbol'], params['timeframe'], state.first_timestamp)
+            if not state.verify(history):
+                print(f"Strategy state {key} diverged from a full recompute, rebuilding it")
+                state = CrossoverState(params['short_window'], params['long_window'], params['initial_balance'])
+                accumulator = MetricsAccumulator(accumulator.periods_per_year)
+                trades = state.process(history, until=closed_until, accumulator=accumulator)
+                if state.first_timestamp is not None:
+                    # Stored trades of the diverged replay are replaced by the rebuilt ones, so trades and
+                    # metrics come from the same replay
+                    delete_trades(db, key, datetime.utcfromtimestamp(state.first_timestamp / 1000))
+
+        # Before the first closed candle the run reports its untouched initial balance
+        reported = accumulator if accumulator.points else MetricsAccumulator.from_equity(
+            [state.last_value], accumulator.periods_per_year, [False]
         )
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('timestamp', inplace=True)
-        
-        return df
-    except Exception as e:
-        print(f"Error fetching data: {str(e)}")
+        metrics = dict(reported.metrics(), portfolio_value=state.last_value)
+        with span('save_state'):
+            save_strategy_state(db, key, state.to_dict(), commit=False)
+            save_performance_state(db, key, accumulator.to_dict(), commit=False)
+        # One commit for the trades, the deleted ones, the state and the metrics; a failed write leaves
+        # the previous state, so the next run replays the same candles
+        written = store_job(db, key, trades, metrics, None)
+    except Exception:
+        # The in-memory snapshot may be partly advanced
+        if warm:
+            warm.discard('strategy_state', key)
         raise
+    # Local copies only ever hold committed states
+    save_state_file(key, state)
+    if warm:
+        # The JSON file above already is the /tmp copy
+        warm.put('strategy_state', key, state, STATE_VERSION, spill=False)
+    return metrics, written
+
+def job_run_key(params):
+    """run_key of a job's parameters"""
+    return run_key(
+        params['exchange'], params['symbol'], params['timeframe'],
+        params['short_window'], params['long_window'], params['initial_balance']
+    )
+
+def backtest_job(params, data):
+    """CPU-bound part of a full-mode job: backtest, metrics and optional robustness analysis"""
+    # Initialize strategy
+    strategy = MovingAverageCrossover(
+        short_window=params['short_window'],
+        long_window=params['long_window'],
+        initial_balance=params['initial_balance'],
+        engine=params['backtest_engine']
+    )
+    
+    if params['backtest_engine'] == 'vectorized':
+        # Arrays end to end; only the trades and the equity curve become pandas objects
+        with span('backtest'):
+            result = strategy.run(CompactCandles.from_frame(data))
+        with span('calculate_metrics'):
+            metrics = equity_metrics(result.portfolio_value, periods_per_year(params['timeframe']), result.holdings > 0)
+        trades = result.trades_frame()
+        equity = result.equity()
+    else:
+        # Run backtest (includes the generate_signals stage)
+        with span('backtest'):
+            signals, portfolio_value, trades = strategy.backtest(data)
+        
+        # Calculate performance metrics
+        with span('calculate_metrics'):
+            metrics = calculate_metrics(portfolio_value, trades, params['timeframe'])
+        equity = portfolio_value['portfolio_value']
+    metrics['portfolio_value'] = equity.iloc[-1]
+    
+    # Confidence intervals from resampled paths, scored as 2-D batches
+    robustness = None
+    if params['robustness_paths'] > 0:
+        with span('robustness'):
+            robustness = monte_carlo(equity.to_frame(), trades, params['robustness_paths'], timeframe=params['timeframe'])
+    return trades, metrics, equity, robustness
+
+def cached_backtest_job(params, data):
+    """backtest_job(), reused while a market's candles and parameters are unchanged since an earlier invocation"""
+    warm = shared_state()
+    if warm is None:
+        return backtest_job(params, data)
+    key = job_run_key(params)
+    fingerprint = (frame_fingerprint(data), params['backtest_engine'], params['robustness_paths'])
+    result = warm.get('backtest', key, fingerprint)
+    if result is not None:
+        count('results_reused')
+        return result
+    result = backtest_job(params, data)
+    warm.put('backtest', key, result, fingerprint)
+    return result
+
+def store_job(db, run, trades, metrics, equity):
+    """Write a job's trades and performance in one commit, with any writes already staged in `db`"""
+    # Trades replayed from earlier runs are upserted
+    with span('save_trades'):
+        written = save_trades(db, trades, run, commit=False)
+    with span('save_performance'):
+        save_performance(db, metrics, datetime.now(), strategy=run, equity=equity, commit=False)
+    db.commit()
+    return written
+
+def summarize_job(metrics, robustness):
+    """Response summary of one job"""
+    summary = {
+        'total_return': f"{metrics['total_return']:.2f}%",
+        'sharpe_ratio': f"{metrics['sharpe_ratio']:.2f}",
+        'max_drawdown': f"{metrics['max_drawdown']:.2f}%",
+        'win_rate': f"{metrics['win_rate']:.2f}%"
+    }
+    if robustness is not None:
+        intervals = robustness['bootstrap']
+        summary['confidence_intervals'] = {
+            metric: [round(intervals.loc[metric, 'ci_low'], 2), round(intervals.loc[metric, 'ci_high'], 2)]
+            for metric in intervals.index
+        }
+    return summary
+
+def run_job(db, params, data):
+    """Run the strategy for one market and store its trades and performance"""
+    if params['strategy_mode'] == 'incremental':
+        # Only candles closed since the previous run are processed; stores them together with the state
+        metrics, written = run_incremental(db, data, params)
+        robustness = None
+    else:
+        trades, metrics, equity, robustness = cached_backtest_job(params, data)
+        written = store_job(db, job_run_key(params), trades, metrics, equity)
+    
+    count('trades_written', written)
+    return summarize_job(metrics, robustness)
 
 def lambda_handler(event, context):
     """AWS Lambda handler function"""
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    request_id = getattr(context, 'aws_request_id', None)
+    warm = shared_state()
+    warm_before = warm.stats() if warm else None
+    # Emits one JSON line with stage durations and counters when the invocation ends
+    with Telemetry('lambda_handler', cold_start=cold_start, request_id=request_id) as telemetry:
+        if get_trading_parameters()['pipeline'] == 'async':
+            response = main_loop().run_until_complete(handle_async(event, cold_start, telemetry))
+        else:
+            response = handle(event, cold_start, telemetry)
+        telemetry.set(status_code=response['statusCode'], warm_path=warm_path(cold_start, telemetry.counters))
+        if warm:
+            telemetry.set(warm_state=warm.stats(warm_before))
+        return response
+
+def warm_path(cold_start, counters):
+    """Whether the invocation found its exchange clients and markets already set up by an earlier one"""
+    return not cold_start and not counters.get('clients_created') and not counters.get('markets_loaded')
+
+def handle(event, cold_start, telemetry):
+    """Fetch and evaluate all jobs of one invocation"""
     try:
-        # Get trading parameters
+        # Get trading parameters and the markets to run them on
         params = get_trading_parameters()
+        jobs = parse_jobs(event, params['timeframe'])
         
-        # Initialize database session
-        db = next(get_db())
+        # The engine (and schema check) is created once per container
+        with telemetry.span('engine'):
+            get_engine()
         
-        # Fetch Bitcoin data
-        data = fetch_bitcoin_data(params['timeframe'], params['lookback_period'])
+        # Fetch all markets concurrently, one shared client per exchange
+        cache = shared_cache()
+        cache_before = cache.stats() if cache else None
+        with telemetry.span('fetch'):
+            fetched = fetch_all(jobs, params['lookback_period'])
+        if cache:
+            telemetry.set(response_cache=cache.stats(cache_before))
+        if cold_start:
+            # The first fetch includes the deferred ccxt import and client creation
+            telemetry.set(init_timings=dict(INIT_TIMINGS, engine=telemetry.stages['engine'], first_fetch=telemetry.stages['fetch']))
+        telemetry.count('jobs', len(jobs))
         
-        if data is not None:
-            # Initialize strategy
-            strategy = MovingAverageCrossover(
-                short_window=params['short_window'],
-                long_window=params['long_window'],
-                initial_balance=params['initial_balance']
-            )
-            
-            # Run backtest
-            signals, portfolio_value, trades = strategy.backtest(data)
-            
-            # Save trades to database
-            for _, trade in trades.iterrows():
-                save_trade(db, trade.to_dict())
-            
-            # Calculate and save performance metrics
-            metrics = calculate_metrics(portfolio_value, trades)
-            metrics['portfolio_value'] = portfolio_value['portfolio_value'].iloc[-1]
-            save_performance(db, metrics, datetime.now())
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'Trading analysis completed successfully',
-                    'metrics': {
-                        'total_return': f"{metrics['total_return']:.2f}%",
-                        'sharpe_ratio': f"{metrics['sharpe_ratio']:.2f}",
-                        'max_drawdown': f"{metrics['max_drawdown']:.2f}%",
-                        'win_rate': f"{metrics['win_rate']:.2f}%"
-                    }
-                })
-            }
+        results = []
+        with session_scope() as db:
+            for job, data in zip(jobs, fetched):
+                result = dict(job)
+                try:
+                    if isinstance(data, Exception):
+                        raise data
+                    if data.empty:
+                        raise ValueError('No candles returned')
+                    telemetry.count('rows_fetched', len(data))
+                    result['metrics'] = run_job(db, dict(params, **job), data)
+                    result['status'] = 'ok'
+                except Exception as e:
+                    # One failing market must not fail the batch
+                    db.rollback()
+                    print(f"Error in {job['exchange']} {job['symbol']} {job['timeframe']}: {str(e)}")
+                    telemetry.count('jobs_failed')
+                    result.update(status='error', error=str(e))
+                results.append(result)
+        
+        return respond(results)
         
+    except Exception as e:
+        telemetry.set(error=str(e))
         return {
-            'statusCode': 400,
-            'body': json.dumps({'error': 'Failed to fetch Bitcoin data'})
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def respond(results):
+    """Lambda response for the per-job results of one invocation"""
+    succeeded = [result for result in results if result['status'] == 'ok']
+    if not succeeded:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': results[0]['error'] if len(results) == 1 else 'All jobs failed', 'jobs': results})
         }
+    
+    body = {
+        'message': 'Trading analysis completed successfully',
+        'jobs': results
+    }
+    if len(results) == 1:
+        body['metrics'] = results[0]['metrics']
+    return {
+        'statusCode': 200,
+        'body': json.dumps(body)
+    }
+
+async def handle_async(event, cold_start, telemetry):
+    """handle() as a pipeline: each market is backtested and stored while the others are still fetched"""
+    try:
+        params = get_trading_parameters()
+        jobs = parse_jobs(event, params['timeframe'])
+        
+        with telemetry.span('engine'):
+            get_engine()
+        
+        cache = shared_cache()
+        cache_before = cache.stats() if cache else None
+        clients = exchange_clients(jobs)
+        telemetry.count('jobs', len(jobs))
+        results = [None] * len(jobs)
+        
+        async with async_session_scope() as db:
+            # One session, so writes of different jobs take turns
+            write_lock = asyncio.Lock()
+            
+            async def process(position, data):
+                job = jobs[position]
+                result = dict(job)
+                try:
+                    if isinstance(data, Exception):
+                        raise data
+                    if data.empty:
+                        raise ValueError('No candles returned')
+                    telemetry.count('rows_fetched', len(data))
+                    job_params = dict(params, **job)
+                    if job_params['strategy_mode'] == 'incremental':
+                        # Reads and writes the state in the session; the replay itself is O(new candles)
+                        async with write_lock:
+                            try:
+                                result['metrics'] = await db.run_sync(run_job, job_params, data)
+                            except Exception:
+                                await db.rollback()
+                                raise
+                    else:
+                        # The backtest runs on a worker thread so the event loop keeps fetching
+                        trades, metrics, equity, robustness = await asyncio.to_thread(cached_backtest_job, job_params, data)
+                        async with write_lock:
+                            try:
+                                written = await db.run_sync(store_job, job_run_key(job_params), trades, metrics, equity)
+                            except Exception:
+                                await db.rollback()
+                                raise
+                        telemetry.count('trades_written', written)
+                        result['metrics'] = summarize_job(metrics, robustness)
+                    result['status'] = 'ok'
+                except Exception as e:
+                    # One failing market must not fail the batch
+                    print(f"Error in {job['exchange']} {job['symbol']} {job['timeframe']}: {str(e)}")
+                    telemetry.count('jobs_failed')
+                    result.update(status='error', error=str(e))
+                results[position] = result
+            
+            # 'fetch' ends with the last market; the pipeline stage covers the overlapped rest
+            tasks = []
+            with telemetry.span('pipeline'):
+                with telemetry.span('fetch'):
+                    async for position, data in iter_fetched(jobs, params['lookback_period'], clients):
+                        tasks.append(asyncio.ensure_future(process(position, data)))
+                await asyncio.gather(*tasks)
+        
+        if cache:
+            telemetry.set(response_cache=cache.stats(cache_before))
+        if cold_start:
+            telemetry.set(init_timings=dict(INIT_TIMINGS, engine=telemetry.stages['engine'], first_fetch=telemetry.stages['fetch']))
+        return respond(results)
         
     except Exception as e:
+        telemetry.set(error=str(e))
         return {
             'statusCode': 500,
             'body': json.dumps({'error': str(e)})
@@ -0,0 +1,220 @@
+import asyncio
+import atexit
+import inspect
+import random
+import threading
+import time
+import numpy as np
+from response_cache import shared_cache
+from telemetry import count
+
+# Candles requested per page; most exchanges cap a single fetch_ohlcv call at 1000
+PAGE_LIMIT = 1000
+MAX_CONCURRENCY = 4
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5
+
+TIMEFRAME_UNITS = {
+    's': 1, 'm': 60, 'h': 3600, 'd': 86400,
+    'w': 604800, 'M': 2592000, 'y': 31536000
+}
+
+def timeframe_ms(timeframe):
+    """Length of one candle in milliseconds, using ccxt's timeframe notation"""
+    return int(timeframe[:-1]) * TIMEFRAME_UNITS[timeframe[-1]] * 1000
+
+class TokenBucket:
+    """Async rate limiter shared by all pages of a fetch; rate=None disables pacing"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    def for_exchange(cls, exchange, capacity=1):
+        """Bucket that refills at the exchange's advertised rateLimit (ms between calls)"""
+        rate_limit = getattr(exchange, 'rateLimit', None)
+        return cls(1000.0 / rate_limit if rate_limit else None, capacity)
+
+    async def acquire(self):
+        if self.rate is None:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def is_retryable(error):
+    """Rate-limit and network errors; ccxt is imported here to keep it off the import path"""
+    from ccxt.base.errors import NetworkError
+    return isinstance(error, NetworkError)
+
+def plan_pages(since, until, timeframe, limit=PAGE_LIMIT):
+    """Split [since, until) into (page_since, page_limit) requests of at most `limit` candles"""
+    step = timeframe_ms(timeframe)
+    span = limit * step
+    pages = []
+    start = int(since)
+    while start < until:
+        pages.append((start, int(min(limit, -(-(until - start) // step)))))
+        start += span
+    return pages
+
+def stitch_pages(pages, since, until):
+    """Concatenate page results, clip to [since, until) and drop duplicated boundary candles"""
+    batches = [np.asarray(page, dtype=float).reshape(-1, 6) for page in pages if len(page)]
+    if not batches:
+        return np.empty((0, 6))
+    rows = np.concatenate(batches)
+    rows = rows[(rows[:, 0] >= since) & (rows[:, 0] < until)]
+    # Later pages win on duplicate timestamps, matching the order they were requested in
+    reversed_ts = rows[::-1, 0]
+    _, first_in_reversed = np.unique(reversed_ts, return_index=True)
+    return rows[len(rows) - 1 - first_in_reversed]
+
+async def request_page(exchange, limiter, symbol, timeframe, since, limit,
+                       retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+    """Fetch one page, backing off exponentially on rate-limit and network errors"""
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        try:
+            return await exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit)
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            print(f"Retrying {symbol} {timeframe} page at {since} in {delay:.2f}s: {str(e)}")
+            await asyncio.sleep(delay)
+
+async def fetch_page(exchange, limiter, symbol, timeframe, since, limit,
+                     retries=MAX_RETRIES, backoff=RETRY_BACKOFF, cache=None):
+    """One page through the response cache; hits skip the rate limiter"""
+    def request():
+        return request_page(exchange, limiter, symbol, timeframe, since, limit, retries, backoff)
+
+    if cache is None:
+        return await request()
+    return await cache.fetch(
+        exchange.id, symbol, timeframe, since, limit,
+        exchange.milliseconds(), timeframe_ms(timeframe), request
+    )
+
+async def async_fetch_ohlcv_range(exchange, symbol, timeframe, since, until=None,
+                                  limit=PAGE_LIMIT, concurrency=MAX_CONCURRENCY,
+                                  retries=MAX_RETRIES, backoff=RETRY_BACKOFF, limiter=None,
+                                  cache=None):
+    """Fetch every candle in [since, until) with concurrent pages; returns an (n, 6) array"""
+    step = timeframe_ms(timeframe)
+    if until is None:
+        # Include the bar that is still open
+        until = exchange.milliseconds() + step
+    limiter = limiter or TokenBucket.for_exchange(exchange)
+    # Shared with every other fetch of this process unless RESPONSE_CACHE=off; False skips it
+    cache = shared_cache() if cache is None else cache or None
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(page_since, page_limit):
+        async with semaphore:
+            return await fetch_page(
+                exchange, limiter, symbol, timeframe, page_since, page_limit, retries, backoff, cache
+            )
+
+    pages = await asyncio.gather(*(
+        bounded(page_since, page_limit)
+        for page_since, page_limit in plan_pages(since, until, timeframe, limit)
+    ))
+    return checked_rows(exchange, symbol, timeframe, stitch_pages(pages, since, until), since)
+
+def checked_rows(exchange, symbol, timeframe, rows, since):
+    """Warn if the exchange served less history than requested"""
+    if len(rows) and rows[0, 0] >= since + timeframe_ms(timeframe):
+        # Some exchanges (Kraken: last 720 candles) cannot serve the full history
+        print(f"Warning: {exchange.id} returned {symbol} {timeframe} only from {int(rows[0, 0])}, requested {int(since)}")
+    return rows
+
+def sync_fetch_ohlcv_range(exchange, symbol, timeframe, since, until=None, limit=PAGE_LIMIT,
+                           retries=MAX_RETRIES, backoff=RETRY_BACKOFF, **options):
+    """async_fetch_ohlcv_range() for a synchronous ccxt client: the same pages, one after another"""
+    # Concurrency, our rate limiter and the response cache need an async client; ccxt paces sync ones itself
+    if until is None:
+        until = exchange.milliseconds() + timeframe_ms(timeframe)
+    pages = []
+    for page_since, page_limit in plan_pages(since, until, timeframe, limit):
+        for attempt in range(retries + 1):
+            try:
+                pages.append(exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=page_since, limit=page_limit))
+                break
+            except Exception as e:
+                if attempt == retries or not is_retryable(e):
+                    raise
+                delay = backoff * (2 ** attempt) * (1 + random.random())
+                print(f"Retrying {symbol} {timeframe} page at {page_since} in {delay:.2f}s: {str(e)}")
+                time.sleep(delay)
+    return checked_rows(exchange, symbol, timeframe, stitch_pages(pages, since, until), since)
+
+def create_async_exchange(exchange_id, config=None):
+    """Async ccxt client; pacing is left to our own TokenBucket"""
+    import ccxt.async_support as ccxt_async
+    return getattr(ccxt_async, exchange_id)(dict({'enableRateLimit': False}, **(config or {})))
+
+# Main-thread event loop and clients, kept for the life of the process so warm
+# Lambda invocations skip the ccxt import, client setup and TLS handshakes
+_loop = None
+_clients = {}
+
+def main_loop():
+    """Long-lived event loop that cached clients are bound to"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        _clients.clear()
+    return _loop
+
+def cached_exchange(exchange_id):
+    """Async client for exchange_id, created once and used on main_loop()"""
+    main_loop()
+    if exchange_id not in _clients:
+        _clients[exchange_id] = create_async_exchange(exchange_id)
+        count('clients_created')
+    return _clients[exchange_id]
+
+def close_exchanges():
+    """Close cached clients and their event loop"""
+    if _loop is not None and not _loop.is_closed():
+        for client in _clients.values():
+            _loop.run_until_complete(client.close())
+        _loop.close()
+    _clients.clear()
+
+atexit.register(close_exchanges)
+
+def fetch_ohlcv_range(exchange, symbol, timeframe, since, until=None, **options):
+    """Blocking wrapper; `exchange` is an exchange id or a sync or async client owned by the caller"""
+    if not isinstance(exchange, str):
+        if not inspect.iscoroutinefunction(exchange.fetch_ohlcv):
+            return sync_fetch_ohlcv_range(exchange, symbol, timeframe, since, until, **options)
+        return asyncio.run(async_fetch_ohlcv_range(exchange, symbol, timeframe, since, until, **options))
+
+    if threading.current_thread() is threading.main_thread():
+        client = cached_exchange(exchange)
+        return main_loop().run_until_complete(
+            async_fetch_ohlcv_range(client, symbol, timeframe, since, until, **options)
+        )
+
+    # Other threads (e.g. Streamlit script runs) come and go, so use a short-lived client
+    async def run():
+        client = create_async_exchange(exchange)
+        try:
+            return await async_fetch_ohlcv_range(client, symbol, timeframe, since, until, **options)
+        finally:
+            await client.close()
+
+    return asyncio.run(run())
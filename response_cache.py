@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+
+# Empty and short pages are refetched after at most this long, in case the exchange publishes candles late
+PARTIAL_TTL_MS = 5 * 60 * 1000
+MAX_CACHE_MB = 64
+
+def default_cache_dir():
+    """Cache location; /tmp survives between warm Lambda invocations"""
+    return os.getenv('RESPONSE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ohlcv_responses'))
+
+def expiry(step, now, since, limit, rows):
+    """When a fetch_ohlcv response goes stale (ms), or None if it never does"""
+    # The open candle changes until its bar closes
+    if len(rows) and rows[-1][0] + step > now:
+        return int(rows[-1][0] + step)
+    # An empty or short page may only lack candles that are not published yet; one whose range
+    # reaches past now also gains a candle at the next bar boundary
+    if len(rows) < limit:
+        if since + limit * step > now:
+            return int(min((now // step + 1) * step, now + PARTIAL_TTL_MS))
+        return int(now + PARTIAL_TTL_MS)
+    # A full page of closed candles never changes
+    return None
+
+class ResponseCache:
+    """On-disk fetch_ohlcv response cache shared by all threads of the process"""
+
+    def __init__(self, root=None, max_bytes=MAX_CACHE_MB * 2 ** 20):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.counters = {'hits': 0, 'misses': 0, 'coalesced': 0, 'expired': 0}
+
+    def key(self, exchange_id, symbol, timeframe, since, limit):
+        return f"{exchange_id}:{symbol}:{timeframe}:{int(since)}:{int(limit)}"
+
+    def path(self, key):
+        exchange_id = key.split(':', 1)[0]
+        name = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        return os.path.join(self.root, exchange_id, f"{name}.json")
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self, since=None):
+        """Counters of this process, or their change since an earlier stats() snapshot"""
+        with self.lock:
+            counters = dict(self.counters)
+        if since is not None:
+            counters = {name: value - since.get(name, 0) for name, value in counters.items()}
+        return counters
+
+    def get(self, key, now):
+        """Cached rows of a still-fresh response, or None"""
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('key') != key:
+            return None
+        if entry['expires'] is not None and entry['expires'] <= now:
+            self.count('expired')
+            self.remove(path)
+            return None
+        try:
+            # Marks the entry as recently used for trim()
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['rows']
+
+    def put(self, key, rows, expires):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': key, 'expires': expires, 'rows': [list(row) for row in rows]}, f)
+        os.replace(tmp_path, path)
+        self.trim()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def trim(self):
+        """Delete the least recently used responses until the directory fits max_bytes"""
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.json'):
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    async def fetch(self, exchange_id, symbol, timeframe, since, limit, now, step, request):
+        """Serve from disk, join an identical request in flight, or run `request()` and store it"""
+        key = self.key(exchange_id, symbol, timeframe, since, limit)
+        # A thread-safe future lets callers on other threads' event loops wait too
+        with self.lock:
+            pending = self.in_flight.get(key)
+            if pending is None:
+                pending = self.in_flight[key] = Future()
+                owner = True
+            else:
+                self.counters['coalesced'] += 1
+                owner = False
+        if not owner:
+            return await asyncio.wrap_future(pending)
+
+        try:
+            rows = self.get(key, now)
+            if rows is not None:
+                self.count('hits')
+            else:
+                self.count('misses')
+                rows = await request()
+                self.put(key, rows, expiry(step, now, since, limit, rows))
+            pending.set_result(rows)
+            return rows
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def shared_cache():
+    """Process-wide cache for the configured directory; None when RESPONSE_CACHE=off"""
+    if os.getenv('RESPONSE_CACHE', 'on').lower() == 'off':
+        return None
+    root = default_cache_dir()
+    with _caches_lock:
+        if root not in _caches:
+            max_mb = float(os.getenv('RESPONSE_CACHE_MB', str(MAX_CACHE_MB)))
+            _caches[root] = ResponseCache(root, int(max_mb * 2 ** 20))
+        return _caches[root]
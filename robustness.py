@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from utils import RISK_FREE_RATE, periods_per_year
+
+# Paths scored per 2-D block; 256 paths of a year of hourly bars are ~18 MB per array
+PATH_CHUNK = 256
+
+def round_trip_returns(trades):
+    """Growth factor of every closed BUY -> SELL round trip of a backtest"""
+    if trades.empty:
+        return np.array([])
+    types = trades['type'].to_numpy()
+    values = trades['value'].to_numpy(dtype=float)
+    buys = np.flatnonzero(types == 'BUY')
+    # Orders alternate, so each SELL closes the BUY before it; an open BUY is dropped
+    buys = buys[buys + 1 < len(types)]
+    return values[buys + 1] / values[buys]
+
+def block_indices(rng, paths, bars, block_size):
+    """Row-wise resampling indices made of randomly placed contiguous blocks"""
+    block_size = min(block_size, bars)
+    blocks = -(-bars // block_size)
+    starts = rng.integers(0, bars - block_size + 1, size=(paths, blocks))
+    indices = (starts[:, :, None] + np.arange(block_size)).reshape(paths, -1)
+    return indices[:, :bars]
+
+def score_paths(growth, periods_per_year, risk_free_rate=RISK_FREE_RATE):
+    """Final return, max drawdown and Sharpe of each row of per-step growth factors"""
+    equity = np.cumprod(growth, axis=1)
+    peak = np.maximum.accumulate(np.maximum(equity, 1.0), axis=1)
+    excess = growth - 1 - risk_free_rate / periods_per_year
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.sqrt(periods_per_year) * excess.mean(axis=1) / excess.std(axis=1, ddof=1)
+    return {
+        'total_return': (equity[:, -1] - 1) * 100,
+        # The path starts at 1.0, which is the first peak
+        'max_drawdown': np.minimum((equity / peak - 1).min(axis=1), 0) * 100,
+        'sharpe_ratio': sharpe
+    }
+
+def bootstrap_returns(returns, paths, block_size, periods_per_year, seed=0, chunk=PATH_CHUNK):
+    """Block bootstrap of per-bar strategy returns, scored in blocks of `chunk` paths"""
+    returns = np.asarray(returns, dtype=float)
+    rng = np.random.default_rng(seed)
+    results = []
+    for start in range(0, paths, chunk):
+        count = min(chunk, paths - start)
+        growth = 1 + returns[block_indices(rng, count, len(returns), block_size)]
+        results.append(score_paths(growth, periods_per_year))
+    return pd.DataFrame({key: np.concatenate([result[key] for result in results]) for key in results[0]})
+
+def shuffle_trades(trade_returns, paths, seed=0, chunk=PATH_CHUNK):
+    """Round trips replayed in random order; the final return is order independent, the drawdown is not"""
+    trade_returns = np.asarray(trade_returns, dtype=float)
+    rng = np.random.default_rng(seed)
+    results = []
+    for start in range(0, paths, chunk):
+        count = min(chunk, paths - start)
+        growth = rng.permuted(np.broadcast_to(trade_returns, (count, len(trade_returns))), axis=1)
+        equity = np.cumprod(growth, axis=1)
+        peak = np.maximum.accumulate(np.maximum(equity, 1.0), axis=1)
+        results.append({
+            'total_return': (equity[:, -1] - 1) * 100,
+            'max_drawdown': np.minimum((equity / peak - 1).min(axis=1), 0) * 100
+        })
+    return pd.DataFrame({key: np.concatenate([result[key] for result in results]) for key in results[0]})
+
+def summarize(distribution, confidence=0.95):
+    """Mean, spread and a central confidence interval of every metric column"""
+    tail = (1 - confidence) / 2 * 100
+    values = distribution.to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        low, median, high = np.nanpercentile(values, [tail, 50, 100 - tail], axis=0)
+    return pd.DataFrame({
+        'mean': np.nanmean(values, axis=0),
+        'std': np.nanstd(values, axis=0),
+        'median': median,
+        'ci_low': low,
+        'ci_high': high
+    }, index=distribution.columns)
+
+def monte_carlo(portfolio, trades, paths=10000, block_size=None, timeframe=None, seed=0, confidence=0.95):
+    """Summaries and per-path distributions of the bootstrap and trade-shuffle resamplings of a backtest"""
+    equity = portfolio['portfolio_value'].to_numpy(dtype=float)
+    returns = equity[1:] / equity[:-1] - 1
+    bars_per_year = periods_per_year(timeframe, portfolio.index)
+    # Cube-root rule for the block length keeps short-range autocorrelation
+    block_size = block_size or max(1, round(len(returns) ** (1 / 3)))
+
+    bootstrap = bootstrap_returns(returns, paths, block_size, bars_per_year, seed)
+    trade_returns = round_trip_returns(trades)
+    shuffled = shuffle_trades(trade_returns, paths, seed) if len(trade_returns) else None
+    return {
+        'bootstrap': summarize(bootstrap, confidence),
+        'trade_shuffle': summarize(shuffled, confidence) if shuffled is not None else None,
+        'distributions': {'bootstrap': bootstrap, 'trade_shuffle': shuffled},
+        'block_size': block_size
+    }
@@ -1,11 +1,220 @@
+from abc import ABC, abstractmethod
 import pandas as pd
 import numpy as np
+from indicators import Indicators, series_fingerprint
+from telemetry import span
 
-class MovingAverageCrossover:
-    def __init__(self, short_window, long_window, initial_balance):
+BACKTEST_ENGINES = ('vectorized', 'loop')
+
+def run_key(exchange_id, symbol, timeframe, short_window, long_window, initial_balance):
+    """Identity of a strategy run, used to key stored trades and state snapshots"""
+    return f"{exchange_id}:{symbol}:{timeframe}:{short_window}:{long_window}:{float(initial_balance)}"
+
+class CompactCandles:
+    """Int64 epoch-ms timestamps and contiguous close prices, optionally float32"""
+
+    def __init__(self, timestamps, close, dtype=np.float64):
+        self.timestamps = np.ascontiguousarray(timestamps, dtype=np.int64)
+        self.close = np.ascontiguousarray(close, dtype=dtype)
+        self._fingerprint = None
+
+    @classmethod
+    def from_frame(cls, data, dtype=np.float64):
+        if isinstance(data.index, pd.DatetimeIndex):
+            timestamps = data.index.as_unit('ms').asi8
+        else:
+            # Any other index (e.g. a RangeIndex) is kept by the frames; bars are numbered instead
+            timestamps = np.arange(len(data))
+        return cls(timestamps, data['close'].to_numpy(), dtype)
+
+    @classmethod
+    def from_rows(cls, rows, dtype=np.float64):
+        """From (n, 6) store rows, e.g. a CandleStore memory map; only the close is copied"""
+        return cls(rows[:, 0], rows[:, 4], dtype)
+
+    def __len__(self):
+        return len(self.close)
+
+    def indicators(self, cache=None):
+        """Cached indicators of the close; the fingerprint is hashed once per candles object"""
+        if self._fingerprint is None:
+            self._fingerprint = series_fingerprint(self.close)
+        return Indicators(self.close, cache, self._fingerprint)
+
+def crossover(fast, slow, warmup):
+    """Int8 long/flat signal: 1 while `fast` is above `slow`, none during the first `warmup` bars"""
+    signal = np.zeros(len(fast), dtype=np.int8)
+    # NaN comparisons are False
+    signal[warmup:] = fast[warmup:] > slow[warmup:]
+    return signal
+
+def hold_between(entries, exits):
+    """Int8 signal that turns 1 on an entry bar and back to 0 on the next exit bar"""
+    bars = np.arange(len(entries))
+    last_entry = np.maximum.accumulate(np.where(entries, bars, -1))
+    last_exit = np.maximum.accumulate(np.where(exits & ~entries, bars, -1))
+    return (last_entry > last_exit).astype(np.int8)
+
+def simulate(close, position, initial_balance):
+    """Cash, holdings and order arrays for an int8 position (order) series"""
+    n = len(close)
+
+    # Orders alternate BUY/SELL because the signal only moves between 0 and 1
+    buy_idx = np.flatnonzero(position == 1)
+    sell_idx = np.flatnonzero(position == -1)
+    sell_idx = sell_idx[sell_idx > buy_idx[0]] if len(buy_idx) else sell_idx[:0]
+
+    # Cash compounds by exit/entry price ratio on every closed round trip
+    buy_price = close[buy_idx]
+    sell_price = close[sell_idx]
+    round_trips = len(sell_idx)
+    growth = np.concatenate(([1.0], np.cumprod(sell_price / buy_price[:round_trips])))
+    cash_before_buy = initial_balance * growth[:len(buy_idx)]
+    btc_amount = cash_before_buy / buy_price
+    cash_after_sell = btc_amount[:round_trips] * sell_price
+
+    # Cash and holdings after the latest order, propagated forward to the next one
+    has_event = np.zeros(n, dtype=bool)
+    has_event[buy_idx] = True
+    has_event[sell_idx] = True
+    last_event = np.maximum.accumulate(np.where(has_event, np.arange(n), -1))
+    started = last_event >= 0
+    event_cash = np.zeros(n)
+    event_holdings = np.zeros(n)
+    event_cash[sell_idx] = cash_after_sell
+    event_holdings[buy_idx] = btc_amount
+    cash = np.full(n, float(initial_balance))
+    holdings = np.zeros(n)
+    cash[started] = event_cash[last_event[started]]
+    holdings[started] = event_holdings[last_event[started]]
+    del event_cash, event_holdings, last_event, started, has_event
+
+    # Orders interleaved back into chronological order
+    order_idx = np.concatenate((buy_idx, sell_idx))
+    order = np.argsort(order_idx, kind='stable')
+    return {
+        'cash': cash,
+        'holdings': holdings,
+        'portfolio_value': cash + holdings * close,
+        'trade_idx': order_idx[order],
+        'trade_side': np.concatenate((np.ones(len(buy_idx), np.int8), -np.ones(round_trips, np.int8)))[order],
+        'trade_price': np.concatenate((buy_price, sell_price))[order],
+        'trade_amount': np.concatenate((btc_amount, btc_amount[:round_trips]))[order],
+        'trade_value': np.concatenate((btc_amount * buy_price, cash_after_sell))[order]
+    }
+
+class BacktestResult:
+    """Backtest output as arrays; DataFrames are only built on request"""
+
+    def __init__(self, timestamps, close, columns, signal, position, cash, holdings,
+                 portfolio_value, trade_idx, trade_side, trade_price, trade_amount, trade_value, index=None):
+        self.timestamps = timestamps
+        self.close = close
+        # Indicator columns of the signals frame, e.g. {'SMA_short': ..., 'SMA_long': ...}
+        self.columns = columns
+        self.signal = signal
+        self.position = position
+        self.cash = cash
+        self.holdings = holdings
+        self.portfolio_value = portfolio_value
+        self.trade_idx = trade_idx
+        self.trade_side = trade_side
+        self.trade_price = trade_price
+        self.trade_amount = trade_amount
+        self.trade_value = trade_value
+        # Index of the caller's DataFrame, if the candles came from one
+        self._index = index
+
+    def index(self, positions=None):
+        if self._index is None:
+            index = pd.DatetimeIndex(self.timestamps.astype('datetime64[ms]'), name='timestamp')
+            # Nanoseconds like the rest of the pipeline, unless the range does not fit them
+            if len(index) == 0 or index[-1].year < 2262:
+                index = index.as_unit('ns')
+        else:
+            index = self._index
+        return index if positions is None else index[positions].rename('timestamp')
+
+    def float_position(self):
+        """Orders as generate_signals reports them: float, NaN on the first bar"""
+        position = self.position.astype(float)
+        if len(position):
+            position[0] = np.nan
+        return position
+
+    def equity(self):
+        return pd.Series(self.portfolio_value, index=self.index(), name='portfolio_value')
+
+    def signals_frame(self, data):
+        signals = data.copy()
+        for name, values in self.columns.items():
+            # Cached indicator arrays are shared and read-only
+            signals[name] = values.copy()
+        signals['signal'] = self.signal.astype(np.int64)
+        signals['position'] = self.float_position()
+        return signals
+
+    def portfolio_frame(self):
+        return pd.DataFrame({
+            'position': self.float_position(),
+            'close': np.asarray(self.close, dtype=float),
+            'cash': self.cash,
+            'holdings': self.holdings,
+            'portfolio_value': self.portfolio_value
+        }, index=self.index())
+
+    def trades_frame(self):
+        if len(self.trade_idx) == 0:
+            return pd.DataFrame()
+        return pd.DataFrame({
+            'type': np.where(self.trade_side == 1, 'BUY', 'SELL'),
+            'price': self.trade_price,
+            'amount': self.trade_amount,
+            'value': self.trade_value
+        }, index=self.index(self.trade_idx))
+
+class Strategy(ABC):
+    """Long/flat strategy that trades a 0/1 signal computed from cached indicators"""
+
+    def __init__(self, initial_balance):
+        self.initial_balance = float(initial_balance)
+
+    @abstractmethod
+    def indicators(self, indicators):
+        """Indicator columns used by the signal, as {column: array}"""
+
+    @abstractmethod
+    def signal(self, close, columns):
+        """Int8 signal, 1 while long and 0 while flat"""
+
+    def run(self, candles, index=None, cache=None):
+        """Backtest on CompactCandles; returns a BacktestResult of plain arrays"""
+        with span('generate_signals'):
+            columns = self.indicators(candles.indicators(cache))
+            signal = self.signal(candles.close, columns)
+            position = np.zeros(len(signal), dtype=np.int8)
+            position[1:] = np.diff(signal)
+        return BacktestResult(
+            candles.timestamps, candles.close, columns, signal, position,
+            index=index, **simulate(np.asarray(candles.close, dtype=float), position, self.initial_balance)
+        )
+
+    def backtest(self, data):
+        return self._backtest_vectorized(data)
+
+    def _backtest_vectorized(self, data):
+        """Single forward pass over NumPy arrays"""
+        result = self.run(CompactCandles.from_frame(data), data.index)
+        return result.signals_frame(data), result.portfolio_frame(), result.trades_frame()
+
+class MovingAverageCrossover(Strategy):
+    def __init__(self, short_window, long_window, initial_balance, engine='vectorized'):
+        if engine not in BACKTEST_ENGINES:
+            raise ValueError(f"Unknown backtest engine: {engine}")
+        super().__init__(initial_balance)
         self.short_window = short_window
         self.long_window = long_window
-        self.initial_balance = float(initial_balance)
+        self.engine = engine
 
     def generate_signals(self, data):
         signals = data.copy()
@@ -17,7 +226,7 @@ class MovingAverageCrossover:
         # Generate trading signals
         signals['signal'] = 0
         # Create a mask for valid entries (after both MAs are available)
-        valid_entries = signals.index >= signals.index[self.long_window - 1]
+        valid_entries = np.arange(len(signals)) >= self.long_window - 1
         # Use boolean indexing with the mask
         signals.loc[valid_entries, 'signal'] = np.where(
             signals.loc[valid_entries, 'SMA_short'] > signals.loc[valid_entries, 'SMA_long'],
@@ -31,7 +240,21 @@ class MovingAverageCrossover:
         return signals
 
     def backtest(self, data):
-        signals = self.generate_signals(data)
+        if self.engine == 'loop':
+            return self._backtest_loop(data)
+        return self._backtest_vectorized(data)
+
+    def indicators(self, indicators):
+        return {'SMA_short': indicators.sma(self.short_window), 'SMA_long': indicators.sma(self.long_window)}
+
+    def signal(self, close, columns):
+        # Same signal as generate_signals: none until both MAs are available
+        return crossover(columns['SMA_short'], columns['SMA_long'], self.long_window - 1)
+
+    def _backtest_loop(self, data):
+        """Reference row-by-row backtest"""
+        with span('generate_signals'):
+            signals = self.generate_signals(data)
         portfolio = pd.DataFrame(index=signals.index)
 
         # Initialize portfolio metrics with explicit data types
@@ -89,5 +312,52 @@ class MovingAverageCrossover:
         trades_df = pd.DataFrame(trades)
         if not trades_df.empty:
             trades_df.set_index('timestamp', inplace=True)
+            # Timestamps keep the resolution of the candle index, as in the vectorized engine
+            trades_df.index = trades_df.index.astype(portfolio.index.dtype)
+
+        return signals, portfolio, trades_df
+
+class EMACrossover(Strategy):
+    """Long while the short EMA is above the long EMA"""
+
+    def __init__(self, short_window, long_window, initial_balance):
+        super().__init__(initial_balance)
+        self.short_window = short_window
+        self.long_window = long_window
+
+    def indicators(self, indicators):
+        return {'EMA_short': indicators.ema(self.short_window), 'EMA_long': indicators.ema(self.long_window)}
+
+    def signal(self, close, columns):
+        return crossover(columns['EMA_short'], columns['EMA_long'], self.long_window - 1)
+
+class RSIFilteredCrossover(MovingAverageCrossover):
+    """SMA crossover that only enters and stays long while the RSI is below `overbought`"""
+
+    def __init__(self, short_window, long_window, initial_balance, rsi_period=14, overbought=70):
+        super().__init__(short_window, long_window, initial_balance)
+        self.rsi_period = rsi_period
+        self.overbought = overbought
+
+    def indicators(self, indicators):
+        return dict(super().indicators(indicators), RSI=indicators.rsi(self.rsi_period))
+
+    def signal(self, close, columns):
+        signal = super().signal(close, columns)
+        signal[~(columns['RSI'] < self.overbought)] = 0
+        return signal
+
+class BollingerReversion(Strategy):
+    """Buys a close below the lower band and sells once the close is back above the middle band"""
+
+    def __init__(self, window, initial_balance, width=2.0):
+        super().__init__(initial_balance)
+        self.window = window
+        self.width = width
+
+    def indicators(self, indicators):
+        middle, upper, lower = indicators.bollinger(self.window, self.width)
+        return {'BB_middle': middle, 'BB_upper': upper, 'BB_lower': lower}
 
-        return signals, portfolio, trades_df
\ No newline at end of file
+    def signal(self, close, columns):
+        return hold_between(close < columns['BB_lower'], close > columns['BB_middle'])
@@ -0,0 +1,115 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from utils import equity_metrics, periods_per_year
+
+# Pairs evaluated per 2-D block; bounds peak memory to a few block-sized arrays
+PAIR_CHUNK = 128
+
+METRIC_COLUMNS = [
+    'total_return', 'annual_return', 'sharpe_ratio', 'sortino_ratio', 'calmar_ratio',
+    'max_drawdown', 'max_drawdown_duration', 'exposure', 'profit_factor', 'win_rate',
+    'trades', 'final_value'
+]
+
+_shared = {}
+
+def rolling_means(close, windows):
+    """Simple moving averages for every window from one shared cumulative sum"""
+    close = np.asarray(close, dtype=float)
+    n = len(close)
+    # Summing offsets from the first price keeps the cumulative sum small and precise
+    base = close[0] if n else 0.0
+    csum = np.concatenate(([0.0], np.cumsum(close - base)))
+
+    means = np.full((len(windows), n), np.nan)
+    for row, window in enumerate(windows):
+        if 0 < window <= n:
+            means[row, window - 1:] = (csum[window:] - csum[:-window]) / window + base
+    return means
+
+def score_pairs(close, means, short_rows, long_rows, initial_balance, bars_per_year):
+    """Backtest a block of window pairs at once and return their metrics as rows"""
+    pairs = len(short_rows)
+    # Holding whenever the short SMA is above the long SMA (NaN compares False)
+    held = means[short_rows] > means[long_rows]
+
+    bar_returns = np.zeros(len(close))
+    bar_returns[1:] = close[1:] / close[:-1] - 1
+    strategy_returns = np.zeros((pairs, len(close)))
+    strategy_returns[:, 1:] = held[:, :-1] * bar_returns[1:]
+    equity = initial_balance * np.cumprod(1 + strategy_returns, axis=1)
+
+    metrics = equity_metrics(equity, bars_per_year, held)
+    metrics['final_value'] = equity[:, -1]
+    return np.column_stack([metrics[column] for column in METRIC_COLUMNS])
+
+def attach_shared(name, shape):
+    """Map a parent-owned shared memory block into this worker"""
+    block = shared_memory.SharedMemory(name=name)
+    _shared.setdefault('blocks', []).append(block)
+    return np.ndarray(shape, dtype=float, buffer=block.buf)
+
+def _init_worker(close_spec, means_spec):
+    _shared['close'] = attach_shared(*close_spec)
+    _shared['means'] = attach_shared(*means_spec)
+
+def _score_chunk(args):
+    return score_pairs(_shared['close'], _shared['means'], *args)
+
+def to_shared(array):
+    """Copy a float array into a new shared memory block; the caller unlinks it"""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=float, buffer=block.buf)[:] = array
+    return block, (block.name, array.shape)
+
+def sweep_parameters(data, short_windows, long_windows, initial_balance, timeframe=None,
+                     processes=None, sort_by='total_return'):
+    """Evaluate every (short_window, long_window) pair and return them ranked by sort_by"""
+    close = np.ascontiguousarray(data['close'].to_numpy(dtype=float))
+    bars_per_year = periods_per_year(timeframe, data.index)
+    short_windows = [int(w) for w in short_windows]
+    long_windows = [int(w) for w in long_windows]
+
+    pairs = [(s, l) for s in short_windows for l in long_windows if s < l and l <= len(close)]
+    if not pairs:
+        return pd.DataFrame(columns=['short_window', 'long_window'] + METRIC_COLUMNS)
+
+    # Every distinct window is averaged exactly once and shared by all pairs using it
+    windows = sorted({w for pair in pairs for w in pair})
+    row_of = {w: row for row, w in enumerate(windows)}
+    means = rolling_means(close, windows)
+
+    short_rows = np.array([row_of[s] for s, _ in pairs])
+    long_rows = np.array([row_of[l] for _, l in pairs])
+    chunks = [
+        (short_rows[i:i + PAIR_CHUNK], long_rows[i:i + PAIR_CHUNK], float(initial_balance), bars_per_year)
+        for i in range(0, len(pairs), PAIR_CHUNK)
+    ]
+
+    processes = processes or os.cpu_count() or 1
+    if processes <= 1 or len(chunks) <= 1:
+        results = [score_pairs(close, means, *chunk) for chunk in chunks]
+    else:
+        close_block, close_spec = to_shared(close)
+        means_block, means_spec = to_shared(means)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(processes, len(chunks)),
+                initializer=_init_worker,
+                initargs=(close_spec, means_spec)
+            ) as pool:
+                results = list(pool.map(_score_chunk, chunks))
+        finally:
+            for block in (close_block, means_block):
+                block.close()
+                block.unlink()
+
+    ranking = pd.DataFrame(np.vstack(results), columns=METRIC_COLUMNS)
+    ranking.insert(0, 'short_window', [s for s, _ in pairs])
+    ranking.insert(1, 'long_window', [l for _, l in pairs])
+    for column in ('trades', 'max_drawdown_duration'):
+        ranking[column] = ranking[column].astype(int)
+    return ranking.sort_values(sort_by, ascending=False, kind='stable').reset_index(drop=True)
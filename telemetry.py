@@ -0,0 +1,129 @@
+import cProfile
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Recorder of the invocation running in this thread/task, see Telemetry
+_active = contextvars.ContextVar('telemetry', default=None)
+
+def profiling_enabled():
+    """Set TELEMETRY_PROFILE=true to dump a cProfile file per invocation"""
+    return os.getenv('TELEMETRY_PROFILE', 'false').lower() == 'true'
+
+def peak_rss_mb():
+    """Peak resident memory of this process, None where `resource` is unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def memory_budget_mb(share, default_mb):
+    """`share` of the Lambda function's memory for an in-process cache; `default_mb` outside Lambda"""
+    memory = os.getenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+    return float(memory) * share if memory else default_mb
+
+class Telemetry:
+    """Stage timings and counters of one invocation, emitted as a single JSON line"""
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.stages = {}
+        self.counters = {}
+        self.started = None
+        self.profiler = None
+        self.profile_path = None
+        self._token = None
+        # Stages of the async pipeline are also timed on executor threads
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Make this the active recorder and start the clock (and profiler)"""
+        self._token = _active.set(self)
+        if profiling_enabled():
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started = time.perf_counter()
+        return self
+
+    def finish(self):
+        """Stop recording and emit the log line"""
+        duration = time.perf_counter() - self.started
+        if self.profiler is not None:
+            self.profiler.disable()
+            stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+            self.profile_path = os.path.join(tempfile.gettempdir(), f"profile-{self.name}-{stamp}.prof")
+            self.profiler.dump_stats(self.profile_path)
+        _active.reset(self._token)
+        self.emit(duration)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.fields['error'] = str(exc)
+        self.finish()
+        return False
+
+    @contextmanager
+    def span(self, stage):
+        """Add the wall time of the block to `stage`; repeated stages accumulate"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def record(self, duration):
+        """The structured log record; durations are in seconds"""
+        record = {
+            'telemetry': self.name,
+            'duration': duration,
+            'stages': self.stages,
+            'counters': self.counters,
+            'peak_rss_mb': peak_rss_mb()
+        }
+        record.update(self.fields)
+        if self.profile_path:
+            record['profile'] = self.profile_path
+        return record
+
+    def emit(self, duration):
+        # One line per invocation so CloudWatch metric filters can parse it
+        print(json.dumps(self.record(duration), default=str))
+
+def current():
+    """Telemetry of the running invocation, or None"""
+    return _active.get()
+
+@contextmanager
+def span(stage):
+    """Time a stage of the running invocation; does nothing outside of one"""
+    telemetry = _active.get()
+    if telemetry is None:
+        yield
+        return
+    with telemetry.span(stage):
+        yield
+
+def count(name, value=1):
+    telemetry = _active.get()
+    if telemetry is not None:
+        telemetry.count(name, value)
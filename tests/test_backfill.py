@@ -0,0 +1,51 @@
+import asyncio
+from backfill import Progress, backfill_market, plan_chunks
+from candle_store import CandleStore
+from fake_exchange import AsyncFakeExchange
+from ohlcv_fetcher import TokenBucket, timeframe_ms
+
+HOUR = timeframe_ms('1h')
+NOW = 2000 * 100 * HOUR
+
+class SlowFirstChunk(AsyncFakeExchange):
+    """Fake exchange whose first page takes long, so later chunks finish before it"""
+
+    async def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        if since == 0:
+            await asyncio.sleep(0.2)
+        return await super().fetch_ohlcv(symbol, timeframe, since, limit)
+
+class CountingStore(CandleStore):
+    def __init__(self, root):
+        super().__init__(root)
+        self.chunks_written = 0
+
+    def write(self, exchange_id, symbol, timeframe, ohlcv):
+        self.chunks_written += 1
+        return super().write(exchange_id, symbol, timeframe, ohlcv)
+
+def test_finished_chunks_wait_within_window(tmp_path):
+    client = SlowFirstChunk(now=NOW, latency=0.001)
+    store = CountingStore(str(tmp_path))
+    chunks = plan_chunks(0, 40 * 100 * HOUR, '1h', 100)
+    progress = Progress(len(chunks), interval=3600)
+    held = []
+    advance = progress.advance
+
+    def tracked(chunks=1):
+        advance(chunks)
+        # Downloaded chunks that did not reach the store yet
+        held.append(progress.done - store.chunks_written)
+
+    progress.advance = tracked
+
+    async def run():
+        return await backfill_market(
+            client, 'BTC/USD', '1h', 0, chunks[-1][1], chunks, store, TokenBucket(None), asyncio.Semaphore(4),
+            progress, flush_candles=1, window=4
+        )
+
+    written = asyncio.run(run())
+    assert written == 4000
+    assert max(held) <= 4
+    assert len(store.read('fake', 'BTC/USD', '1h')) == 4000
@@ -0,0 +1,88 @@
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.synthetic import synthetic_ohlcv
+from incremental import CrossoverState
+from strategy import MovingAverageCrossover
+from utils import MetricsAccumulator, equity_metrics, periods_per_year
+
+RTOL = 1e-10
+
+def trending(bars, step):
+    """Candles whose close moves by `step` every bar, so the SMAs never cross"""
+    data = synthetic_ohlcv(bars, seed=0)
+    data['close'] = 30000.0 + step * np.arange(bars)
+    return data
+
+def backtests(data, short_window, long_window):
+    return [
+        MovingAverageCrossover(short_window, long_window, 10000, engine=engine).backtest(data)
+        for engine in ('loop', 'vectorized')
+    ]
+
+def assert_parity(data, short_window, long_window):
+    (loop_signals, loop_portfolio, loop_trades), (signals, portfolio, trades) = backtests(data, short_window, long_window)
+    pd.testing.assert_frame_equal(signals, loop_signals, rtol=RTOL)
+    pd.testing.assert_frame_equal(portfolio, loop_portfolio, rtol=RTOL)
+    pd.testing.assert_frame_equal(trades, loop_trades, rtol=RTOL)
+    return trades, portfolio
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+@pytest.mark.parametrize('short_window, long_window', [(2, 5), (5, 20), (20, 50)])
+def test_random_walks(seed, short_window, long_window):
+    trades, _ = assert_parity(synthetic_ohlcv(600, seed=seed, volatility=1.5), short_window, long_window)
+    assert len(trades) > 0
+
+def test_no_trades():
+    trades, portfolio = assert_parity(trending(200, -10.0), 5, 20)
+    assert trades.empty
+    assert (portfolio['portfolio_value'] == 10000).all()
+
+def test_position_open_at_end():
+    trades, portfolio = assert_parity(trending(200, 10.0), 5, 20)
+    assert trades['type'].tolist() == ['BUY']
+    assert portfolio['holdings'].iloc[-1] > 0
+
+def test_window_longer_than_data():
+    trades, _ = assert_parity(synthetic_ohlcv(30, seed=4), 10, 50)
+    assert trades.empty
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_metrics_accumulator_matches_equity_metrics(seed):
+    _, portfolio, _ = MovingAverageCrossover(5, 20, 10000).backtest(synthetic_ohlcv(800, seed=seed, volatility=1.5))
+    equity = portfolio['portfolio_value'].to_numpy()
+    held = portfolio['holdings'].to_numpy() > 0
+    bars_per_year = periods_per_year('1h')
+
+    expected = equity_metrics(equity, bars_per_year, held)
+    metrics = MetricsAccumulator.from_equity(equity, bars_per_year, held).metrics()
+    assert metrics.keys() == expected.keys()
+    for key, value in expected.items():
+        assert math.isclose(metrics[key], value, rel_tol=1e-9, abs_tol=1e-9) or (math.isnan(metrics[key]) and math.isnan(value)), key
+
+def test_nanosecond_index():
+    data = synthetic_ohlcv(300, seed=5, volatility=1.5)
+    data.index = data.index.as_unit('ns')
+    trades, _ = assert_parity(data, 5, 20)
+    assert trades.index.dtype == 'datetime64[ns]'
+
+def test_range_index():
+    data = synthetic_ohlcv(300, seed=6, volatility=1.5).reset_index(drop=True)
+    trades, portfolio = assert_parity(data, 5, 20)
+    assert len(trades) > 0
+    pd.testing.assert_index_equal(portfolio.index, data.index)
+
+def test_incremental_state_feeds_the_accumulator():
+    data = synthetic_ohlcv(500, seed=7, volatility=1.5)
+    _, portfolio, _ = MovingAverageCrossover(5, 20, 10000).backtest(data)
+    bars_per_year = periods_per_year('1h')
+    accumulator = MetricsAccumulator(bars_per_year)
+    CrossoverState(5, 20, 10000).process(data, accumulator=accumulator)
+
+    expected = MetricsAccumulator.from_equity(
+        portfolio['portfolio_value'].to_numpy(), bars_per_year, portfolio['holdings'].to_numpy() > 0
+    ).metrics()
+    metrics = accumulator.metrics()
+    for key, value in expected.items():
+        assert math.isclose(metrics[key], value, rel_tol=1e-9, abs_tol=1e-9) or (math.isnan(metrics[key]) and math.isnan(value)), key
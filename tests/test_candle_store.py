@@ -0,0 +1,34 @@
+import numpy as np
+from candle_store import CandleStore
+
+HOUR = 60 * 60 * 1000
+
+def candles(start, stop):
+    """Hourly rows for bar numbers [start, stop) whose prices equal the bar number"""
+    bars = np.arange(start, stop, dtype=float)
+    return np.column_stack([bars * HOUR, bars, bars, bars, bars, np.ones(len(bars))])
+
+def stored_bars(store):
+    return (store.read('test', 'BTC/USD', '1h')[:, 0] // HOUR).astype(int).tolist()
+
+def test_append_and_overwrite_tail(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.write('test', 'BTC/USD', '1h', candles(0, 10))
+    update = candles(9, 12)
+    update[0, 4] = 99.0
+    store.write('test', 'BTC/USD', '1h', update)
+    assert stored_bars(store) == list(range(12))
+    assert store.read('test', 'BTC/USD', '1h')[9, 4] == 99.0
+
+def test_older_block_keeps_newer_candles(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.write('test', 'BTC/USD', '1h', candles(1000, 1010))
+    store.write('test', 'BTC/USD', '1h', candles(0, 20))
+    store.write('test', 'BTC/USD', '1h', candles(20, 40))
+    assert stored_bars(store) == list(range(40)) + list(range(1000, 1010))
+
+def test_block_inside_stored_range(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.write('test', 'BTC/USD', '1h', candles(0, 50))
+    store.write('test', 'BTC/USD', '1h', candles(10, 20))
+    assert stored_bars(store) == list(range(50))
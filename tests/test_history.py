@@ -0,0 +1,52 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from database import Base, save_performance
+from history import equity_history, latest_curve_id
+
+RUN = 'test-run'
+
+@pytest.fixture
+def db():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        yield session
+
+def store_curve(db, start, values):
+    """Store one run's hourly equity curve starting at `start`"""
+    index = pd.date_range(start, periods=len(values), freq='h', unit='ms')
+    equity = pd.Series(values, index=index, dtype=float)
+    metrics = {'portfolio_value': values[-1], 'total_return': 0.0, 'sharpe_ratio': 0.0, 'max_drawdown': 0.0}
+    save_performance(db, metrics, datetime.now(), strategy=RUN, equity=equity)
+
+def test_curves_are_rebased_onto_the_previous_run(db):
+    store_curve(db, '2024-01-01 00:00', [100, 110, 120])
+    # The next run restarts at the initial balance two bars later
+    store_curve(db, '2024-01-01 02:00', [100, 150, 200])
+    history = equity_history(db, RUN)
+    np.testing.assert_allclose(history.to_numpy(), [100, 110, 120, 180, 240])
+
+def test_runs_without_overlap_continue_from_the_last_value(db):
+    store_curve(db, '2024-01-01 00:00', [100, 50])
+    store_curve(db, '2024-01-02 00:00', [100, 120])
+    history = equity_history(db, RUN)
+    np.testing.assert_allclose(history.to_numpy(), [100, 50, 50, 60])
+    # Without rebasing the second run would show a jump back to 100
+    assert history.diff().abs().max() == 50
+
+def test_only_curves_in_range_are_read(db):
+    store_curve(db, '2024-01-01 00:00', [100, 200])
+    store_curve(db, '2024-02-01 00:00', [100, 110, 120])
+    history = equity_history(db, RUN, start=datetime(2024, 1, 15))
+    np.testing.assert_allclose(history.to_numpy(), [100, 110, 120])
+
+def test_latest_curve_id_changes_with_new_runs(db):
+    assert latest_curve_id(db, RUN) is None
+    store_curve(db, '2024-01-01 00:00', [100, 110])
+    first = latest_curve_id(db, RUN)
+    store_curve(db, '2024-01-01 01:00', [100, 110])
+    assert latest_curve_id(db, RUN) > first
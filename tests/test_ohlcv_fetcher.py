@@ -0,0 +1,27 @@
+import numpy as np
+from candle_store import CandleStore, load_ohlcv
+from fake_exchange import AsyncFakeExchange, FakeExchange
+from ohlcv_fetcher import fetch_ohlcv_range, timeframe_ms
+
+HOUR = timeframe_ms('1h')
+# Half-way through an open hourly bar
+NOW = 1699999200000 + HOUR // 2
+
+def test_sync_client_pages_beyond_limit():
+    since = NOW - HOUR // 2 - 2500 * HOUR
+    exchange = FakeExchange(now=NOW)
+    rows = fetch_ohlcv_range(exchange, 'BTC/USD', '1h', since)
+    assert exchange.calls == 3
+    assert len(rows) == 2501
+    assert (np.diff(rows[:, 0]) == HOUR).all()
+
+def test_sync_and_async_clients_agree():
+    since = NOW - HOUR // 2 - 1500 * HOUR
+    rows = fetch_ohlcv_range(FakeExchange(now=NOW), 'BTC/USD', '1h', since)
+    async_rows = fetch_ohlcv_range(AsyncFakeExchange(now=NOW, latency=0), 'BTC/USD', '1h', since, cache=False)
+    np.testing.assert_array_equal(rows, async_rows)
+
+def test_store_sync_with_sync_client(tmp_path):
+    since = NOW - HOUR // 2 - 100 * HOUR
+    data = load_ohlcv(FakeExchange(now=NOW), 'BTC/USD', '1h', since, CandleStore(str(tmp_path)))
+    assert len(data) == 101
@@ -0,0 +1,48 @@
+import asyncio
+import os
+from response_cache import PARTIAL_TTL_MS, ResponseCache, expiry
+
+HOUR = 60 * 60 * 1000
+NOW = 1000 * HOUR + HOUR // 2
+
+def closed_rows(start, count):
+    return [[(start + bar) * HOUR, 1, 1, 1, 1, 1] for bar in range(count)]
+
+def test_full_page_of_closed_candles_never_expires():
+    assert expiry(HOUR, NOW, 0, 10, closed_rows(0, 10)) is None
+
+def test_open_candle_expires_at_its_close():
+    assert expiry(HOUR, NOW, 995 * HOUR, 10, closed_rows(995, 6)) == 1001 * HOUR
+
+def test_empty_pages_expire():
+    # Before and after the current bar, e.g. a candle that has not closed or been published yet
+    assert expiry(HOUR, NOW, 900 * HOUR, 10, []) == NOW + PARTIAL_TTL_MS
+    assert expiry(HOUR, NOW, 1000 * HOUR, 10, []) == NOW + PARTIAL_TTL_MS
+    assert expiry(HOUR, NOW, 900 * HOUR, 10, closed_rows(900, 5)) == NOW + PARTIAL_TTL_MS
+
+def test_trim_keeps_recently_used_responses(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10 ** 9)
+    keys = [cache.key('test', 'BTC/USD', '1h', page * HOUR, 100) for page in range(3)]
+    for position, key in enumerate(keys):
+        cache.put(key, closed_rows(position * 100, 100), None)
+        os.utime(cache.path(key), (position, position))
+
+    assert cache.get(keys[0], NOW) is not None
+    cache.max_bytes = os.path.getsize(cache.path(keys[0])) + os.path.getsize(cache.path(keys[2]))
+    cache.trim()
+    assert os.path.exists(cache.path(keys[0]))
+    assert not os.path.exists(cache.path(keys[1]))
+    assert os.path.exists(cache.path(keys[2]))
+
+def test_expired_response_is_fetched_again(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    calls = []
+
+    async def request():
+        calls.append(1)
+        return []
+
+    asyncio.run(cache.fetch('test', 'BTC/USD', '1h', 900 * HOUR, 10, NOW, HOUR, request))
+    asyncio.run(cache.fetch('test', 'BTC/USD', '1h', 900 * HOUR, 10, NOW + 60 * 1000, HOUR, request))
+    asyncio.run(cache.fetch('test', 'BTC/USD', '1h', 900 * HOUR, 10, NOW + PARTIAL_TTL_MS, HOUR, request))
+    assert len(calls) == 2
@@ -0,0 +1,35 @@
+from fake_exchange import FakeExchange
+from candle_store import CandleStore
+from ohlcv_fetcher import timeframe_ms
+from timeframes import load_timeframes
+
+DAY = timeframe_ms('1d')
+NOW = 20000 * DAY + timeframe_ms('1h') // 2
+KRAKEN_TIMEFRAMES = ('1m', '5m', '15m', '30m', '1h', '4h', '1d', '1w')
+
+class ShortHistoryExchange(FakeExchange):
+    """Serves only the newest 720 candles of every timeframe, like Kraken"""
+
+    def candles(self, timeframe, since, limit):
+        step = timeframe_ms(timeframe)
+        oldest = (self.now // step - 719) * step
+        return super().candles(timeframe, max(since, oldest), limit)
+
+def test_derived_timeframe_falls_back_to_coarser_native(tmp_path, capsys):
+    since = NOW - 100 * DAY
+    series = load_timeframes(
+        ShortHistoryExchange(now=NOW), 'BTC/USD', ['1h', '12h'], since, CandleStore(str(tmp_path)),
+        supported=KRAKEN_TIMEFRAMES
+    )
+    # 720 hourly candles are 30 days; 720 4h candles reach back 120 days
+    assert series['12h'].index[0].value // 1_000_000 < since + timeframe_ms('12h')
+    assert 'fetching 4h directly' in capsys.readouterr().out
+
+def test_uncoverable_derived_timeframe_warns(tmp_path, capsys):
+    since = NOW - 100 * DAY
+    series = load_timeframes(
+        ShortHistoryExchange(now=NOW), 'BTC/USD', ['2h'], since, CandleStore(str(tmp_path)),
+        supported=KRAKEN_TIMEFRAMES
+    )
+    assert series['2h'].index[0].value // 1_000_000 > since
+    assert 'Warning: BTC/USD 2h history starts at' in capsys.readouterr().out
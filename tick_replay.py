@@ -0,0 +1,218 @@
+import bz2
+import gzip
+import lzma
+import time
+import numpy as np
+import pandas as pd
+from candle_store import ROW_WIDTH
+from incremental import CrossoverState
+from ohlcv_fetcher import timeframe_ms
+from telemetry import peak_rss_mb
+from timeframes import bar_start
+from utils import SECONDS_PER_YEAR, MetricsAccumulator
+
+# Binary recordings are packed little-endian records of these fields
+TICK_DTYPE = np.dtype([('timestamp', '<i8'), ('price', '<f8'), ('size', '<f8')])
+# Ticks decoded at a time; 1M ticks are 24 MB, which bounds the memory of a replay
+CHUNK_TICKS = 1_000_000
+BAR_TYPES = ('time', 'volume', 'dollar')
+TIME_UNITS = {'ms': 1, 's': 1000, 'us': 0.001, 'ns': 0.000001}
+
+def open_recording(path, mode='rb'):
+    """File object for a plain, .gz, .bz2, .xz or .zst recording"""
+    if path.endswith('.gz'):
+        # The default level 9 makes recording several times slower for little gain
+        return gzip.open(path, mode, compresslevel=6) if 'w' in mode else gzip.open(path, mode)
+    if path.endswith('.bz2'):
+        return bz2.open(path, mode)
+    if path.endswith('.xz'):
+        return lzma.open(path, mode)
+    if path.endswith('.zst'):
+        # Optional dependency, only needed for zstd recordings
+        import zstandard
+        return zstandard.open(path, mode)
+    return open(path, mode)
+
+def read_binary_ticks(path, chunk_ticks=CHUNK_TICKS):
+    """Yield (timestamps, prices, sizes) arrays of up to `chunk_ticks` ticks from a binary recording"""
+    record = TICK_DTYPE.itemsize
+    with open_recording(path) as f:
+        while True:
+            data = f.read(chunk_ticks * record)
+            if not data:
+                break
+            # Streaming decompressors may return a short read that ends inside a record
+            while len(data) % record:
+                more = f.read(record - len(data) % record)
+                if not more:
+                    raise ValueError(f"{path} ends inside a tick record")
+                data += more
+            ticks = np.frombuffer(data, dtype=TICK_DTYPE)
+            yield ticks['timestamp'], ticks['price'], ticks['size']
+
+def read_csv_ticks(path, chunk_ticks=CHUNK_TICKS, columns=('timestamp', 'price', 'size'), time_unit='ms', header=True):
+    """Yield (timestamps, prices, sizes) arrays from a CSV recording; compression follows the file suffix"""
+    options = {'usecols': list(columns)} if header else {'header': None, 'usecols': [0, 1, 2], 'names': list(columns)}
+    scale = TIME_UNITS[time_unit]
+    with pd.read_csv(path, chunksize=chunk_ticks, compression='infer', dtype=float, **options) as reader:
+        for chunk in reader:
+            timestamps = chunk[columns[0]].to_numpy()
+            if scale != 1:
+                timestamps = timestamps * scale
+            yield (
+                timestamps.astype(np.int64),
+                chunk[columns[1]].to_numpy(),
+                chunk[columns[2]].to_numpy()
+            )
+
+def read_ticks(path, chunk_ticks=CHUNK_TICKS, **csv_options):
+    """read_csv_ticks() for .csv recordings (optionally compressed), read_binary_ticks() for everything else"""
+    if '.csv' in path.lower():
+        return read_csv_ticks(path, chunk_ticks, **csv_options)
+    return read_binary_ticks(path, chunk_ticks)
+
+def write_ticks(path, chunks):
+    """Record (timestamps, prices, sizes) chunks as a binary recording; returns the number of ticks"""
+    written = 0
+    with open_recording(path, 'wb') as f:
+        for timestamps, prices, sizes in chunks:
+            ticks = np.empty(len(timestamps), dtype=TICK_DTYPE)
+            ticks['timestamp'], ticks['price'], ticks['size'] = timestamps, prices, sizes
+            f.write(ticks.tobytes())
+            written += len(ticks)
+    return written
+
+class BarAggregator:
+    """Time, volume or dollar bars built chunk by chunk from a stream of time-ordered ticks"""
+
+    def __init__(self, bar_type, size):
+        if bar_type not in BAR_TYPES:
+            raise ValueError(f"Unknown bar type: {bar_type}")
+        # A timeframe such as '1h' for time bars, a volume or dollar threshold otherwise
+        self.bar_type = bar_type
+        self.size = size if bar_type == 'time' else float(size)
+        if bar_type == 'time':
+            timeframe_ms(size)
+        elif self.size <= 0:
+            raise ValueError('The bar threshold must be positive')
+        self.pending = None
+        self.pending_key = None
+        # Volume or dollar amount already in the open bar
+        self.filled = 0.0
+
+    def bar_keys(self, timestamps, prices, sizes):
+        """Non-decreasing key per tick; ticks with the same key form one bar"""
+        if self.bar_type == 'time':
+            return bar_start(timestamps, self.size)
+        amount = sizes if self.bar_type == 'volume' else prices * sizes
+        filled = self.filled + np.cumsum(amount)
+        # Bars are cut on a fixed grid of the running amount: a bar closes with the tick that
+        # crosses the next multiple of the threshold, and its overshoot counts towards the next bar.
+        # Numbering restarts at the open bar, so the carried amount stays small.
+        keys = ((filled - amount) // self.size).astype(np.int64)
+        self.filled = float(filled[-1] - keys[-1] * self.size)
+        return keys
+
+    def push(self, timestamps, prices, sizes):
+        """Add a chunk of ticks; returns the bars it closed as (n, 6) OHLCV rows"""
+        if len(timestamps) == 0:
+            return np.empty((0, ROW_WIDTH))
+        prices = np.asarray(prices, dtype=float)
+        sizes = np.asarray(sizes, dtype=float)
+        keys = self.bar_keys(timestamps, prices, sizes)
+
+        first = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        last = np.append(first[1:], len(keys)) - 1
+        bars = np.empty((len(first), ROW_WIDTH))
+        # Time bars open at their boundary, volume and dollar bars at their first tick
+        bars[:, 0] = keys[first] if self.bar_type == 'time' else timestamps[first]
+        bars[:, 1] = prices[first]
+        bars[:, 2] = np.maximum.reduceat(prices, first)
+        bars[:, 3] = np.minimum.reduceat(prices, first)
+        bars[:, 4] = prices[last]
+        bars[:, 5] = np.add.reduceat(sizes, first)
+
+        if self.pending is not None:
+            if keys[0] == self.pending_key:
+                # The chunk continues the bar left open by the previous one
+                bars[0, 0:2] = self.pending[0:2]
+                bars[0, 2] = max(bars[0, 2], self.pending[2])
+                bars[0, 3] = min(bars[0, 3], self.pending[3])
+                bars[0, 5] += self.pending[5]
+            else:
+                bars = np.vstack((self.pending, bars))
+
+        # The last bar stays open until a tick of a later bar arrives
+        self.pending = bars[-1].copy()
+        self.pending_key = keys[-1] if self.bar_type == 'time' else 0
+        return bars[:-1]
+
+    def flush(self):
+        """The open bar as a final (possibly partial) row"""
+        if self.pending is None:
+            return np.empty((0, ROW_WIDTH))
+        bars = self.pending[None, :]
+        self.pending = self.pending_key = None
+        self.filled = 0.0
+        return bars
+
+def stream_bars(chunks, aggregator, flush=True):
+    """Yield (ticks in the chunk, closed bars) for every chunk of ticks"""
+    for timestamps, prices, sizes in chunks:
+        yield len(timestamps), aggregator.push(timestamps, prices, sizes)
+    if flush:
+        yield 0, aggregator.flush()
+
+def bars_per_year(bar_type, size, first_timestamp, last_timestamp, bars):
+    """Annualization for the replayed bars; volume and dollar bars use their average spacing"""
+    if bar_type == 'time':
+        return SECONDS_PER_YEAR / (timeframe_ms(size) / 1000)
+    seconds = (last_timestamp - first_timestamp) / 1000
+    if bars < 2 or seconds <= 0:
+        return 252
+    return SECONDS_PER_YEAR * (bars - 1) / seconds
+
+def replay(chunks, bar_type, size, short_window, long_window, initial_balance, flush=True, keep_bars=False):
+    """Drive the crossover strategy from a stream of ticks, one bar at a time as bars close"""
+    aggregator = BarAggregator(bar_type, size)
+    # CrossoverState is MovingAverageCrossover advanced one closed candle at a time
+    state = CrossoverState(short_window, long_window, initial_balance)
+    # Volume and dollar bars are annualized by their spacing once the replay ends; until then only
+    # the per-bar risk-free threshold of the Sortino downside uses the fallback of bars_per_year
+    accumulator = MetricsAccumulator(bars_per_year(bar_type, size, 0, 0, 0))
+    trades, kept = [], []
+    ticks = bars = 0
+
+    started = time.perf_counter()
+    for count, closed in stream_bars(chunks, aggregator, flush):
+        ticks += count
+        bars += len(closed)
+        for timestamp, close in zip(closed[:, 0].astype(np.int64).tolist(), closed[:, 4].tolist()):
+            trade = state.update(timestamp, close)
+            if trade is not None:
+                trades.append(trade)
+            accumulator.update(state.last_value, state.holdings > 0, timestamp)
+        if keep_bars:
+            kept.append(closed)
+    elapsed = time.perf_counter() - started
+
+    trades = pd.DataFrame(trades)
+    if not trades.empty:
+        trades.set_index('timestamp', inplace=True)
+    accumulator.periods_per_year = bars_per_year(bar_type, size, state.first_timestamp or 0, state.last_timestamp or 0, bars)
+    metrics = dict(accumulator.metrics(), portfolio_value=state.last_value)
+    result = {
+        'ticks': ticks,
+        'bars': bars,
+        'seconds': elapsed,
+        'ticks_per_sec': ticks / elapsed if elapsed else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'metrics': metrics,
+        'trades': trades,
+        'state': state
+    }
+    if keep_bars:
+        rows = np.concatenate(kept) if kept else np.empty((0, ROW_WIDTH))
+        index = pd.DatetimeIndex(rows[:, 0].astype(np.int64).astype('datetime64[ms]'), name='timestamp')
+        result['bars_frame'] = pd.DataFrame(rows[:, 1:], index=index, columns=['open', 'high', 'low', 'close', 'volume'])
+    return result
@@ -0,0 +1,182 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from candle_store import CandleStore, OHLCV_COLUMNS, async_load_ohlcv, load_ohlcv
+from ohlcv_fetcher import timeframe_ms
+
+# Resolutions fetched from the exchange; coarser ones are derived from them
+BASE_TIMEFRAMES = ('1m', '5m', '15m', '30m', '1h', '4h', '1d')
+MAX_DERIVED_SERIES = 32
+
+DAY_MS = 24 * 60 * 60 * 1000
+# The epoch was a Thursday; exchanges start weeks on Monday
+WEEK_ORIGIN_MS = 4 * DAY_MS
+
+_derived = OrderedDict()
+_derived_lock = threading.Lock()
+
+def bar_start(timestamps, timeframe):
+    """Open time of the `timeframe` bar containing each timestamp (ms, UTC aligned)"""
+    if timeframe[-1] == 'M':
+        raise ValueError('Monthly bars have no fixed length and cannot be derived')
+    step = timeframe_ms(timeframe)
+    origin = WEEK_ORIGIN_MS if timeframe[-1] == 'w' else 0
+    return (np.asarray(timestamps, dtype=np.int64) - origin) // step * step + origin
+
+def base_timeframe(timeframes, supported=BASE_TIMEFRAMES):
+    """Coarsest supported timeframe every requested one is a whole multiple of"""
+    steps = [timeframe_ms(timeframe) for timeframe in timeframes]
+    candidates = [
+        timeframe for timeframe in supported
+        if all(step % timeframe_ms(timeframe) == 0 for step in steps)
+    ]
+    if not candidates:
+        raise ValueError(f"No base timeframe divides {', '.join(timeframes)}")
+    return max(candidates, key=timeframe_ms)
+
+def resample_rows(rows, timeframe):
+    """Aggregate sorted (n, 6) OHLCV rows into `timeframe` bars; gaps stay gaps"""
+    rows = np.asarray(rows, dtype=float).reshape(-1, 6)
+    if len(rows) == 0:
+        return rows
+    starts = bar_start(rows[:, 0], timeframe)
+    first = np.flatnonzero(np.concatenate(([True], starts[1:] != starts[:-1])))
+    last = np.append(first[1:], len(rows)) - 1
+
+    bars = np.empty((len(first), 6))
+    bars[:, 0] = starts[first]
+    bars[:, 1] = rows[first, 1]
+    bars[:, 2] = np.maximum.reduceat(rows[:, 2], first)
+    bars[:, 3] = np.minimum.reduceat(rows[:, 3], first)
+    bars[:, 4] = rows[last, 4]
+    bars[:, 5] = np.add.reduceat(rows[:, 5], first)
+
+    # A leading bar without its first base candle has the wrong open; the last bar
+    # may be partial, like the open candle of an exchange
+    if rows[0, 0] > starts[0]:
+        bars = bars[1:]
+    return bars
+
+def resample(data, timeframe):
+    """resample_rows for a candle DataFrame indexed by timestamp"""
+    rows = np.column_stack([data.index.as_unit('ms').asi8, data[OHLCV_COLUMNS[1:]].to_numpy(dtype=float)])
+    bars = resample_rows(rows, timeframe)
+    index = pd.DatetimeIndex(pd.to_datetime(bars[:, 0].astype(np.int64), unit='ms'), name='timestamp')
+    return pd.DataFrame(bars[:, 1:], index=index, columns=OHLCV_COLUMNS[1:])
+
+def derive(exchange_id, symbol, base, timeframe):
+    """Cached resample of a base series; a changed base (new or updated candle) recomputes"""
+    if len(base) == 0:
+        return base
+    last = base.iloc[-1]
+    key = (
+        exchange_id, symbol, timeframe, len(base),
+        int(base.index[0].value), int(base.index[-1].value), float(last['close']), float(last['volume'])
+    )
+    with _derived_lock:
+        if key in _derived:
+            _derived.move_to_end(key)
+            return _derived[key]
+
+    bars = resample(base, timeframe)
+    with _derived_lock:
+        _derived[key] = bars
+        while len(_derived) > MAX_DERIVED_SERIES:
+            _derived.popitem(last=False)
+    return bars
+
+def covers(data, timeframe, since):
+    """True if the series starts within one bar of `since`"""
+    return len(data) > 0 and data.index[0].value // 1_000_000 < since + timeframe_ms(timeframe)
+
+def fallback_timeframes(timeframe, base, supported=BASE_TIMEFRAMES):
+    """Native timeframes coarser than `base` that `timeframe` can be derived from, finest first"""
+    step = timeframe_ms(timeframe)
+    return sorted((
+        native for native in supported
+        if native[-1] != 'M' and timeframe_ms(base) < timeframe_ms(native) <= step and step % timeframe_ms(native) == 0
+    ), key=timeframe_ms)
+
+def warn_short(data, symbol, timeframe, since):
+    """Report a derived series that still starts after `since`, instead of returning it silently"""
+    if not covers(data, timeframe, since):
+        first = int(data.index[0].value // 1_000_000) if len(data) else None
+        print(f"Warning: {symbol} {timeframe} history starts at {first}, requested {since}; no native timeframe reaches further")
+
+def stored_window(exchange_id, symbol, timeframe, since, until=None, store=None):
+    """CandleStore.window() for any timeframe, resampled from the stored series that reaches furthest"""
+    store = store or CandleStore()
+    if timeframe[-1] == 'M':
+        return store.window(exchange_id, symbol, timeframe, since, until)
+    # Only base series are stored; which one a job used depends on the other timeframes of its market
+    step = timeframe_ms(timeframe)
+    bases = [
+        base for base in store.timeframes(exchange_id, symbol)
+        if base[-1] != 'M' and step % timeframe_ms(base) == 0
+    ]
+    base_since = None if since is None else int(bar_start([since], timeframe)[0])
+    best = None
+    # Coarsest first: of two equally recent series the coarser one needs fewer candles
+    for base in sorted(bases, key=timeframe_ms, reverse=True):
+        data = store.window(exchange_id, symbol, base, base_since)
+        if base != timeframe:
+            data = derive(exchange_id, symbol, data, timeframe)
+        if len(data) and (best is None or data.index[-1] > best.index[-1]):
+            best = data
+    if best is None:
+        return store.window(exchange_id, symbol, timeframe, since, until)
+    if since is not None:
+        best = best[best.index >= pd.Timestamp(since, unit='ms')]
+    if until is not None:
+        best = best[best.index < pd.Timestamp(until, unit='ms')]
+    return best
+
+def load_timeframes(exchange, symbol, timeframes, since, store=None, base=None, supported=BASE_TIMEFRAMES):
+    """Candles for several timeframes from one base-resolution feed, as {timeframe: DataFrame}"""
+    store = store or CandleStore()
+    exchange_id = exchange if isinstance(exchange, str) else exchange.id
+    # Pass `base` to share one feed with timeframes requested by other calls
+    base = base or base_timeframe(timeframes, supported)
+    base_since = int(min(bar_start([since], timeframe)[0] for timeframe in timeframes))
+    base_data = load_ohlcv(exchange, symbol, base, base_since, store)
+
+    series = {}
+    for timeframe in timeframes:
+        data = base_data if timeframe == base else derive(exchange_id, symbol, base_data, timeframe)
+        # The exchange may not serve enough base history (Kraken: last 720 candles); a coarser
+        # native series reaches further back
+        for native in fallback_timeframes(timeframe, base, supported):
+            if covers(data, timeframe, since):
+                break
+            print(f"Base {base} history does not reach {since} for {symbol} {timeframe}, fetching {native} directly")
+            native_data = load_ohlcv(exchange, symbol, native, int(bar_start([since], timeframe)[0]), store)
+            data = native_data if native == timeframe else derive(exchange_id, symbol, native_data, timeframe)
+        if timeframe != base:
+            warn_short(data, symbol, timeframe, since)
+        series[timeframe] = data[data.index >= pd.Timestamp(since, unit='ms')]
+    return series
+
+async def async_load_timeframes(exchange, symbol, timeframes, since, store=None, base=None,
+                                supported=BASE_TIMEFRAMES, **options):
+    """load_timeframes() for an async client"""
+    store = store or CandleStore()
+    base = base or base_timeframe(timeframes, supported)
+    base_since = int(min(bar_start([since], timeframe)[0] for timeframe in timeframes))
+    base_data = await async_load_ohlcv(exchange, symbol, base, base_since, store, **options)
+
+    series = {}
+    for timeframe in timeframes:
+        data = base_data if timeframe == base else derive(exchange.id, symbol, base_data, timeframe)
+        for native in fallback_timeframes(timeframe, base, supported):
+            if covers(data, timeframe, since):
+                break
+            print(f"Base {base} history does not reach {since} for {symbol} {timeframe}, fetching {native} directly")
+            native_data = await async_load_ohlcv(
+                exchange, symbol, native, int(bar_start([since], timeframe)[0]), store, **options
+            )
+            data = native_data if native == timeframe else derive(exchange.id, symbol, native_data, timeframe)
+        if timeframe != base:
+            warn_short(data, symbol, timeframe, since)
+        series[timeframe] = data[data.index >= pd.Timestamp(since, unit='ms')]
+    return series
@@ -1,14 +1,28 @@
+import time
+import threading
+from collections import OrderedDict
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import ccxt
-from strategy import MovingAverageCrossover
-from utils import calculate_metrics, format_number
-from database import get_db, save_trade, save_performance, save_settings
+from strategy import MovingAverageCrossover, run_key
+from timeframes import base_timeframe, load_timeframes
+from response_cache import shared_cache
+from utils import calculate_metrics, data_fingerprint, format_number
+from telemetry import Telemetry
+from history import equity_history, latest_curve_id
+from database import get_db, save_trades, save_performance, save_settings
 from config import APP_CONFIG, TRADING_CONFIG
 
+# Bounds for per-process caches of computed and persisted results
+MAX_CACHED_BACKTESTS = 64
+MAX_PERSISTED_RUNS = 256
+
+# All options are derived from one base feed, so switching costs no download
+TIMEFRAME_OPTIONS = ["1h", "2h", "4h", "12h", "1d"]
+BASE_TIMEFRAME = base_timeframe(TIMEFRAME_OPTIONS)
+
 # Page config
 st.set_page_config(page_title="Bitcoin Trading Bot", layout="wide")
 st.title("Bitcoin Trading Bot")
@@ -20,8 +34,8 @@ db = next(get_db())
 st.sidebar.header("Trading Parameters")
 timeframe = st.sidebar.selectbox(
     "Timeframe",
-    options=["1h", "4h", "1d"],
-    index=2
+    options=TIMEFRAME_OPTIONS,
+    index=TIMEFRAME_OPTIONS.index("1d")
 )
 
 lookback_period = st.sidebar.slider(
@@ -42,7 +56,7 @@ initial_balance = st.sidebar.number_input(
 short_window = st.sidebar.slider("Short MA Window", 5, 50, 20)
 long_window = st.sidebar.slider("Long MA Window", 20, 200, 50)
 
-# Save settings to database
+# Save settings to database, only when they changed since this session last saved them
 settings = {
     'short_window': short_window,
     'long_window': long_window,
@@ -50,65 +64,96 @@ settings = {
     'timeframe': timeframe,
     'lookback_period': lookback_period
 }
-save_settings(db, settings)
+if st.session_state.get('saved_settings') != settings:
+    save_settings(db, settings)
+    st.session_state['saved_settings'] = settings
 
 # Fetch data
 @st.cache_data(ttl=3600)
 def fetch_bitcoin_data(timeframe, lookback_days):
     try:
-        # Initialize Kraken exchange
-        exchange = ccxt.kraken({
-            'enableRateLimit': True,
-        })
-
         # Calculate time parameters
-        end_time = exchange.milliseconds()
+        end_time = int(time.time() * 1000)
         start_time = end_time - (lookback_days * 24 * 60 * 60 * 1000)
 
-        # Fetch OHLCV data
-        ohlcv = exchange.fetch_ohlcv(
-            symbol='BTC/USD',  # Kraken uses USD instead of USDT
-            timeframe=timeframe,
-            since=start_time,
-            limit=1000
-        )
-
-        # Convert to DataFrame
-        df = pd.DataFrame(
-            ohlcv,
-            columns=['timestamp', 'open', 'high', 'low', 'close', 'volume']
-        )
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('timestamp', inplace=True)
-
-        return df
+        # Fetch OHLCV data from Kraken; only base candles newer than the local
+        # store are downloaded and the chosen timeframe is resampled from them
+        return load_timeframes(
+            'kraken',
+            'BTC/USD',  # Kraken uses USD instead of USDT
+            [timeframe],
+            start_time,
+            base=BASE_TIMEFRAME
+        )[timeframe]
     except Exception as e:
         st.error(f"Error fetching data: {str(e)}")
         return None
 
+# Backtest and metrics; `_data` is identified by its fingerprint instead of being hashed
+@st.cache_data(max_entries=MAX_CACHED_BACKTESTS, show_spinner=False)
+def run_backtest(_data, fingerprint, short_window, long_window, initial_balance, timeframe):
+    strategy = MovingAverageCrossover(
+        short_window=short_window,
+        long_window=long_window,
+        initial_balance=initial_balance
+    )
+    signals, portfolio_value, trades = strategy.backtest(_data)
+    metrics = calculate_metrics(portfolio_value, trades, timeframe)
+    metrics['portfolio_value'] = portfolio_value['portfolio_value'].iloc[-1]
+    return signals, portfolio_value, trades, metrics
+
+# Stitched equity of a run; storing a new curve changes `latest_id` and so the entry
+@st.cache_data(max_entries=MAX_CACHED_BACKTESTS, show_spinner=False)
+def stored_history(run, latest_id):
+    return equity_history(db, run)
+
+@st.cache_resource
+def persisted_runs():
+    """Results already written to the database by this server process, shared by all sessions"""
+    return {'lock': threading.Lock(), 'keys': OrderedDict()}
+
+def claim_persist(result_key):
+    """True the first time a result is seen, so it is written to the database once"""
+    runs = persisted_runs()
+    with runs['lock']:
+        if result_key in runs['keys']:
+            runs['keys'].move_to_end(result_key)
+            return False
+        runs['keys'][result_key] = True
+        while len(runs['keys']) > MAX_PERSISTED_RUNS:
+            runs['keys'].popitem(last=False)
+        return True
+
+# One telemetry line per script run; results served from st.cache_data take no time
+telemetry = Telemetry('trading_bot', timeframe=timeframe, lookback_period=lookback_period).start()
 try:
-    with st.spinner('Fetching Bitcoin data...'):
+    cache = shared_cache()
+    cache_before = cache.stats() if cache else None
+    with st.spinner('Fetching Bitcoin data...'), telemetry.span('fetch'):
         data = fetch_bitcoin_data(timeframe, lookback_period)
+    if cache:
+        # Counters are shared by all sessions of this server process
+        telemetry.set(response_cache=cache.stats(cache_before))
+        stats = cache.stats()
+        st.sidebar.caption(f"Exchange cache: {stats['hits']} hits, {stats['misses']} misses, {stats['coalesced']} coalesced")
 
     if data is not None:
-        # Initialize strategy
-        strategy = MovingAverageCrossover(
-            short_window=short_window,
-            long_window=long_window,
-            initial_balance=initial_balance
-        )
-
-        # Run backtest
-        signals, portfolio_value, trades = strategy.backtest(data)
-
-        # Save trades to database
-        for _, trade in trades.iterrows():
-            save_trade(db, trade.to_dict())
+        # Run backtest; parameter sets computed before are served from the cache
+        telemetry.count('rows_fetched', len(data))
+        with telemetry.span('backtest'):
+            fingerprint = data_fingerprint(data)
+            signals, portfolio_value, trades, metrics = run_backtest(
+                data, fingerprint, short_window, long_window, initial_balance, timeframe
+            )
 
-        # Calculate and save performance metrics
-        metrics = calculate_metrics(portfolio_value, trades)
-        metrics['portfolio_value'] = portfolio_value['portfolio_value'].iloc[-1]
-        save_performance(db, metrics, datetime.now())
+        # Save trades and performance only for results not stored yet
+        run = run_key('kraken', 'BTC/USD', timeframe, short_window, long_window, initial_balance)
+        if claim_persist((fingerprint, run)):
+            with telemetry.span('save_trades'):
+                telemetry.count('trades_written', save_trades(db, trades, run, commit=False))
+            with telemetry.span('save_performance'):
+                save_performance(db, metrics, datetime.now(), strategy=run, equity=portfolio_value['portfolio_value'], commit=False)
+            db.commit()
 
         # Display charts
         col1, col2 = st.columns(2)
@@ -219,5 +264,14 @@ try:
         st.subheader("Trade History")
         st.dataframe(trades)
 
+        # Equity of all stored runs with these parameters, decoded again only after a new run was stored
+        history = stored_history(run, latest_curve_id(db, run))
+        if len(history) and history.index[0] < portfolio_value.index[0]:
+            st.subheader("Stored Portfolio History")
+            st.line_chart(history)
+
 except Exception as e:
-    st.error(f"An error occurred: {str(e)}")
\ No newline at end of file
+    telemetry.set(error=str(e))
+    st.error(f"An error occurred: {str(e)}")
+finally:
+    telemetry.finish()
\ No newline at end of file
@@ -1,46 +1,250 @@
+import hashlib
+import math
 import numpy as np
 import pandas as pd
+from ohlcv_fetcher import timeframe_ms
 
-def calculate_metrics(portfolio, trades):
-    """Calculate trading performance metrics"""
-    metrics = {}
-    
-    # Total Return
-    initial_value = portfolio['portfolio_value'].iloc[0]
-    final_value = portfolio['portfolio_value'].iloc[-1]
-    metrics['total_return'] = ((final_value - initial_value) / initial_value) * 100
-    
-    # Daily returns
-    portfolio['daily_returns'] = portfolio['portfolio_value'].pct_change()
-    
-    # Sharpe Ratio (assuming risk-free rate of 0.01)
-    risk_free_rate = 0.01
-    excess_returns = portfolio['daily_returns'] - risk_free_rate/252
-    metrics['sharpe_ratio'] = np.sqrt(252) * excess_returns.mean() / excess_returns.std()
-    
-    # Maximum Drawdown
-    portfolio['cummax'] = portfolio['portfolio_value'].cummax()
-    portfolio['drawdown'] = (portfolio['portfolio_value'] - portfolio['cummax']) / portfolio['cummax']
-    metrics['max_drawdown'] = portfolio['drawdown'].min() * 100
-    
-    # Win Rate
-    if not trades.empty:
-        trades['return'] = 0.0
-        for i in range(0, len(trades), 2):
-            if i + 1 < len(trades):
-                entry = trades.iloc[i]
-                exit = trades.iloc[i + 1]
-                trade_return = (exit['price'] - entry['price']) / entry['price']
-                trades.iloc[i:i+2, trades.columns.get_loc('return')] = trade_return
-        
-        winning_trades = len(trades[trades['return'] > 0]) / 2
-        total_trades = len(trades) / 2
-        metrics['win_rate'] = (winning_trades / total_trades) * 100 if total_trades > 0 else 0
-    else:
+# Crypto markets trade around the clock, so a year is 365 full days of bars
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+RISK_FREE_RATE = 0.01
+
+def periods_per_year(timeframe=None, index=None):
+    """Bars per year for a ccxt timeframe, or inferred from the spacing of a DatetimeIndex"""
+    if timeframe:
+        return SECONDS_PER_YEAR / (timeframe_ms(timeframe) / 1000)
+    if isinstance(index, pd.DatetimeIndex) and len(index) > 1:
+        seconds = np.median(np.diff(index.as_unit('ms').asi8)) / 1e3
+        if seconds > 0:
+            return SECONDS_PER_YEAR / seconds
+    # Unknown spacing: fall back to daily trading-day annualization
+    return 252
+
+def equity_metrics(equity, periods_per_year, held=None, risk_free_rate=RISK_FREE_RATE):
+    """Metrics for one equity curve (1-D) or a batch of curves (2-D, one per row).
+
+    `held` marks the bars that end with an open position; it enables exposure,
+    profit factor and round-trip win rate. Inputs are never modified.
+    """
+    equity = np.asarray(equity, dtype=float)
+    single = equity.ndim == 1
+    equity = np.atleast_2d(equity)
+    bars = equity.shape[1]
+
+    returns = equity[:, 1:] / equity[:, :-1] - 1
+    excess = returns - risk_free_rate / periods_per_year
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = excess.mean(axis=1) if bars > 1 else np.full(len(equity), np.nan)
+        std = excess.std(axis=1, ddof=1) if bars > 2 else np.full(len(equity), np.nan)
+        downside = np.sqrt((np.minimum(excess, 0) ** 2).mean(axis=1)) if bars > 1 else std
+        sharpe = np.sqrt(periods_per_year) * mean / std
+        sortino = np.sqrt(periods_per_year) * mean / downside
+
+    growth = equity[:, -1] / equity[:, 0]
+    total_return = (growth - 1) * 100
+
+    # Drawdowns and the longest stretch spent below a previous peak
+    peak = np.maximum.accumulate(equity, axis=1)
+    drawdown = equity / peak - 1
+    max_drawdown = drawdown.min(axis=1) * 100
+    columns = np.arange(bars)
+    last_peak = np.maximum.accumulate(np.where(drawdown < 0, 0, columns), axis=1)
+    max_drawdown_duration = (columns - last_peak).max(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        years = (bars - 1) / periods_per_year
+        annual_return = growth ** (1 / years) - 1 if years > 0 else np.full(len(equity), np.nan)
+        calmar = np.where(max_drawdown < 0, annual_return / np.abs(max_drawdown / 100), np.nan)
+
+    metrics = {
+        'total_return': total_return,
+        'annual_return': annual_return * 100,
+        'sharpe_ratio': sharpe,
+        'sortino_ratio': sortino,
+        'calmar_ratio': calmar,
+        'max_drawdown': max_drawdown,
+        'max_drawdown_duration': max_drawdown_duration
+    }
+
+    if held is not None:
+        held = np.atleast_2d(np.asarray(held, dtype=bool))
+        metrics['exposure'] = held.mean(axis=1) * 100
+
+        # Round trips: every exit is paired with the entry before it
+        orders = np.diff(held.astype(np.int8), axis=1)
+        order_count = np.count_nonzero(orders, axis=1)
+        last_entry = np.maximum.accumulate(np.where(orders == 1, columns[1:], 0), axis=1)
+        exits = orders == -1
+        pnl = np.where(exits, equity[:, 1:] - np.take_along_axis(equity, last_entry, axis=1), 0.0)
+        gross_profit = np.where(pnl > 0, pnl, 0).sum(axis=1)
+        gross_loss = -np.where(pnl < 0, pnl, 0).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            metrics['profit_factor'] = np.where(gross_loss > 0, gross_profit / gross_loss, np.where(gross_profit > 0, np.inf, np.nan))
+            # Same convention as before: an open trade counts as half a round trip
+            metrics['win_rate'] = np.where(order_count > 0, np.count_nonzero(pnl > 0, axis=1) / (order_count / 2) * 100, 0.0)
+        metrics['trades'] = order_count
+
+    if single:
+        return {key: value[0].item() for key, value in metrics.items()}
+    return metrics
+
+def _ratio(numerator, denominator):
+    """numerator / denominator with NumPy's results for a zero denominator"""
+    if denominator == 0 or math.isnan(denominator):
+        if math.isnan(numerator) or numerator == 0 or math.isnan(denominator):
+            return float('nan')
+        return math.copysign(float('inf'), numerator)
+    return numerator / denominator
+
+class MetricsAccumulator:
+    """equity_metrics() for a growing equity curve, updated in O(1) per point"""
+
+    def __init__(self, periods_per_year, risk_free_rate=RISK_FREE_RATE):
+        self.periods_per_year = periods_per_year
+        self.risk_free_rate = risk_free_rate
+        self.points = 0
+        self.first_value = None
+        self.last_value = None
+        self.last_timestamp = None
+        # Welford mean and sum of squared deviations of the per-point returns
+        self.return_mean = 0.0
+        self.return_m2 = 0.0
+        # Sum of squared returns below the risk-free rate, for the Sortino ratio
+        self.downside_sq = 0.0
+        self.peak = None
+        self.max_drawdown = 0.0
+        self.last_peak_point = 0
+        self.max_drawdown_duration = 0
+        # Position counters; only reported when every point said whether it was held
+        self.tracks_held = True
+        self.held_points = 0
+        self.held = False
+        self.entry_value = None
+        self.orders = 0
+        self.wins = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+
+    @classmethod
+    def from_equity(cls, equity, periods_per_year, held=None, timestamps=None, risk_free_rate=RISK_FREE_RATE):
+        """Accumulator fed with a whole curve, e.g. to seed it from a backtest"""
+        accumulator = cls(periods_per_year, risk_free_rate)
+        for position, value in enumerate(np.asarray(equity, dtype=float).tolist()):
+            accumulator.update(
+                value,
+                None if held is None else bool(held[position]),
+                None if timestamps is None else int(timestamps[position])
+            )
+        return accumulator
+
+    def update(self, value, held=None, timestamp=None):
+        """Add the next equity point; `held` marks a point that ends with an open position"""
+        value = float(value)
+        point = self.points
+        if point == 0:
+            self.first_value = self.peak = self.entry_value = value
+        else:
+            bar_return = value / self.last_value - 1
+            delta = bar_return - self.return_mean
+            self.return_mean += delta / point
+            self.return_m2 += delta * (bar_return - self.return_mean)
+            shortfall = min(bar_return - self.risk_free_rate / self.periods_per_year, 0.0)
+            self.downside_sq += shortfall * shortfall
+
+        self.peak = max(self.peak, value)
+        drawdown = value / self.peak - 1
+        self.max_drawdown = min(self.max_drawdown, drawdown)
+        if drawdown >= 0:
+            self.last_peak_point = point
+        self.max_drawdown_duration = max(self.max_drawdown_duration, point - self.last_peak_point)
+
+        if held is None:
+            self.tracks_held = False
+        elif self.tracks_held:
+            held = bool(held)
+            self.held_points += held
+            if point > 0 and held != self.held:
+                self.orders += 1
+                if held:
+                    self.entry_value = value
+                else:
+                    # Round trip closed: profit against the equity at its entry
+                    pnl = value - self.entry_value
+                    self.wins += pnl > 0
+                    if pnl > 0:
+                        self.gross_profit += pnl
+                    else:
+                        self.gross_loss -= pnl
+            self.held = held
+
+        self.points += 1
+        self.last_value = value
+        if timestamp is not None:
+            self.last_timestamp = timestamp
+
+    def metrics(self):
+        """Same keys and values as equity_metrics() over every point added so far"""
+        periods = self.periods_per_year
+        returns = self.points - 1
+        excess_mean = self.return_mean - self.risk_free_rate / periods if returns > 0 else float('nan')
+        std = math.sqrt(self.return_m2 / (returns - 1)) if returns > 1 else float('nan')
+        downside = math.sqrt(self.downside_sq / returns) if returns > 0 else std
+
+        growth = self.last_value / self.first_value if self.points else float('nan')
+        years = returns / periods
+        try:
+            annual_return = growth ** (1 / years) - 1 if years > 0 else float('nan')
+        except OverflowError:
+            annual_return = float('inf')
+        max_drawdown = self.max_drawdown * 100
+        metrics = {
+            'total_return': (growth - 1) * 100,
+            'annual_return': annual_return * 100,
+            'sharpe_ratio': math.sqrt(periods) * _ratio(excess_mean, std),
+            'sortino_ratio': math.sqrt(periods) * _ratio(excess_mean, downside),
+            'calmar_ratio': _ratio(annual_return, abs(max_drawdown / 100)) if max_drawdown < 0 else float('nan'),
+            'max_drawdown': max_drawdown,
+            'max_drawdown_duration': self.max_drawdown_duration
+        }
+        if self.tracks_held and self.points:
+            metrics['exposure'] = self.held_points / self.points * 100
+            if self.gross_loss > 0:
+                metrics['profit_factor'] = self.gross_profit / self.gross_loss
+            else:
+                metrics['profit_factor'] = float('inf') if self.gross_profit > 0 else float('nan')
+            # Same convention as equity_metrics: an open trade counts as half a round trip
+            metrics['win_rate'] = self.wins / (self.orders / 2) * 100 if self.orders else 0.0
+            metrics['trades'] = self.orders
+        return metrics
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        accumulator = cls(data['periods_per_year'], data['risk_free_rate'])
+        for key, value in data.items():
+            setattr(accumulator, key, value)
+        return accumulator
+
+def calculate_metrics(portfolio, trades, timeframe=None):
+    """Calculate trading performance metrics without modifying the inputs"""
+    held = portfolio['holdings'].to_numpy(dtype=float) > 0 if 'holdings' in portfolio else None
+    metrics = equity_metrics(
+        portfolio['portfolio_value'].to_numpy(dtype=float),
+        periods_per_year(timeframe, portfolio.index),
+        held
+    )
+    if held is None:
         metrics['win_rate'] = 0
-    
     return metrics
 
+def data_fingerprint(data, column='close'):
+    """Content hash of a candle frame's index and one price column"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(data.index.asi8).tobytes())
+    digest.update(np.ascontiguousarray(data[column].to_numpy(dtype=float)).tobytes())
+    return digest.hexdigest()
+
 def format_number(num):
     """Format numbers for display"""
     if abs(num) >= 1e6:
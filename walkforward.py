@@ -0,0 +1,118 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from strategy import MovingAverageCrossover
+from sweep import METRIC_COLUMNS, PAIR_CHUNK, attach_shared, rolling_means, score_pairs, to_shared
+from utils import calculate_metrics, periods_per_year
+
+_shared = {}
+
+def plan_folds(bars, train_bars, test_bars, step_bars=None):
+    """(train_start, test_start, test_end) bar offsets of every rolling fold"""
+    step_bars = step_bars or test_bars
+    folds = []
+    start = 0
+    while start + train_bars < bars:
+        test_start = start + train_bars
+        folds.append((start, test_start, min(test_start + test_bars, bars)))
+        start += step_bars
+    return folds
+
+def optimize_window(close, pairs, initial_balance, bars_per_year, sort_by):
+    """Best (short_window, long_window) on one training window and its score"""
+    windows = sorted({w for pair in pairs for w in pair})
+    row_of = {w: row for row, w in enumerate(windows)}
+    means = rolling_means(close, windows)
+    short_rows = np.array([row_of[s] for s, _ in pairs])
+    long_rows = np.array([row_of[l] for _, l in pairs])
+
+    column = METRIC_COLUMNS.index(sort_by)
+    scores = np.concatenate([
+        score_pairs(close, means, short_rows[i:i + PAIR_CHUNK], long_rows[i:i + PAIR_CHUNK], initial_balance, bars_per_year)[:, column]
+        for i in range(0, len(pairs), PAIR_CHUNK)
+    ])
+    # First best pair, as with the stable ranking of sweep_parameters; NaN never wins
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    best = int(np.argmax(scores))
+    return pairs[best], float(scores[best])
+
+def _init_worker(close_spec):
+    _shared['close'] = attach_shared(*close_spec)
+
+def _optimize_fold(args, close):
+    train_start, test_start, pairs, initial_balance, bars_per_year, sort_by = args
+    return optimize_window(close[train_start:test_start], pairs, initial_balance, bars_per_year, sort_by)
+
+def _optimize_shared(args):
+    return _optimize_fold(args, _shared['close'])
+
+def walk_forward(data, short_windows, long_windows, initial_balance, train_bars, test_bars,
+                 step_bars=None, timeframe=None, processes=None, sort_by='total_return'):
+    """Optimize the crossover windows on each training window and trade them on the following test window"""
+    close = np.ascontiguousarray(data['close'].to_numpy(dtype=float))
+    bars_per_year = periods_per_year(timeframe, data.index)
+    pairs = [(int(s), int(l)) for s in short_windows for l in long_windows if s < l <= train_bars]
+    if not pairs:
+        raise ValueError('No window pair fits into the training window')
+    if sort_by not in METRIC_COLUMNS:
+        raise ValueError(f"Unknown metric: {sort_by}")
+
+    folds = plan_folds(len(close), train_bars, test_bars, step_bars)
+    tasks = [(train_start, test_start, pairs, float(initial_balance), bars_per_year, sort_by)
+             for train_start, test_start, _ in folds]
+
+    # Folds are independent, so the optimizations run in parallel over one shared price array
+    processes = processes or os.cpu_count() or 1
+    if processes <= 1 or len(tasks) <= 1:
+        chosen = [_optimize_fold(task, close) for task in tasks]
+    else:
+        block, spec = to_shared(close)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(processes, len(tasks)),
+                initializer=_init_worker,
+                initargs=(spec,)
+            ) as pool:
+                chosen = list(pool.map(_optimize_shared, tasks))
+        finally:
+            block.close()
+            block.unlink()
+
+    # Out-of-sample trading carries the capital from fold to fold
+    balance = float(initial_balance)
+    portfolios, trades, rows = [], [], []
+    step_bars = step_bars or test_bars
+    for fold, ((train_start, test_start, test_end), ((short_window, long_window), score)) in enumerate(zip(folds, chosen)):
+        # Overlapping test windows are cut where the next fold takes over
+        if fold < len(folds) - 1:
+            test_end = min(test_end, test_start + step_bars)
+        # The SMA warm-up comes from the end of the training window
+        warmup = long_window - 1
+        strategy = MovingAverageCrossover(short_window, long_window, balance)
+        signals, portfolio, fold_trades = strategy.backtest(data.iloc[test_start - warmup:test_end])
+        portfolio = portfolio.iloc[warmup:]
+        metrics = calculate_metrics(portfolio, fold_trades, timeframe)
+
+        balance = float(portfolio['portfolio_value'].iloc[-1])
+        portfolios.append(portfolio)
+        trades.append(fold_trades)
+        rows.append({
+            'fold': fold,
+            'train_start': data.index[train_start],
+            'test_start': data.index[test_start],
+            'test_end': data.index[test_end - 1],
+            'short_window': short_window,
+            'long_window': long_window,
+            f'train_{sort_by}': score,
+            'total_return': metrics['total_return'],
+            'sharpe_ratio': metrics['sharpe_ratio'],
+            'max_drawdown': metrics['max_drawdown'],
+            'trades': len(fold_trades),
+            'final_value': balance
+        })
+
+    # Stitched out-of-sample portfolio and trades as from backtest(), plus one row per fold
+    portfolio = pd.concat(portfolios) if portfolios else pd.DataFrame()
+    trades = [fold_trades for fold_trades in trades if not fold_trades.empty]
+    return portfolio, pd.concat(trades) if trades else pd.DataFrame(), pd.DataFrame(rows)
@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import numpy as np
+from telemetry import count, memory_budget_mb
+
+# Bump when the layout of a cached value changes; older spill files are then ignored
+WARM_STATE_VERSION = 1
+MAX_MEMORY_MB = 128
+MAX_SPILL_MB = 256
+# In Lambda the in-memory part gets an eighth of the function's memory; with the
+# indicator cache's quarter that keeps caches at 192 MB of 512 MB
+MEMORY_SHARE = 0.125
+# Markets metadata (symbols, precision, limits) changes rarely, so it is reloaded once a day
+MARKETS_TTL = 24 * 60 * 60
+CHECKSUM_BYTES = 16
+
+def default_spill_dir():
+    """Spill location; /tmp survives between warm Lambda invocations (and process restarts in them)"""
+    return os.getenv('WARM_STATE_DIR', os.path.join(tempfile.gettempdir(), 'warm_state'))
+
+def frame_fingerprint(frame):
+    """Content hash of a DataFrame's index and values"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(frame.index.asi8 if hasattr(frame.index, 'asi8') else frame.index.to_numpy()))
+    values = np.ascontiguousarray(frame.to_numpy())
+    digest.update(values.dtype.str.encode())
+    digest.update(memoryview(values).cast('B'))
+    digest.update(','.join(map(str, frame.columns)).encode())
+    return digest.hexdigest()
+
+class WarmState:
+    """Objects kept between warm invocations: an LRU in memory, written through to /tmp within a size limit"""
+
+    def __init__(self, max_bytes=MAX_MEMORY_MB * 2 ** 20, spill_dir=None, max_spill_bytes=MAX_SPILL_MB * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir or default_spill_dir()
+        self.max_spill_bytes = max_spill_bytes
+        # (kind, key) -> (fingerprint, stored_at, value, size)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'invalid': 0, 'evictions': 0, 'spilled': 0}
+
+    def stats(self, since=None):
+        """Counters of this state, or their change since an earlier stats() snapshot"""
+        with self.lock:
+            counters = dict(self.counters, entries=len(self.entries), bytes=self.size)
+        if since is not None:
+            counters = {name: value - since.get(name, 0) for name, value in counters.items()}
+        return counters
+
+    def path(self, kind, key):
+        name = hashlib.blake2b(f"{kind}\0{key}".encode(), digest_size=16).hexdigest()
+        return os.path.join(self.spill_dir, kind, f"{name}.pkl")
+
+    def get(self, kind, key, fingerprint=None, max_age=None):
+        """Value stored under (kind, key) for the same fingerprint and at most `max_age` seconds old, else None"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get((kind, key))
+            if entry is not None:
+                if entry[0] == fingerprint and (max_age is None or now - entry[1] <= max_age):
+                    self.entries.move_to_end((kind, key))
+                    self.counters['memory_hits'] += 1
+                    return entry[2]
+                self._drop((kind, key))
+                self.counters['invalid'] += 1
+
+        record = self.read_spill(kind, key)
+        if record is None:
+            with self.lock:
+                self.counters['misses'] += 1
+            return None
+        if record['fingerprint'] != fingerprint or (max_age is not None and now - record['stored_at'] > max_age):
+            self.remove_spill(kind, key)
+            with self.lock:
+                self.counters['invalid'] += 1
+            return None
+        with self.lock:
+            self.counters['disk_hits'] += 1
+            self._insert((kind, key), (fingerprint, record['stored_at'], record['value'], record['size']))
+        return record['value']
+
+    def put(self, kind, key, value, fingerprint=None, spill=True):
+        """Keep `value` in memory and, unless `spill` is False, in /tmp for later processes"""
+        stored_at = time.time()
+        payload = pickle.dumps({
+            'version': WARM_STATE_VERSION, 'kind': kind, 'key': key,
+            'fingerprint': fingerprint, 'stored_at': stored_at, 'value': value
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+        size = len(payload)
+        with self.lock:
+            self._drop((kind, key))
+            if size <= self.max_bytes:
+                self._insert((kind, key), (fingerprint, stored_at, value, size))
+        if spill and size <= self.max_spill_bytes:
+            self.write_spill(kind, key, payload)
+
+    def discard(self, kind, key):
+        """Forget (kind, key), e.g. after the value was modified by a failed job"""
+        with self.lock:
+            self._drop((kind, key))
+        self.remove_spill(kind, key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _insert(self, entry_key, entry):
+        self.entries[entry_key] = entry
+        self.size += entry[3]
+        while self.size > self.max_bytes and self.entries:
+            _, (_, _, _, size) = self.entries.popitem(last=False)
+            self.size -= size
+            self.counters['evictions'] += 1
+
+    def _drop(self, entry_key):
+        entry = self.entries.pop(entry_key, None)
+        if entry is not None:
+            self.size -= entry[3]
+
+    def read_spill(self, kind, key):
+        """Record spilled for (kind, key) if it passes its checksum, version and key checks"""
+        path = self.path(kind, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        checksum, payload = data[:CHECKSUM_BYTES], data[CHECKSUM_BYTES:]
+        try:
+            if hashlib.blake2b(payload, digest_size=CHECKSUM_BYTES).digest() != checksum:
+                raise ValueError('checksum mismatch')
+            record = pickle.loads(payload)
+            if record['version'] != WARM_STATE_VERSION or record['kind'] != kind or record['key'] != key:
+                raise ValueError('written by another version')
+        except Exception as e:
+            print(f"Ignoring unreadable warm state {path}: {str(e)}")
+            self.remove_spill(kind, key)
+            with self.lock:
+                self.counters['invalid'] += 1
+            return None
+        record['size'] = len(payload)
+        return record
+
+    def write_spill(self, kind, key, payload):
+        path = self.path(kind, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(hashlib.blake2b(payload, digest_size=CHECKSUM_BYTES).digest())
+                f.write(payload)
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.counters['spilled'] += 1
+            self.trim_spill()
+        except OSError as e:
+            # A full /tmp only costs the next process its warm start
+            print(f"Could not spill warm state to {path}: {str(e)}")
+
+    def remove_spill(self, kind, key):
+        try:
+            os.remove(self.path(kind, key))
+        except FileNotFoundError:
+            pass
+
+    def trim_spill(self):
+        """Delete the least recently written spill files until the directory fits max_spill_bytes"""
+        files = []
+        for directory, _, names in os.walk(self.spill_dir):
+            for name in names:
+                if name.endswith('.pkl'):
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_spill_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+_states = {}
+_states_lock = threading.Lock()
+
+def shared_state():
+    """Process-wide warm state for the configured directory; None when WARM_STATE_MB=0"""
+    max_mb = float(os.getenv('WARM_STATE_MB') or memory_budget_mb(MEMORY_SHARE, MAX_MEMORY_MB))
+    if max_mb <= 0:
+        return None
+    root = default_spill_dir()
+    with _states_lock:
+        if root not in _states:
+            max_spill_mb = float(os.getenv('WARM_STATE_SPILL_MB', str(MAX_SPILL_MB)))
+            _states[root] = WarmState(int(max_mb * 2 ** 20), root, int(max_spill_mb * 2 ** 20))
+        return _states[root]
+
+# Client -> time its markets were loaded, and the load in progress; clients are dropped with their event loop
+_markets_loaded = weakref.WeakKeyDictionary()
+_markets_loading = weakref.WeakKeyDictionary()
+
+def markets_fingerprint(client):
+    """Markets are only reused by clients of the same exchange class and ccxt version"""
+    ccxt = sys.modules.get('ccxt')
+    return f"{type(client).__name__}:{getattr(ccxt, '__version__', None)}"
+
+async def load_markets(client, state=None, max_age=MARKETS_TTL):
+    """Load a client's markets at most once per `max_age`, from a spilled copy if another process saved one"""
+    loaded_at = _markets_loaded.get(client)
+    if loaded_at is not None and time.time() - loaded_at <= max_age:
+        return getattr(client, 'markets', None)
+    # Markets of one exchange are fetched concurrently by all of its jobs; they share one load
+    task = _markets_loading.get(client)
+    if task is None or task.done():
+        task = asyncio.ensure_future(_load_markets(client, state, max_age, loaded_at is not None))
+        _markets_loading[client] = task
+    return await asyncio.shield(task)
+
+async def _load_markets(client, state, max_age, reload):
+    state = shared_state() if state is None else state or None
+    fingerprint = markets_fingerprint(client)
+    cached = state.get('markets', client.id, fingerprint, max_age) if state is not None else None
+    if cached is not None and hasattr(client, 'set_markets'):
+        client.set_markets(cached['markets'], cached['currencies'])
+        _markets_loaded[client] = cached['loaded_at']
+        return client.markets
+
+    markets = await client.load_markets(reload=reload)
+    loaded_at = time.time()
+    _markets_loaded[client] = loaded_at
+    count('markets_loaded')
+    if state is not None and getattr(client, 'markets', None):
+        state.put('markets', client.id, {
+            'markets': client.markets, 'currencies': client.currencies, 'loaded_at': loaded_at
+        }, fingerprint)
+    return markets